@@ -1,15 +1,22 @@
-import basc_py4chan
-import requests
+import asyncio
 import csv
-import time
+import json
+import os
 import re
-from multiprocessing import Pool, cpu_count
+from DedupFilter import DedupFilter, store_path_for
+from ImageboardFetcher import BoardClient, comment_text
 
 # Settings
 BOARD_NAME = 'g'
 OUTPUT_CSV = "4chan_G_Markov_Data.csv"
 ARCHIVE_LIMIT = 5000  # Set to None to scrape the entire archive
 MIN_POST_LENGTH = 10 # Filters out "lol", "this", or just numbers
+API_URL = 'https://a.4cdn.org' # Point this at a local stand-in board to test without hitting 4chan
+REQUESTS_PER_SECOND = 1 # Per host, 4chan's API rules ask for no more than 1, raise it at your own risk
+MAX_CONNECTIONS = 100 # How many thread requests can be in flight at once
+INCREMENTAL = True # Reruns only fetch threads that changed and append their new posts, False rescrapes everything
+STATE_FILE = '4chan_scrape_state.json' # Where it remembers the last post and Last-Modified of every thread
+DEDUP = True # Don't write posts the CSV already has (copypasta), remembered across runs
 
 def clean_text(text):
     if not text: return ""
@@ -21,75 +28,140 @@ def clean_text(text):
     # Remove excessive newlines
     text = re.sub(r'\n+', ' ', text)
     text = text.replace('>', '')
-    
+
     return text.strip()
 
-def get_manual_archive_ids(board_name):
-    url = f"https://a.4cdn.org/{board_name}/archive.json"
-    try:
-        res = requests.get(url, timeout=10)
-        if res.status_code == 200: return res.json()
-    except: pass
-    return []
+def thread_posts(posts):
+    """Cleaned posts worth keeping from a thread's post list."""
+    kept = []
+    for post in posts:
+        cleaned = clean_text(comment_text(post.get('com')))
+        if cleaned and len(cleaned) > MIN_POST_LENGTH:
+            kept.append(cleaned)
+    return kept
 
-def scrape_thread_worker(t_id):
-    """Worker function: Each CPU core runs this independently."""
-    try:
-        # Each process needs its own Board instance to be thread-safe
-        board = basc_py4chan.Board(BOARD_NAME)
-        thread = board.get_thread(t_id)
-        if not thread: return []
-        
-        posts = []
-        for post in thread.all_posts:
-            cleaned = clean_text(post.text_comment)
-            if cleaned and len(cleaned) > MIN_POST_LENGTH:
-                posts.append(cleaned)
-        return posts
-    except:
-        return []
+def load_state():
+    """
+    What earlier runs already scraped into OUTPUT_CSV:
+    {"csv": OUTPUT_CSV, "boards": {board: {thread id: {"last_post", "last_modified", "bumped", "archived"}}}}
+    Starts over if incremental mode is off or the CSV it was tracking is gone.
+    """
+    if INCREMENTAL and os.path.exists(STATE_FILE) and os.path.exists(OUTPUT_CSV):
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("csv") == OUTPUT_CSV:
+            return state
+    return {"csv": OUTPUT_CSV, "boards": {}}
 
-def run_scrape():
-    # Define process count here to ensure it's in scope
-    n_cores = cpu_count()
-    board = basc_py4chan.Board(BOARD_NAME)
-    
-    print(f"[*] Gathering IDs from /{BOARD_NAME}/...")
-    live_ids = board.get_all_thread_ids()
-    arch_ids = get_manual_archive_ids(BOARD_NAME)
-    
-    if ARCHIVE_LIMIT:
-        arch_ids = arch_ids[:ARCHIVE_LIMIT]
-    
-    all_target_ids = list(set(live_ids + arch_ids))
-    total_threads = len(all_target_ids)
-    
-    print(f"[*] Launching {n_cores} workers for {total_threads} threads...")
-
-    total_saved = 0
-    # Use 'w' to overwrite. Use 'a' if you want to keep appending.
-    with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8', buffering=1) as f:
-        writer = csv.writer(f)
-        writer.writerow(['text'])
-
-        with Pool(processes=n_cores) as pool:
-            # imap_unordered is the most efficient way to stream data back
-            for i, post_list in enumerate(pool.imap_unordered(scrape_thread_worker, all_target_ids)):
-                for p_text in post_list:
-                    writer.writerow([p_text])
-                    total_saved += 1
-                
-                # Update progress every 5 threads
-                if i % 5 == 0:
-                    print(f"    Progress: {i}/{total_threads} threads | Lines: {total_saved}    ", end='\r')
+def save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_FILE)
+
+async def scrape():
+    state = load_state()
+    append = bool(state["boards"])
+    seen = state["boards"].setdefault(BOARD_NAME, {})
+    dedup = DedupFilter(store_path_for(OUTPUT_CSV), fresh=not append, autocommit=None) if DEDUP else None
+
+    async with BoardClient(per_second=REQUESTS_PER_SECOND, concurrency=MAX_CONNECTIONS) as client:
+        print(f"[*] Gathering IDs from /{BOARD_NAME}/...")
+        threads_json = await client.get_json(f"{API_URL}/{BOARD_NAME}/threads.json") or []
+        # When each live thread last changed, straight from the catalog
+        live = {t['no']: t.get('last_modified') for page in threads_json for t in page.get('threads', [])}
+        all_arch_ids = await client.get_json(f"{API_URL}/{BOARD_NAME}/archive.json") or []
+        arch_ids = all_arch_ids[:ARCHIVE_LIMIT] if ARCHIVE_LIMIT else all_arch_ids
+
+        # Threads that fell out of both lists are gone for good, no need to remember them
+        still_around = set(map(str, live)) | set(map(str, all_arch_ids))
+        for t_id in [t_id for t_id in seen if t_id not in still_around]:
+            del seen[t_id]
+
+        jobs = []
+        skipped = 0
+        for t_id in dict.fromkeys(list(live) + arch_ids):
+            thread = seen.get(str(t_id))
+            headers = None
+            if thread:
+                # Archived threads never change, and a live thread with the same bump time has nothing new
+                if thread.get("archived") or (t_id in live and live[t_id] == thread.get("bumped")):
+                    skipped += 1
+                    continue
+                if thread.get("last_modified"):
+                    headers = {'If-Modified-Since': thread["last_modified"]}
+            jobs.append((t_id, f"{API_URL}/{BOARD_NAME}/thread/{t_id}.json", headers))
+        total_threads = len(jobs)
+
+        if append:
+            print(f"[*] {skipped} threads have nothing new since the last run")
+        print(f"[*] Fetching {total_threads} threads, up to {MAX_CONNECTIONS} at once...")
+
+        total_saved = 0
+        unchanged = 0
+        # Reruns append to the CSV, INCREMENTAL = False or deleting it starts over
+        with open(OUTPUT_CSV, 'a' if append else 'w', newline='', encoding='utf-8', buffering=1) as f:
+            writer = csv.writer(f)
+            if not append:
+                writer.writerow(['text'])
+
+            # Threads get written the moment they arrive, so a stopped scrape keeps what it had
+            i = 0
+            try:
+                async for t_id, status, thread_json, headers in client.iter_fetch(jobs):
+                    i += 1
+                    if status == 404:
+                        seen.pop(str(t_id), None)
+                        continue
+                    thread = seen.setdefault(str(t_id), {"last_post": 0})
+                    if status == 304:
+                        unchanged += 1
+                        # Not touched since we last had it, so an archived one is done for good
+                        thread["archived"] = t_id not in live
+                    elif status == 200:
+                        posts = thread_json.get('posts', [])
+                        new_posts = [post for post in posts if post['no'] > thread["last_post"]]
+                        lines = thread_posts(new_posts)
+                        if dedup is not None:
+                            lines = [p_text for p_text in lines if dedup.add(p_text)]
+                        writer.writerows([p_text] for p_text in lines)
+                        total_saved += len(lines)
+                        if new_posts:
+                            thread["last_post"] = new_posts[-1]['no']
+                        thread["last_modified"] = headers.get('Last-Modified')
+                        thread["archived"] = bool(posts and posts[0].get('archived'))
+                    else:
+                        continue
+                    thread["bumped"] = live.get(t_id)
+
+                    # Update progress every 5 threads
+                    if i % 5 == 0:
+                        print(f"    Progress: {i}/{total_threads} threads | Lines: {total_saved}    ", end='\r')
+                    if i % 100 == 0:
+                        f.flush()
+                        save_state(state)
+                        if dedup is not None:
+                            dedup.commit()
+            finally:
+                # Whatever made it into the CSV is marked as done, even on Ctrl+C
+                f.flush()
+                save_state(state)
+                if dedup is not None:
+                    dedup.close()
 
     print(f"\n\n[*] Success! Saved {total_saved} lines to {OUTPUT_CSV}")
+    if dedup is not None:
+        dedup.report()
+    if append:
+        print(f"[*] {unchanged} threads came back unchanged, {client.requests} requests in total")
+
+def run_scrape():
+    asyncio.run(scrape())
 
 if __name__ == "__main__":
-    # This is mandatory for multiprocessing on Windows
     try:
         run_scrape()
     except KeyboardInterrupt:
         print("\n[!] Manual stop. Data saved.")
     except Exception as e:
-        print(f"\n[!] Error: {e}")
\ No newline at end of file
+        print(f"\n[!] Error: {e}")
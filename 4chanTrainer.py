@@ -1,100 +1,34 @@
-import csv
-import markovify
-import re
-import gc
-import sys
-import html
+from TextCleaner import IMAGEBOARD
+from TrainingEngine import text_source, train
 
 # Settings
-INPUT_CSV = '4chanTechBoard.csv' # Matches your uploaded file
+INPUT_CSV = '4chanTechBoard.csv' # Matches your uploaded file, a .corpus from Corpus.py works too
 MODEL_NAME = '4chanGGPT.json'
 BATCH_SIZE = 50000 
-
-def clean_text(text):
-    """Refined cleaner optimized for 4chan /g/ data."""
-    if not text: 
-        return None
-    
-    # 1. Decode HTML entities (converts &gt; to >, &quot; to ", etc.)
-    text = html.unescape(text)
-    
-    # 2. Strip thread ID links (e.g., >>12345678)
-    text = re.sub(r'>>\d+', '', text)
-    
-    # 3. Handle Greentext
-    # We remove the '>' so the model treats it as a normal sentence structure
-    text = text.replace('>', '') 
-    
-    # 4. Strip URLs (they break Markov chains by creating unique tokens)
-    text = re.sub(r'http\S+', '', text)
-    
-    # 5. Normalize whitespace and remove technical junk characters
-    text = re.sub(r'[*_~`#]', '', text)
-    text = " ".join(text.split()).strip()
-    
-    # 6. ASCII only for model consistency
-    text = text.encode('ascii', 'ignore').decode('ascii')
-    
-    # Filter for substantial sentences (4chan has a lot of short 'bump' posts)
-    return text if len(text) > 20 else None
+WORKERS = 1 # Set above 1 to build batches on several cores at once
+MEMORY_LIMIT_MB = None # Set (e.g. 4000) to spill counts to disk when the dump won't fit in RAM
+BINARY_MODEL = True # Also write a .bin next to the JSON for MainBot's 'mmap' backend
+PRUNE_MIN_COUNT = 1 # Drop transitions seen fewer times than this before exporting
+PRUNE_MAX_FANOUT = None # Keep at most this many next words per state
+MODEL_SIZE_BUDGET_MB = None # Keep raising PRUNE_MIN_COUNT until the exported model fits in this many MB
+DELTA_TRAINING = False # Only train on rows added to INPUT_CSV since the last run, on top of the existing model
+CHECKPOINT_BATCHES = 10 # In delta mode, save every this many batches so an interrupted run can pick up from there
+CLEAN_WORKERS = 1 # Set above 1 to clean rows on several cores ahead of training
+DEDUP = False # True skips posts that are exact repeats (copypasta, spam) so they don't skew the chain
+NEAR_DEDUP = False # Also skip posts that are nearly the same as an earlier one, a lot slower
+
+# Cleaning rules for this site, see TextCleaner.py for the steps and make your own Cleaner to tweak them
+clean_text = IMAGEBOARD
+
+def source(path=None):
+    """This site's source for TrainingEngine, MultiTrainer.py uses it to mix sites into one model."""
+    return text_source(path or INPUT_CSV, 'text', clean_text)
 
 def run_training():
-    combined_model = None
-    batch = []
-    total_count = 0
-
-    print(f"[*] Reading {INPUT_CSV}...")
-    
-    try:
-        with open(INPUT_CSV, 'r', encoding='utf-8') as f:
-            # FIXED: Now uses DictReader to access the 'text' column correctly
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                cleaned = clean_text(row.get('text', ''))
-                if cleaned:
-                    batch.append(cleaned)
-                    total_count += 1
-
-                if len(batch) >= BATCH_SIZE:
-                    print(f"    [+] Merging batch at {total_count} lines...")
-                    # state_size=2 for more randomness, 3 for better grammar
-                    new_model = markovify.Text(batch, state_size=2, retain_original=False)
-                    
-                    if combined_model:
-                        combined_model = markovify.combine([combined_model, new_model])
-                    else:
-                        combined_model = new_model
-                    
-                    batch = [] 
-                    gc.collect()
-
-    except KeyboardInterrupt:
-        print("\n[!] Training interrupted! Processing what we have...")
-    except FileNotFoundError:
-        print(f"[!] Error: {INPUT_CSV} not found.")
-        sys.exit(1)
-
-    # Merge final batch
-    if batch:
-        print(f"    [+] Merging final {len(batch)} lines...")
-        new_model = markovify.Text(batch, state_size=2, retain_original=False)
-        combined_model = markovify.combine([combined_model, new_model]) if combined_model else new_model
-
-    if combined_model:
-        print(f"[*] Compiling and saving {MODEL_NAME}...")
-        combined_model.compile(inplace=True) 
-        
-        with open(MODEL_NAME, 'w') as f:
-            f.write(combined_model.to_json())
-        
-        print(f"[*] Success! Total lines processed: {total_count}")
-        
-        print("\n" + "="*30 + "\nSAMPLE OUTPUT:")
-        for _ in range(5):
-            # tries=100 helps if the model is picky about start words
-            print("GPT:", combined_model.make_sentence(tries=100) or "...")
-        print("="*30)
+    train([source()], MODEL_NAME, batch_size=BATCH_SIZE, workers=WORKERS, memory_limit_mb=MEMORY_LIMIT_MB,
+          binary_model=BINARY_MODEL, prune_min_count=PRUNE_MIN_COUNT, prune_max_fanout=PRUNE_MAX_FANOUT,
+          size_budget_mb=MODEL_SIZE_BUDGET_MB, delta=DELTA_TRAINING, checkpoint_batches=CHECKPOINT_BATCHES,
+          clean_workers=CLEAN_WORKERS, dedup=DEDUP, near_dedup=NEAR_DEDUP)
 
 if __name__ == "__main__":
-    run_training()
\ No newline at end of file
+    run_training()
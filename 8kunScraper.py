@@ -1,13 +1,17 @@
-import py8chan
+import asyncio
 import csv
 import re
-import time
-from multiprocessing import Pool, cpu_count
+from DedupFilter import DedupFilter, store_path_for
+from ImageboardFetcher import BoardClient, thread_ids
 
 # Settings
 BOARD_NAME = 'v'  # Example: 'v', 'pdx', or 'qresearch'
 OUTPUT_CSV = "8kunVData.csv"
 MIN_POST_LENGTH = 10
+BASE_URL = 'https://8kun.top' # Point this at a local stand-in board to test without hitting 8kun
+REQUESTS_PER_SECOND = 10 # Per host
+MAX_CONNECTIONS = 100 # How many thread requests can be in flight at once
+DEDUP = True # Don't write the same post twice (copypasta)
 
 def clean_8kun_text(text):
     if not text: return ""
@@ -20,50 +24,52 @@ def clean_8kun_text(text):
     text = re.sub(r'http\S+', '', text)
     return text.strip()
 
-def scrape_8kun_thread(t_id):
-    try:
-        # 8kun uses py8chan for Vichan-based API handling
-        board = py8chan.Board(BOARD_NAME)
-        thread = board.get_thread(t_id)
-        if not thread: return []
-        
-        posts = []
-        for post in thread.all_posts:
-            # .comment matches the 'com' or 'comment' field in Vichan
-            cleaned = clean_8kun_text(post.comment)
-            if cleaned and len(cleaned) > MIN_POST_LENGTH:
-                posts.append(cleaned)
-        return posts
-    except Exception:
-        return []
+def thread_posts(thread_json):
+    """Cleaned posts worth keeping from one res/<id>.json."""
+    posts = []
+    for post in thread_json.get('posts', []):
+        # 'com' is the raw Vichan comment HTML
+        cleaned = clean_8kun_text(post.get('com'))
+        if cleaned and len(cleaned) > MIN_POST_LENGTH:
+            posts.append(cleaned)
+    return posts
 
-def run_8kun_scrape():
-    n_cores = cpu_count()
-    board = py8chan.Board(BOARD_NAME)
-    
-    print(f"[*] Fetching active threads from 8kun /{BOARD_NAME}/...")
-    # 8kun doesn't always have a reliable public archive.json like 4chan
-    # but get_all_thread_ids() will pull everything currently in the catalog.
-    all_ids = board.get_all_thread_ids()
-    total_threads = len(all_ids)
-    
-    print(f"[*] Using {n_cores} workers for {total_threads} threads...")
+async def scrape():
+    async with BoardClient(per_second=REQUESTS_PER_SECOND, concurrency=MAX_CONNECTIONS) as client:
+        print(f"[*] Fetching active threads from 8kun /{BOARD_NAME}/...")
+        # 8kun doesn't always have a reliable public archive.json like 4chan
+        # but threads.json lists everything currently in the catalog.
+        all_ids = thread_ids(await client.get_json(f"{BASE_URL}/{BOARD_NAME}/threads.json"))
+        total_threads = len(all_ids)
+
+        print(f"[*] Fetching {total_threads} threads, up to {MAX_CONNECTIONS} at once...")
+
+        total_saved = 0
+        dedup = DedupFilter(store_path_for(OUTPUT_CSV), fresh=True) if DEDUP else None
+        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['text'])
 
-    total_saved = 0
-    with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['text'])
+            urls = (f"{BASE_URL}/{BOARD_NAME}/res/{t_id}.json" for t_id in all_ids)
+            i = 0
+            async for _, thread_json in client.iter_json(urls):
+                posts = thread_posts(thread_json)
+                if dedup is not None:
+                    posts = [p_text for p_text in posts if dedup.add(p_text)]
+                writer.writerows([p_text] for p_text in posts)
+                total_saved += len(posts)
+                i += 1
 
-        with Pool(processes=n_cores) as pool:
-            for i, post_list in enumerate(pool.imap_unordered(scrape_8kun_thread, all_ids)):
-                for p_text in post_list:
-                    writer.writerow([p_text])
-                    total_saved += 1
-                
                 if i % 5 == 0:
                     print(f"    Progress: {i}/{total_threads} | Posts: {total_saved}", end='\r')
 
     print(f"\n\n[*] Success! {total_saved} lines saved to {OUTPUT_CSV}")
+    if dedup is not None:
+        dedup.close()
+        dedup.report()
+
+def run_8kun_scrape():
+    asyncio.run(scrape())
 
 if __name__ == "__main__":
-    run_8kun_scrape()
\ No newline at end of file
+    run_8kun_scrape()
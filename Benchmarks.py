@@ -0,0 +1,345 @@
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from itertools import accumulate, islice
+
+import markovify
+from markovify.text import ParamError
+
+# Times the hot paths so tuning BATCH_SIZE, state_size or tries isn't guesswork: training
+# speed and memory, how long the bot takes to load its brain, and how fast (and how often
+# successfully) it makes sentences. Everything runs on synthetic imageboard and Discord dumps
+# generated here, so runs on different machines and commits train on exactly the same text.
+# Every run is saved to BENCH_RESULTS and compared against the run before it.
+
+# Settings
+SIZES = {'small': 10000, 'medium': 100000, 'large': 1000000}  # Rows per synthetic dump
+DEFAULT_SIZES = ['small', 'medium']  # What runs without arguments, large takes a while
+STATE_SIZES = [2, 3]  # Every size gets a model per state_size
+BATCH_SIZES = [50000]  # Training gets timed once per batch size, generation uses the first
+DEDUP = False  # Train like DEDUP in the trainer scripts, off like they ship, True to time the dedup pass too
+BACKENDS = ['from_json', 'dict', 'compact', 'mmap']  # from_json is how setup_hook used to load, the rest are BRAIN_BACKEND
+TRIES = [50]  # tries= for every make_* call, MainBot uses 50
+CALLS = 200  # Calls per generation job, p99 needs at least 100 to mean anything
+BENCH_DIR = 'benchmark_data'  # Synthetic dumps and the models trained on them, reused between runs
+BENCH_RESULTS = 'benchmark_results'  # One JSON per run
+REGRESSION = 0.10  # Changes bigger than this (10%) in the wrong direction get flagged
+NOISE_MS = 0.5  # Latency changes smaller than this are timer noise, never flagged
+SEED = 1337  # Same seed, same dumps
+
+# --- Synthetic dumps ---
+
+COMMON = ("the a to and of is it i you that in this for on not be with are have just like what "
+          "but so do was they if no all can at my your an he get or me one would why people "
+          "think anon op know good as more about from how when even there will time make "
+          "because than really their we been only any still now out who much way bad game "
+          "new thread shit based post literally need want never same fucking board meme years "
+          "never use better see back right also work going try actually nothing other day lol "
+          "retard cope seethe gpu linux windows pc phone code fag kek thing things got say").split()
+SYLLABLES = "ba be bo ka ke ko ra re ri ro ta te to na ne no sa se so ma me mi mo la le lo da de do".split()
+VOCABULARY = 20000  # Words past COMMON are made up, used with a Zipf falloff like real chat
+COPYPASTA = 0.03  # Share of posts that are one of a few copypastas, so dedup has work to do
+
+def _vocabulary(rng):
+    words = list(COMMON)
+    made_up = set(words)
+    while len(words) < VOCABULARY:
+        word = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        if word not in made_up:
+            made_up.add(word)
+            words.append(word)
+    weights = [1 / (i + 1) ** 1.1 for i in range(len(words))]
+    return words, list(accumulate(weights))
+
+def _sentence(rng, words, cum_weights):
+    sentence = rng.choices(words, cum_weights=cum_weights, k=rng.randint(4, 20))
+    sentence[0] = sentence[0].capitalize()
+    return " ".join(sentence) + rng.choice('..!?')
+
+def _post(rng, words, cum_weights, copypastas, site):
+    if rng.random() < COPYPASTA:
+        return rng.choice(copypastas)
+    text = " ".join(_sentence(rng, words, cum_weights) for _ in range(rng.randint(1, 3)))
+    roll = rng.random()
+    # The kind of junk each site's Cleaner is there to strip
+    if site == 'imageboard':
+        if roll < 0.3:
+            text = f">>{rng.randint(10**7, 10**8)} {text}"
+        elif roll < 0.4:
+            text = f">{text}"
+        elif roll < 0.45:
+            text = f"{text} https://i.4cdn.org/g/{rng.randint(10**12, 10**13)}.png"
+        elif roll < 0.5:
+            text = text.replace("'", "&#039;").replace(" and ", " &amp; ")
+    else:
+        if roll < 0.1:
+            text = f"<@{rng.randint(10**17, 10**18)}> {text}"
+        elif roll < 0.15:
+            text = f"{text} https://tenor.com/view/{rng.randint(10**6, 10**7)}"
+    return text
+
+def generate_imageboard(path, rows, seed=SEED):
+    """A scraper-style CSV with a text column: post links, greentext, links, escapes and copypasta."""
+    rng = random.Random(seed)
+    words, cum_weights = _vocabulary(rng)
+    copypastas = [" ".join(_sentence(rng, words, cum_weights) for _ in range(6)) for _ in range(5)]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['text'])
+        for _ in range(rows):
+            writer.writerow([_post(rng, words, cum_weights, copypastas, 'imageboard')])
+
+def generate_discord(path, rows, seed=SEED):
+    """A Discord-Chat-Exporter style JSON with pings, links, join messages and copypasta."""
+    rng = random.Random(seed + 1)
+    words, cum_weights = _vocabulary(rng)
+    copypastas = [" ".join(_sentence(rng, words, cum_weights) for _ in range(6)) for _ in range(5)]
+    msg_id = 10**18
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"guild": {"name": "Benchmark"}, "messages": [\n')
+        for i in range(rows):
+            msg_id += rng.randint(1, 10**6)
+            joined = rng.random() < 0.01
+            msg = {"id": str(msg_id), "type": "GuildMemberJoin" if joined else "Default",
+                   "content": "" if joined else _post(rng, words, cum_weights, copypastas, 'discord'),
+                   "author": {"id": str(rng.randint(1, 500)), "name": "anon"}}
+            f.write(("," if i else "") + json.dumps(msg) + "\n")
+        f.write(']}\n')
+
+def corpus_path(site, size):
+    return os.path.join(BENCH_DIR, f"{site}_{size}." + ('csv' if site == 'imageboard' else 'json'))
+
+def model_path(site, size, state_size):
+    return os.path.join(BENCH_DIR, f"{site}_{size}_state{state_size}.json")
+
+def make_corpus(site, size):
+    """Generates a dump once, later runs reuse it."""
+    path = corpus_path(site, size)
+    if not os.path.exists(path):
+        print(f"[*] Generating {path} ({SIZES[size]:,} rows)...")
+        tmp_path = path + '.tmp'
+        (generate_imageboard if site == 'imageboard' else generate_discord)(tmp_path, SIZES[size])
+        os.replace(tmp_path, path)
+    return path
+
+# --- Measurements, each runs in a fresh process so peak RSS belongs to it alone ---
+
+def peak_rss_mb():
+    """Peak resident memory of this process, None if the platform can't say."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB elsewhere
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024  # Windows
+    except (ImportError, AttributeError):
+        return None
+
+def _isolated(func, *args):
+    """Runs func(*args) in a brand new interpreter, not a fork that already holds our memory."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+def bench_training(site, path, model, rows, state_size, batch_size, dedup):
+    from TextCleaner import DISCORD, IMAGEBOARD
+    from TrainingEngine import DiscordSource, text_source, train
+    if site == 'imageboard':
+        source = text_source(path, 'text', IMAGEBOARD)
+    else:
+        source = DiscordSource(path, DISCORD)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as quiet, redirect_stdout(quiet):
+        # Same settings the trainer scripts ship with, apart from dedup if DEDUP says so
+        train([source], model, state_size=state_size, batch_size=batch_size, dedup=dedup, samples=0)
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "rows_per_sec": rows / elapsed, "peak_rss_mb": peak_rss_mb(),
+            "model_mb": os.path.getsize(model) / 1024 / 1024}
+
+def load(model, backend):
+    if backend == 'from_json':
+        with open(model, 'r', encoding='utf-8') as f:
+            return markovify.Text.from_json(f.read())
+    from GenerationPool import load_brain
+    return load_brain(model, backend)
+
+def _percentile(times, p):
+    return times[min(len(times) - 1, int(len(times) * p))]
+
+def time_calls(brain, call, args_list):
+    """p50/p99 in ms and how often nothing came back, for call(brain, *args) over args_list."""
+    times = []
+    failures = 0
+    for args in args_list:
+        # markovify caches the last seed's scan, clear it so every call pays like a real ping would
+        if hasattr(brain.find_init_states_from_chain, 'cache_clear'):
+            brain.find_init_states_from_chain.cache_clear()
+        start = time.perf_counter()
+        try:
+            result = call(brain, *args)
+        except (KeyError, ParamError):
+            result = None
+        times.append((time.perf_counter() - start) * 1000)
+        if not result:
+            failures += 1
+    times.sort()
+    return {"p50_ms": statistics.median(times), "p99_ms": _percentile(times, 0.99),
+            "failure_rate": failures / len(args_list)}
+
+def seed_words(path, site, count):
+    """Words people would actually ping the bot with: picked out of real rows of the dump."""
+    rng = random.Random(SEED)
+    words = []
+    if site == 'imageboard':
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            texts = [row['text'] for row in islice(csv.DictReader(f), 5000)]
+    else:
+        # generate_discord writes one message per line after the opening line
+        with open(path, 'r', encoding='utf-8') as f:
+            texts = [json.loads(line.lstrip(','))['content'] for line in islice(f, 1, 5001) if line.startswith(('{', ',{'))]
+    texts = [text.split() for text in texts if text]
+    while len(words) < count:
+        text = rng.choice(texts)
+        word = rng.choice(text).strip('.!?>"')
+        if word.isalpha():
+            words.append(word)
+    return words
+
+def bench_generation(model, backend, seeds, tries):
+    start = time.perf_counter()
+    brain = load(model, backend)
+    results = {"load": {"seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}}
+    calls = [()] * len(seeds)
+    results[f"make_sentence/tries{tries}"] = time_calls(brain, lambda b: b.make_sentence(tries=tries), calls)
+    for length in (100, 40):
+        results[f"make_short_sentence{length}/tries{tries}"] = time_calls(
+            brain, lambda b: b.make_short_sentence(length, tries=tries), calls)
+    results[f"make_sentence_with_start/tries{tries}"] = time_calls(
+        brain, lambda b, seed: b.make_sentence_with_start(seed, strict=False, tries=tries), [(s,) for s in seeds])
+    return results
+
+# --- Results ---
+
+# Which way is better for each metric, anything else is just reported
+HIGHER_IS_BETTER = {"rows_per_sec"}
+LOWER_IS_BETTER = {"seconds", "peak_rss_mb", "model_mb", "p50_ms", "p99_ms", "failure_rate"}
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"time": datetime.now().isoformat(timespec='seconds'), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "markovify": getattr(markovify, '__version__', None)}
+
+def compare(old, new, threshold=REGRESSION):
+    """Prints every metric that moved more than threshold, returns how many got worse."""
+    worse = 0
+    for name, metrics in new["results"].items():
+        before = old["results"].get(name)
+        if not before:
+            continue
+        for metric, value in metrics.items():
+            was = before.get(metric)
+            if value is None or was is None or metric not in HIGHER_IS_BETTER | LOWER_IS_BETTER:
+                continue
+            change = (value - was) / was if was else (1.0 if value else 0.0)
+            if abs(change) < threshold or (metric.endswith('_ms') and abs(value - was) < NOISE_MS):
+                continue
+            regressed = change < 0 if metric in HIGHER_IS_BETTER else change > 0
+            worse += regressed
+            print(f"    {'[!] WORSE' if regressed else '    better'}  {name} {metric}: "
+                  f"{was:,.3f} -> {value:,.3f} ({change:+.0%})")
+    return worse
+
+def latest_results(exclude=None):
+    if not os.path.isdir(BENCH_RESULTS):
+        return None
+    paths = sorted(os.path.join(BENCH_RESULTS, name) for name in os.listdir(BENCH_RESULTS) if name.endswith('.json'))
+    paths = [path for path in paths if path != exclude]
+    return paths[-1] if paths else None
+
+def run(sizes):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    report = {"environment": environment(),
+              "settings": {"sizes": {size: SIZES[size] for size in sizes}, "state_sizes": STATE_SIZES,
+                           "batch_sizes": BATCH_SIZES, "dedup": DEDUP, "tries": TRIES, "calls": CALLS},
+              "results": {}}
+    results = report["results"]
+
+    for size in sizes:
+        for site in ('imageboard', 'discord'):
+            path = make_corpus(site, size)
+            seeds = seed_words(path, site, CALLS)
+            for state_size in STATE_SIZES:
+                model = model_path(site, size, state_size)
+                for batch_size in BATCH_SIZES:
+                    name = f"train/{site}/{size}/state{state_size}/batch{batch_size}"
+                    print(f"[*] {name}...")
+                    results[name] = _isolated(bench_training, site, path, model, SIZES[size], state_size, batch_size, DEDUP)
+                    r = results[name]
+                    print(f"    {r['rows_per_sec']:,.0f} rows/sec | {r['seconds']:.1f}s | peak "
+                          f"{r['peak_rss_mb'] or 0:,.0f} MB | model {r['model_mb']:,.1f} MB")
+
+                for backend in BACKENDS:
+                    for tries in TRIES:
+                        prefix = f"{site}/{size}/state{state_size}/{backend}"
+                        print(f"[*] Generating with {prefix}, tries={tries}...")
+                        for job, r in _isolated(bench_generation, model, backend, seeds, tries).items():
+                            results[f"{prefix}/{job}"] = r
+                            if job == 'load':
+                                print(f"    {'load':<34} {r['seconds']:8.2f}s | peak {r['peak_rss_mb'] or 0:,.0f} MB")
+                            else:
+                                print(f"    {job:<34} p50 {r['p50_ms']:8.2f} ms | p99 {r['p99_ms']:8.2f} ms"
+                                      f" | failed {r['failure_rate']:.0%}")
+    return report
+
+if __name__ == "__main__":
+    # Runs the suite and saves it to BENCH_RESULTS: python Benchmarks.py [small,medium,large]
+    # Compares two saved runs:                     python Benchmarks.py compare old.json new.json
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        if len(sys.argv) < 4:
+            print("Usage: python Benchmarks.py compare old.json new.json")
+            sys.exit(1)
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(sys.argv[3], 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        print(f"[*] {sys.argv[2]} ({old['environment']['commit']}) -> {sys.argv[3]} ({new['environment']['commit']}):")
+        sys.exit(1 if compare(old, new) else 0)
+
+    sizes = sys.argv[1].split(',') if len(sys.argv) > 1 else DEFAULT_SIZES
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        print(f"[!] Unknown size {', '.join(unknown)}, pick from {', '.join(SIZES)}")
+        sys.exit(1)
+
+    report = run(sizes)
+    os.makedirs(BENCH_RESULTS, exist_ok=True)
+    out_path = os.path.join(BENCH_RESULTS, datetime.now().strftime('%Y%m%d_%H%M%S')
+                            + f"_{report['environment']['commit'] or 'nogit'}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"[*] Saved {out_path}")
+
+    previous = latest_results(exclude=out_path)
+    if previous:
+        with open(previous, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        print(f"[*] Compared to {previous} ({old['environment']['commit']}):")
+        if not compare(old, report):
+            print("    No regressions")
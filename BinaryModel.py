@@ -0,0 +1,224 @@
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+from contextlib import ExitStack
+from markovify.chain import BEGIN, END
+from CompactChain import CompactChain, CompactText, _smallest_typecode
+from ModelIO import load_compact_model
+
+# Binary model file the bot can mmap instead of parsing JSON.
+# It's just the CompactChain arrays written back to back, so loading is a handful of
+# memoryview casts and lookups read straight from the mapped pages.
+
+MAGIC = b'MKVB'
+VERSION = 1
+# magic, version, state_size, bits, vocab size, states, transitions, offsets typecode, cumdist typecode
+HEADER = struct.Struct('<4sIIIQQQcc')
+HEADER_SIZE = 64
+STREAM_CHUNK = 1 << 16  # Transitions buffered per section before write_binary_items writes them out
+
+def binary_path_for(model_path):
+    """4chanGGPT.json -> 4chanGGPT.bin"""
+    return os.path.splitext(model_path)[0] + '.bin'
+
+def _pad(f):
+    f.write(b'\0' * (-f.tell() % 8))
+
+def write_binary_model(path, chain):
+    """Writes a CompactChain to path."""
+    vocab_bytes = [w.encode('utf-8') for w in chain.vocab]
+    vocab_offsets = array.array('Q', [0])
+    for b in vocab_bytes:
+        vocab_offsets.append(vocab_offsets[-1] + len(b))
+    # Word ids sorted by the word itself, so a word can be found with a binary search
+    sorted_ids = array.array('I', sorted(range(len(chain.vocab)), key=chain.vocab.__getitem__))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        header = HEADER.pack(MAGIC, VERSION, chain.state_size, chain.bits, len(chain.vocab),
+                             len(chain.keys), len(chain.next_ids),
+                             chain.offsets.typecode.encode(), chain.cumdist.typecode.encode())
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        for section in (vocab_offsets, sorted_ids, chain.keys, chain.offsets, chain.next_ids, chain.cumdist):
+            section.tofile(f)
+            _pad(f)
+        for b in vocab_bytes:
+            f.write(b)
+    os.replace(tmp_path, path)
+
+def _padded(size):
+    return size + (-size % 8)
+
+def write_binary_items(path, state_size, items, words, states, transitions, max_weight):
+    """
+    Writes (state, words, weights) triples to path without building a CompactChain, for models
+    that don't fit in memory. Only the vocab is held, so it needs to know up front every word
+    (words), how many states and transitions are coming and the biggest cumulative weight.
+    items has to come sorted by state, the way ExternalChainBuilder merges them, word ids follow
+    the words' own order so that's the packed keys' order too. Raises ValueError if it isn't.
+    """
+    vocab = sorted(set(words) | {BEGIN, END})
+    word_ids = {word: i for i, word in enumerate(vocab)}
+    bits = max(1, (len(vocab) - 1).bit_length())
+    if bits * state_size > 64:
+        raise ValueError(f"Vocab of {len(vocab)} words is too big to pack state_size={state_size} states into 64 bits")
+    vocab_bytes = [w.encode('utf-8') for w in vocab]
+    vocab_offsets = array.array('Q', [0])
+    for b in vocab_bytes:
+        vocab_offsets.append(vocab_offsets[-1] + len(b))
+    offsets_tc = _smallest_typecode(transitions)
+    cum_tc = _smallest_typecode(max_weight)
+
+    # Every section's size is known, so each one gets its own file handle parked at its start
+    keys_at = HEADER_SIZE + _padded(vocab_offsets.itemsize * len(vocab_offsets)) + _padded(4 * len(vocab))
+    offsets_at = keys_at + _padded(8 * states)
+    next_at = offsets_at + _padded(array.array(offsets_tc).itemsize * (states + 1))
+    cum_at = next_at + _padded(4 * transitions)
+    vocab_at = cum_at + _padded(array.array(cum_tc).itemsize * transitions)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.truncate(vocab_at + vocab_offsets[-1])  # Zeros, padding included
+        header = HEADER.pack(MAGIC, VERSION, state_size, bits, len(vocab), states, transitions,
+                             offsets_tc.encode(), cum_tc.encode())
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        vocab_offsets.tofile(f)
+        _pad(f)
+        array.array('I', range(len(vocab))).tofile(f)  # vocab is sorted already
+        f.seek(vocab_at)
+        for b in vocab_bytes:
+            f.write(b)
+    del vocab_bytes, vocab_offsets
+
+    sections = [(keys_at, 'Q'), (offsets_at, offsets_tc), (next_at, 'I'), (cum_at, cum_tc)]
+    try:
+        with ExitStack() as stack:
+            handles = [stack.enter_context(open(tmp_path, 'r+b')) for _ in sections]
+            for handle, (at, _) in zip(handles, sections):
+                handle.seek(at)
+            buffers = [array.array(typecode) for _, typecode in sections]
+            keys, offsets, next_ids, cumdist = buffers
+
+            def flush():
+                for handle, buffer in zip(handles, buffers):
+                    buffer.tofile(handle)
+                    del buffer[:]
+
+            offsets.append(0)
+            seen_states, seen_transitions, last_key = 0, 0, -1
+            for state, next_words, weights in items:
+                key = 0
+                for w in state:
+                    key = (key << bits) | word_ids[w]
+                if key <= last_key:
+                    raise ValueError(f"States aren't sorted, '{' '.join(state)}' came out of order")
+                last_key = key
+                keys.append(key)
+                next_ids.extend(word_ids[w] for w in next_words)
+                cumdist.extend(weights)
+                seen_states += 1
+                seen_transitions += len(next_words)
+                offsets.append(seen_transitions)
+                if len(next_ids) >= STREAM_CHUNK:
+                    flush()
+            flush()
+        if (seen_states, seen_transitions) != (states, transitions):
+            raise ValueError(f"Expected {states} states and {transitions} transitions, got {seen_states} and {seen_transitions}")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+class MappedVocab:
+    """Word id -> word, decoded straight out of the mapped file."""
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+class MappedWordIds:
+    """Word -> word id, a binary search over the ids sorted by word."""
+    def __init__(self, sorted_ids, vocab):
+        self.sorted_ids = sorted_ids
+        self.vocab = vocab
+
+    def get(self, word, default=None):
+        i = bisect.bisect_left(self.sorted_ids, word, key=self.vocab.__getitem__)
+        if i < len(self.sorted_ids):
+            word_id = self.sorted_ids[i]
+            if self.vocab[word_id] == word:
+                return word_id
+        return default
+
+    def __getitem__(self, word):
+        word_id = self.get(word)
+        if word_id is None:
+            raise KeyError(word)
+        return word_id
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+class MappedChain(CompactChain):
+    """CompactChain whose arrays are views into an mmap'd model file."""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+
+        magic, version, state_size, bits, vocab_size, states, transitions, offsets_tc, cum_tc = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} binary model")
+
+        pos = HEADER_SIZE
+
+        def section(typecode, count):
+            nonlocal pos
+            size = array.array(typecode).itemsize * count
+            part = view[pos:pos + size].cast(typecode)
+            pos += size + (-size % 8)
+            return part
+
+        vocab_offsets = section('Q', vocab_size + 1)
+        sorted_ids = section('I', vocab_size)
+        keys = section('Q', states)
+        offsets = section(offsets_tc.decode(), states + 1)
+        next_ids = section('I', transitions)
+        cumdist = section(cum_tc.decode(), transitions)
+        vocab = MappedVocab(vocab_offsets, view[pos:])
+
+        super().__init__(state_size, vocab, keys, offsets, next_ids, cumdist,
+                         word_ids=MappedWordIds(sorted_ids, vocab))
+        if self.bits != bits:
+            raise ValueError(f"{path} is corrupt, packed key width doesn't match its vocab")
+
+    def memory_usage(self):
+        """Size of the mapping. It lives in the OS page cache, not the Python heap."""
+        return len(self.map)
+
+def load_binary_model(path):
+    """Maps a .bin model and wraps it in a CompactText, ready for make_sentence."""
+    chain = MappedChain(path)
+    return CompactText(None, state_size=chain.state_size, chain=chain, retain_original=False)
+
+if __name__ == "__main__":
+    # Converts an existing JSON export: python BinaryModel.py ExportedMarkovChainModel.json [out.bin]
+    if len(sys.argv) < 2:
+        print("Usage: python BinaryModel.py model.json [model.bin]")
+        sys.exit(1)
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else binary_path_for(src)
+    print(f"[*] Loading {src}...")
+    text = load_compact_model(src)
+    print(f"[*] Writing {dst}...")
+    write_binary_model(dst, text.chain)
+    print(f"[*] Done! {os.path.getsize(dst) / 1024 / 1024:,.1f} MB")
@@ -0,0 +1,262 @@
+import array
+import bisect
+import json
+import random
+import sys
+import markovify
+from markovify.chain import BEGIN, END, accumulate
+from SeedIndex import SeededTextMixin
+
+# A drop-in for markovify's dict-of-dicts chain that keeps the whole model in a few flat arrays.
+# Every word is stored once in the vocab and referred to by its integer id everywhere else.
+
+def _smallest_typecode(max_value):
+    return 'I' if max_value < 2 ** 32 else 'Q'
+
+class CompactChain:
+    """
+    Read-only markovify.Chain replacement.
+
+    vocab     - list of every word, the index is the word's id
+    keys      - sorted array of states, each state's word ids packed into one integer
+    offsets   - state i's transitions live at offsets[i]:offsets[i + 1]
+    next_ids  - word id of every transition
+    cumdist   - running weight total of every transition within its state (CSR style)
+    """
+    compiled = True
+
+    def __init__(self, state_size, vocab, keys, offsets, next_ids, cumdist, word_ids=None):
+        self.state_size = state_size
+        self.vocab = vocab
+        self.keys = keys
+        self.offsets = offsets
+        self.next_ids = next_ids
+        self.cumdist = cumdist
+        # Anything with [word] -> id that raises KeyError works here, see BinaryModel.MappedVocab
+        self.word_ids = word_ids if word_ids is not None else {word: i for i, word in enumerate(vocab)}
+        self.bits = max(1, (len(vocab) - 1).bit_length())
+        self.mask = (1 << (self.bits * state_size)) - 1
+        self.begin_id = self.word_ids[BEGIN]
+        self.end_id = self.word_ids[END]
+
+    @classmethod
+    def from_items(cls, state_size, items):
+        """
+        Builds the arrays from (state, words, weights) triples, where weights are the
+        cumulative totals of a compiled markovify chain.
+        """
+        vocab = [BEGIN, END]
+        word_ids = {BEGIN: 0, END: 1}
+
+        def word_id(word):
+            i = word_ids.get(word)
+            if i is None:
+                i = word_ids[word] = len(vocab)
+                vocab.append(word)
+            return i
+
+        # Collect in input order first, the packed keys need the final vocab size
+        state_ids = array.array('I')
+        offsets = array.array('Q', [0])
+        next_ids = array.array('I')
+        cumdist = array.array('Q')
+        for state, words, weights in items:
+            state_ids.extend(word_id(w) for w in state)
+            next_ids.extend(word_id(w) for w in words)
+            cumdist.extend(weights)
+            offsets.append(len(next_ids))
+
+        bits = max(1, (len(vocab) - 1).bit_length())
+        if bits * state_size > 64:
+            raise ValueError(f"Vocab of {len(vocab)} words is too big to pack state_size={state_size} states into 64 bits")
+
+        count = len(offsets) - 1
+        packed = array.array('Q', bytes(8 * count))
+        for i in range(count):
+            key = 0
+            for w in state_ids[i * state_size:(i + 1) * state_size]:
+                key = (key << bits) | w
+            packed[i] = key
+        del state_ids
+
+        order = sorted(range(count), key=packed.__getitem__)
+        keys = array.array('Q', (packed[i] for i in order))
+        del packed
+
+        sorted_offsets = array.array('Q', [0])
+        sorted_next = array.array('I')
+        sorted_cum = array.array('Q')
+        for i in order:
+            lo, hi = offsets[i], offsets[i + 1]
+            sorted_next.extend(next_ids[lo:hi])
+            sorted_cum.extend(cumdist[lo:hi])
+            sorted_offsets.append(len(sorted_next))
+        del offsets, next_ids, cumdist
+        # Drop to 4 byte entries whenever the numbers allow it
+        if _smallest_typecode(len(sorted_next)) == 'I':
+            sorted_offsets = array.array('I', sorted_offsets)
+        if _smallest_typecode(max(sorted_cum, default=0)) == 'I':
+            sorted_cum = array.array('I', sorted_cum)
+
+        return cls(state_size, vocab, keys, sorted_offsets, sorted_next, sorted_cum)
+
+    @classmethod
+    def from_chain(cls, chain):
+        """Converts a markovify.Chain, compiled or not."""
+        def items():
+            for state, value in chain.model.items():
+                if chain.compiled:
+                    words, weights = value
+                else:
+                    words = list(value.keys())
+                    weights = list(accumulate(value.values()))
+                yield state, words, weights
+        return cls.from_items(chain.state_size, items())
+
+    def pack(self, state):
+        """Turns a tuple of words into its packed key. Raises KeyError for unknown words."""
+        key = 0
+        for word in state:
+            key = (key << self.bits) | self.word_ids[word]
+        return key
+
+    def unpack(self, key):
+        words = []
+        for _ in range(self.state_size):
+            words.append(self.vocab[key & ((1 << self.bits) - 1)])
+            key >>= self.bits
+        return tuple(reversed(words))
+
+    def _index(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            raise KeyError(key)
+        return i
+
+    def _move_id(self, index):
+        lo, hi = self.offsets[index], self.offsets[index + 1]
+        r = random.random() * self.cumdist[hi - 1]
+        return self.next_ids[bisect.bisect(self.cumdist, r, lo, hi)]
+
+    def compile(self, inplace=False):
+        return self
+
+    def move(self, state):
+        """Given a state, choose the next item at random."""
+        return self.vocab[self._move_id(self._index(self.pack(state)))]
+
+    def gen(self, init_state=None):
+        """Same as markovify.Chain.gen but walks packed ids instead of building tuples."""
+        key = self.pack(init_state or (BEGIN,) * self.state_size)
+        while True:
+            word_id = self._move_id(self._index(key))
+            if word_id == self.end_id:
+                break
+            yield self.vocab[word_id]
+            key = ((key << self.bits) & self.mask) | word_id
+
+    def walk(self, init_state=None):
+        return list(self.gen(init_state))
+
+    def items(self):
+        """Yields (state, words, weights) for every state, in key order."""
+        for i, key in enumerate(self.keys):
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            yield self.unpack(key), [self.vocab[w] for w in self.next_ids[lo:hi]], list(self.cumdist[lo:hi])
+
+    def states_starting_with(self, split):
+        """
+        Every state whose words (ignoring leading BEGINs) start with split.
+        States sharing a prefix are one contiguous range of the sorted keys,
+        so this is a couple of binary searches instead of a scan of every state.
+        """
+        return [self.unpack(self.keys[i]) for i in self._starting_indexes(split)]
+
+    def weighted_states_starting_with(self, split):
+        """Same as states_starting_with, as (state, total weight) pairs."""
+        return [(self.unpack(self.keys[i]), self.cumdist[self.offsets[i + 1] - 1])
+                for i in self._starting_indexes(split)]
+
+    def _starting_indexes(self, split):
+        try:
+            split_ids = [self.word_ids[w] for w in split]
+        except KeyError:
+            return
+        for pad in range(self.state_size - len(split_ids) + 1):
+            prefix = 0
+            for w in [self.begin_id] * pad + split_ids:
+                prefix = (prefix << self.bits) | w
+            shift = self.bits * (self.state_size - pad - len(split_ids))
+            lo = bisect.bisect_left(self.keys, prefix << shift)
+            hi = bisect.bisect_left(self.keys, (prefix + 1) << shift)
+            yield from range(lo, hi)
+
+    def to_json(self):
+        return json.dumps([[list(state), [words, weights]] for state, words, weights in self.items()])
+
+    def memory_usage(self):
+        """Bytes held by the arrays and the vocab."""
+        arrays = sum(a.itemsize * len(a) for a in (self.keys, self.offsets, self.next_ids, self.cumdist))
+        vocab = sys.getsizeof(self.vocab) + sum(sys.getsizeof(w) for w in self.vocab)
+        return arrays + vocab + sys.getsizeof(self.word_ids)
+
+class CompactText(SeededTextMixin, markovify.Text):
+    """markovify.Text running on a CompactChain, same make_sentence calls as before."""
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(None, state_size=text.state_size, chain=CompactChain.from_chain(text.chain), retain_original=False)
+
+    def seed_states(self, split):
+        # The sorted keys already are the index, no need to build one
+        return self.chain.weighted_states_starting_with(split)
+
+def dict_chain_memory(chain):
+    """Rough bytes held by a markovify dict chain, walking every state and transition."""
+    seen = set()
+
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+
+    total = size(chain.model)
+    for state, value in chain.model.items():
+        total += size(state) + sum(size(w) for w in state)
+        total += size(value)
+        parts = value if chain.compiled else (value.keys(), value.values())
+        for part in parts:
+            total += size(part) + sum(size(x) for x in part)
+    return total
+
+def estimate_dict_chain_memory(chain, sample=2000):
+    """dict_chain_memory from every n-th state scaled up, close enough for a budget and a lot faster."""
+    model = chain.model
+    if not model:
+        return sys.getsizeof(model)
+    step = max(1, len(model) // sample)
+    total = 0
+    counted = 0
+    for i, (state, value) in enumerate(model.items()):
+        if i % step:
+            continue
+        counted += 1
+        total += sys.getsizeof(state) + sum(sys.getsizeof(w) for w in state) + sys.getsizeof(value)
+        parts = value if chain.compiled else (value.keys(), value.values())
+        for part in parts:
+            total += sys.getsizeof(part) + sum(sys.getsizeof(x) for x in part)
+    return sys.getsizeof(model) + int(total / counted * len(model))
+
+if __name__ == "__main__":
+    # Usage: python CompactChain.py ExportedMarkovChainModel.json
+    path = sys.argv[1] if len(sys.argv) > 1 else 'ExportedMarkovChainModel.json'
+    print(f"[*] Loading {path}...")
+    with open(path, 'r', encoding='utf-8') as f:
+        text = markovify.Text.from_json(f.read())
+    compact = CompactChain.from_chain(text.chain)
+    dict_bytes = dict_chain_memory(text.chain)
+    compact_bytes = compact.memory_usage()
+    print(f"[*] States: {len(compact.keys):,} | Transitions: {len(compact.next_ids):,} | Vocab: {len(compact.vocab):,}")
+    print(f"    Dict chain:    {dict_bytes / 1024 / 1024:,.1f} MB")
+    print(f"    Compact chain: {compact_bytes / 1024 / 1024:,.1f} MB ({dict_bytes / max(compact_bytes, 1):.1f}x smaller)")
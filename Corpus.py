@@ -0,0 +1,299 @@
+import csv
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+# A compressed corpus format for scraped posts, instead of a giant uncompressed CSV.
+# name.corpus holds zlib-compressed blocks of ROWS_PER_BLOCK rows each, name.corpus.idx has one
+# fixed-size record per block (where it starts, how long it is, how many rows), so a reader can
+# jump straight to any row or split the file into block ranges for parallel workers without
+# decompressing anything it doesn't need. Writers only ever append.
+
+MAGIC = b'MKCORPS1'
+HEADER = struct.Struct('<8sIB')  # magic, rows per block, compression level
+HEADER_SIZE = 32
+INDEX = struct.Struct('<QII')  # block offset, compressed size, rows
+ROWS_PER_BLOCK = 1000  # Smaller blocks make random lookups cheaper, bigger ones compress a bit better
+SEP = '\x00'  # Between rows in a block, scraped text never has it
+
+def index_path_for(path):
+    return path + '.idx'
+
+def _read_index(path, index_path):
+    """Complete index records whose blocks are fully on disk, anything torn by a crash is ignored."""
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'rb') as f:
+        data = f.read()
+    data_size = os.path.getsize(path)
+    blocks = []
+    for offset, size, rows in INDEX.iter_unpack(data[:len(data) - len(data) % INDEX.size]):
+        if offset + size > data_size:
+            break
+        blocks.append((offset, size, rows))
+    return blocks
+
+class CorpusWriter:
+    """
+    with CorpusWriter('4chanTechBoard.corpus') as corpus:
+        corpus.write(text)
+    Opening an existing corpus appends to it. writerow/writerows take the same [text] rows a
+    csv.writer does, so it can stand in for one.
+    """
+    def __init__(self, path, rows_per_block=ROWS_PER_BLOCK, level=6):
+        self.path = path
+        self.index_path = index_path_for(path)
+        self.level = level
+        self.buffer = []
+        self.partial = False  # The last block on disk is self.buffer flushed early, rewrite it next time
+
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                magic, self.rows_per_block, self.level = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} isn't a corpus file")
+            self.blocks = _read_index(path, self.index_path)
+            self.data = open(path, 'r+b')
+            self.index = open(self.index_path, 'a+b')
+            self._truncate(len(self.blocks))
+            # Top up a short last block instead of leaving a small one in the middle of the file
+            if self.blocks and self.blocks[-1][2] < self.rows_per_block:
+                self.buffer = self._read_block(len(self.blocks) - 1)
+                self.partial = True
+        else:
+            self.rows_per_block = rows_per_block
+            self.blocks = []
+            self.data = open(path, 'w+b')
+            self.data.write(HEADER.pack(MAGIC, rows_per_block, level).ljust(HEADER_SIZE, b'\0'))
+            self.index = open(self.index_path, 'w+b')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def rows(self):
+        on_disk = sum(rows for _, _, rows in self.blocks)
+        if self.partial:
+            on_disk -= self.blocks[-1][2]
+        return on_disk + len(self.buffer)
+
+    def _end(self):
+        if not self.blocks:
+            return HEADER_SIZE
+        offset, size, _ = self.blocks[-1]
+        return offset + size
+
+    def _truncate(self, block_count):
+        del self.blocks[block_count:]
+        self.data.truncate(self._end())
+        self.index.truncate(block_count * INDEX.size)
+
+    def _read_block(self, i):
+        offset, size, _ = self.blocks[i]
+        self.data.seek(offset)
+        return zlib.decompress(self.data.read(size)).decode('utf-8').split(SEP)
+
+    def _write_block(self, rows):
+        if self.partial:
+            self._truncate(len(self.blocks) - 1)
+            self.partial = False
+        payload = zlib.compress(SEP.join(rows).encode('utf-8'), self.level)
+        offset = self._end()
+        self.data.seek(offset)
+        self.data.write(payload)
+        self.data.flush()
+        # The block is on disk before the index points at it, so a crash never indexes half a block
+        record = (offset, len(payload), len(rows))
+        self.index.seek(0, os.SEEK_END)
+        self.index.write(INDEX.pack(*record))
+        self.index.flush()
+        self.blocks.append(record)
+
+    def write(self, text):
+        self.buffer.append((text or '').replace(SEP, ''))
+        if len(self.buffer) >= self.rows_per_block:
+            self._write_block(self.buffer)
+            self.buffer = []
+
+    def writerow(self, row):
+        self.write(row[0])
+
+    def writerows(self, rows):
+        for row in rows:
+            self.write(row[0])
+
+    def flush(self):
+        """Gets buffered rows onto disk as a short block, the next flush or full block replaces it."""
+        if self.buffer:
+            self._write_block(self.buffer)
+            self.partial = True
+
+    def close(self):
+        if self.data.closed:
+            return
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+class Corpus:
+    """
+    Reads a .corpus file.
+        len(corpus), corpus[n], for text in corpus.iter_rows(start, stop)
+        corpus.block_ranges(4) -> disjoint (first block, end block) ranges for workers
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, self.rows_per_block, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} isn't a corpus file")
+        self.blocks = _read_index(path, index_path_for(path))
+        self.starts = []  # First row number of every block
+        total = 0
+        for _, _, rows in self.blocks:
+            self.starts.append(total)
+            total += rows
+        self.rows = total
+        self.file = open(path, 'rb')
+        self.cached = (None, None)  # Last block corpus[n] decompressed, for lookups close together
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        return self.iter_rows()
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += self.rows
+        if not 0 <= n < self.rows:
+            raise IndexError(n)
+        i = self.block_of(n)
+        if self.cached[0] != i:
+            self.cached = (i, self.read_block(i))
+        return self.cached[1][n - self.starts[i]]
+
+    def close(self):
+        self.file.close()
+
+    def block_of(self, n):
+        """Which block row n is in."""
+        return bisect_right(self.starts, n) - 1
+
+    def block_offset(self, i):
+        """Where block i starts in the file, the end of the file for i == number of blocks."""
+        if i < len(self.blocks):
+            return self.blocks[i][0]
+        return self.blocks[-1][0] + self.blocks[-1][1] if self.blocks else HEADER_SIZE
+
+    def read_block(self, i):
+        offset, size, _ = self.blocks[i]
+        self.file.seek(offset)
+        return zlib.decompress(self.file.read(size)).decode('utf-8').split(SEP)
+
+    def iter_blocks(self, first=0, end=None):
+        """Yields the rows of blocks first..end-1, one list per block."""
+        for i in range(first, len(self.blocks) if end is None else end):
+            yield self.read_block(i)
+
+    def iter_rows(self, start=0, stop=None):
+        """Every row from row start up to (not including) row stop, only decompressing the blocks needed."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if start >= stop:
+            return
+        i = self.block_of(start)
+        skip = start - self.starts[i]
+        for rows in self.iter_blocks(i):
+            end = min(len(rows), skip + stop - start)
+            yield from rows[skip:end]
+            start += end - skip
+            if start >= stop:
+                return
+            skip = 0
+
+    def block_ranges(self, parts):
+        """Splits the blocks into up to `parts` contiguous (first, end) ranges with about the same rows each."""
+        ranges = []
+        first = 0
+        for part in range(1, parts + 1):
+            end = bisect_right(self.starts, self.rows * part // parts - 1) if part < parts else len(self.blocks)
+            if end > first:
+                ranges.append((first, end))
+                first = end
+        return ranges
+
+def read_range(path, first, end):
+    """Worker side of block_ranges: every row in blocks first..end-1 of the corpus at path."""
+    corpus = Corpus(path)
+    try:
+        return [row for rows in corpus.iter_blocks(first, end) for row in rows]
+    finally:
+        corpus.close()
+
+def convert_csv(csv_path, corpus_path, column='text', rows_per_block=ROWS_PER_BLOCK):
+    """
+    Copies one column of a CSV into a corpus. If the corpus already has rows from an earlier
+    conversion of the same (append only) CSV, only the rows after those get added.
+    """
+    with CorpusWriter(corpus_path, rows_per_block) as corpus:
+        skip = corpus.rows
+        added = 0
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                if i < skip:
+                    continue
+                corpus.write(row.get(column) or '')
+                added += 1
+    return added
+
+def _count_range(args):
+    return len(read_range(*args))
+
+if __name__ == "__main__":
+    # Converts a CSV and compares read speed: python Corpus.py data.csv [column] [rows per block]
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else '4chanTechBoard.csv'
+    column = sys.argv[2] if len(sys.argv) > 2 else 'text'
+    rows_per_block = int(sys.argv[3]) if len(sys.argv) > 3 else ROWS_PER_BLOCK
+    corpus_path = os.path.splitext(csv_path)[0] + '.corpus'
+
+    start = time.perf_counter()
+    added = convert_csv(csv_path, corpus_path, column, rows_per_block)
+    elapsed = time.perf_counter() - start
+    csv_size = os.path.getsize(csv_path)
+    corpus_size = os.path.getsize(corpus_path) + os.path.getsize(index_path_for(corpus_path))
+    print(f"[*] Added {added:,} rows to {corpus_path} in {elapsed:.1f}s")
+    print(f"    {csv_size / 1e6:,.1f} MB CSV -> {corpus_size / 1e6:,.1f} MB corpus ({csv_size / max(corpus_size, 1):.1f}x smaller)")
+
+    def bench(name, run, size=csv_size):
+        start = time.perf_counter()
+        rows = run()
+        elapsed = time.perf_counter() - start
+        print(f"    {name:<26} {rows / elapsed:>12,.0f} rows/sec  {size / 1e6 / elapsed:>8,.1f} MB/sec of text")
+
+    def read_csv():
+        with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+            return sum(1 for row in csv.DictReader(f) if row.get(column) is not None)
+
+    corpus = Corpus(corpus_path)
+    print(f"[*] Reading {len(corpus):,} rows:")
+    bench("csv.DictReader", read_csv)
+    bench("corpus stream", lambda: sum(1 for _ in corpus.iter_rows()))
+    workers = os.cpu_count() or 1
+    ranges = corpus.block_ranges(workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        bench(f"corpus, {workers} workers", lambda: sum(pool.map(_count_range, [(corpus_path, a, b) for a, b in ranges])))
+
+    picks = [random.randrange(len(corpus)) for _ in range(1000)]
+    start = time.perf_counter()
+    for n in picks:
+        corpus[n]
+    print(f"[*] Random row lookup: {(time.perf_counter() - start) * 1000 / len(picks):.2f} ms each")
+    corpus.close()
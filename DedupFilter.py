@@ -0,0 +1,251 @@
+import csv
+import hashlib
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+# Drops repeated posts (copypasta, bot spam, reposts) before they reach a CSV or a model.
+# Every post is reduced to a 64-bit hash and kept in an on-disk hash table that is mmap'd
+# rather than loaded, so a store with tens of millions of posts costs 8 bytes a post on disk
+# and only the pages being touched in RAM. Optionally a MinHash/LSH pass also catches posts
+# that are the same copypasta with a word or two changed.
+
+HEADER = struct.Struct('<8sQQ')  # magic, capacity, count
+HEADER_SIZE = 64
+MAGIC = b'MKDEDUP1'
+MAX_LOAD = 0.7
+
+# MinHash: 32 hashes in 4 bands of 8, so posts sharing roughly 85%+ of their word 3-grams collide
+NUM_PERM = 32
+BANDS = 4
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+MIN_NEAR_WORDS = 6  # Shorter posts are only checked for exact repeats
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)  # Fixed seed, signatures have to match across runs
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(NUM_PERM)]
+
+TOP_REPEATS = 1000  # How many distinct repeated posts the report keeps track of
+
+def hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little') or 1
+
+def normalize(text):
+    """Case and spacing differences don't make a post new."""
+    return " ".join(text.lower().split())
+
+class HashSetFile:
+    """
+    A set of 64-bit hashes in a file: one open addressing table, mmap'd, that doubles
+    when it gets 70% full. 0 marks an empty slot, so hashes are never 0.
+    """
+    def __init__(self, path, capacity=1 << 20, fresh=False):
+        self.path = path
+        if fresh or not os.path.exists(path):
+            capacity = 1 << max(capacity - 1, 1).bit_length()
+            self._create(path, capacity)
+        self._open()
+
+    @staticmethod
+    def _create(path, capacity):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, capacity, 0).ljust(HEADER_SIZE, b'\0'))
+            f.truncate(HEADER_SIZE + capacity * 8)
+
+    def _open(self):
+        self.file = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, self.capacity, self.count = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} isn't a dedup store")
+        self.mask = self.capacity - 1
+        self.limit = int(self.capacity * MAX_LOAD)
+        self.slots = memoryview(self.mm)[HEADER_SIZE:].cast('Q')
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, h):
+        slots, mask = self.slots, self.mask
+        i = h & mask
+        while True:
+            value = slots[i]
+            if value == h:
+                return True
+            if not value:
+                return False
+            i = (i + 1) & mask
+
+    def add(self, h):
+        """True if h wasn't in the set yet."""
+        slots, mask = self.slots, self.mask
+        i = h & mask
+        while True:
+            value = slots[i]
+            if value == h:
+                return False
+            if not value:
+                slots[i] = h
+                self.count += 1
+                if self.count > self.limit:
+                    self._grow()
+                return True
+            i = (i + 1) & mask
+
+    def _grow(self):
+        tmp_path = self.path + '.tmp'
+        self._create(tmp_path, self.capacity * 2)
+        bigger = HashSetFile(tmp_path)
+        for value in self.slots:
+            if value:
+                bigger.add(value)
+        bigger.close()
+        self.close()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def flush(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, self.capacity, self.count)
+        self.mm.flush()
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.flush()
+        self.slots.release()
+        self.mm.close()
+        self.file.close()
+        self.mm = None
+
+def minhash_bands(words):
+    """One 64-bit key per LSH band for a post's word 3-grams."""
+    shingles = {zlib.crc32(" ".join(words[i:i + SHINGLE]).encode('utf-8'))
+                for i in range(len(words) - SHINGLE + 1)}
+    signature = [min((a * x + b) % _PRIME for x in shingles) for a, b in _PERMS]
+    return [hash64(struct.pack(f'<{ROWS + 1}Q', band, *signature[band * ROWS:(band + 1) * ROWS]))
+            for band in range(BANDS)]
+
+class DedupFilter:
+    """
+    dedup.add(text) -> True the first time a post shows up, False for a repeat.
+    Exact repeats are matched after lowercasing and collapsing whitespace; with near=True,
+    posts that share most of their word 3-grams with an earlier one are dropped too.
+    New hashes only go to disk on commit() (or every autocommit posts), so a run that
+    crashes doesn't leave posts marked as seen that never made it anywhere.
+    """
+    def __init__(self, path, near=False, fresh=False, autocommit=100000, expected_posts=0):
+        capacity = int(expected_posts / MAX_LOAD) + 1 if expected_posts else 1 << 20
+        self.path = path
+        self.exact = HashSetFile(path, capacity, fresh)
+        self.near = HashSetFile(path + '.lsh', capacity * BANDS, fresh) if near else None
+        self.autocommit = autocommit
+        self.pending = set()
+        self.pending_bands = set()
+        self.seen = 0
+        self.dropped_exact = 0
+        self.dropped_near = 0
+        self.repeats = {}  # normalized text -> times dropped, roughly, for the report
+
+    def __len__(self):
+        return len(self.exact) + len(self.pending)
+
+    def add(self, text):
+        self.seen += 1
+        key = normalize(text)
+        h = hash64(key.encode('utf-8'))
+        if h in self.pending or h in self.exact:
+            self.dropped_exact += 1
+            self._count_repeat(key)
+            return False
+
+        if self.near is not None:
+            words = key.split()
+            if len(words) >= MIN_NEAR_WORDS:
+                bands = minhash_bands(words)
+                if any(band in self.pending_bands or band in self.near for band in bands):
+                    self.dropped_near += 1
+                    self._count_repeat(key)
+                    return False
+                self.pending_bands.update(bands)
+
+        self.pending.add(h)
+        if self.autocommit and len(self.pending) >= self.autocommit:
+            self.commit()
+        return True
+
+    def _count_repeat(self, key):
+        # Misra-Gries: a bounded dict that still ends up holding the most repeated posts
+        repeats = self.repeats
+        if key in repeats or len(repeats) < TOP_REPEATS:
+            repeats[key] = repeats.get(key, 0) + 1
+            return
+        for other in list(repeats):
+            repeats[other] -= 1
+            if not repeats[other]:
+                del repeats[other]
+
+    def commit(self):
+        for h in self.pending:
+            self.exact.add(h)
+        self.pending.clear()
+        self.exact.flush()
+        if self.near is not None:
+            for band in self.pending_bands:
+                self.near.add(band)
+            self.pending_bands.clear()
+            self.near.flush()
+
+    def close(self):
+        self.commit()
+        self.exact.close()
+        if self.near is not None:
+            self.near.close()
+
+    def report(self, top=5):
+        """Prints what got dropped, returns the numbers too."""
+        dropped = self.dropped_exact + self.dropped_near
+        kept = self.seen - dropped
+        print(f"[*] Dedup: {self.seen:,} posts, kept {kept:,}, dropped {self.dropped_exact:,} exact repeats"
+              + (f" and {self.dropped_near:,} near duplicates" if self.near is not None else "")
+              + f" ({dropped / max(self.seen, 1):.1%})")
+        most = sorted((item for item in self.repeats.items() if item[1] > 1), key=lambda item: -item[1])[:top]
+        if most:
+            print("    Most repeated:")
+            for text, count in most:
+                print(f"    {count:>9,}x  {text[:70]}")
+        return {"seen": self.seen, "kept": kept, "exact": self.dropped_exact, "near": self.dropped_near,
+                "most_repeated": most}
+
+def store_path_for(path):
+    """Where the dedup store for a CSV or model lives, e.g. 4chanGGPT.json -> 4chanGGPT.dedup"""
+    return os.path.splitext(path)[0] + '.dedup'
+
+if __name__ == "__main__":
+    # Dedups an existing CSV: python DedupFilter.py input.csv output.csv [column] [near]
+    if len(sys.argv) < 3:
+        print("Usage: python DedupFilter.py input.csv output.csv [column] [near]")
+        sys.exit(1)
+    in_path, out_path = sys.argv[1], sys.argv[2]
+    column = sys.argv[3] if len(sys.argv) > 3 else 'text'
+    near = len(sys.argv) > 4 and sys.argv[4] == 'near'
+
+    start = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        dedup = DedupFilter(os.path.join(tmp, 'cli.dedup'), near=near)
+        with open(in_path, 'r', encoding='utf-8', newline='') as f_in, \
+             open(out_path, 'w', encoding='utf-8', newline='') as f_out:
+            writer = csv.writer(f_out)
+            writer.writerow([column])
+            for row in csv.DictReader(f_in):
+                text = row.get(column)
+                if text and dedup.add(text):
+                    writer.writerow([text])
+        dedup.close()
+        elapsed = time.time() - start
+        dedup.report(top=10)
+        print(f"[*] {dedup.seen / max(elapsed, 1e-9):,.0f} posts/sec, wrote {out_path}")
@@ -1,60 +1,33 @@
-import ijson
-import markovify
-import re
-import json
-import gc
-import sys
+from TextCleaner import DISCORD
+from TrainingEngine import DiscordSource, train
 
 INPUT_JSON = 'FileNameForMessagesFromDiscordChatExporter.json'
 MODEL_NAME = 'name_hereGPT.json'
 BATCH_SIZE = 50000  # Number of messages to process before merging
-
-def clean_text(text):
-    if not text: return None
-    text = re.sub(r'<@!?\d+>|<@&\d+>|http\S+', '', text).strip()
-    return text if len(text) > 1 else None
+WORKERS = 1  # Set above 1 to build batches on several cores at once
+MEMORY_LIMIT_MB = None  # Set (e.g. 4000) to spill counts to disk when the dump won't fit in RAM
+BINARY_MODEL = True  # Also write a .bin next to the JSON for MainBot's 'mmap' backend
+PRUNE_MIN_COUNT = 1  # Drop transitions seen fewer times than this before exporting
+PRUNE_MAX_FANOUT = None  # Keep at most this many next words per state
+MODEL_SIZE_BUDGET_MB = None  # Keep raising PRUNE_MIN_COUNT until the exported model fits in this many MB
+DELTA_TRAINING = False  # Only train on messages newer than the last run, on top of the existing model
+CHECKPOINT_BATCHES = 10  # In delta mode, save every this many batches so an interrupted run can pick up from there
+CLEAN_WORKERS = 1  # Set above 1 to clean rows on several cores ahead of training
+DEDUP = False  # True skips posts that are exact repeats (copypasta, spam) so they don't skew the chain
+NEAR_DEDUP = False  # Also skip posts that are nearly the same as an earlier one, a lot slower
+
+# Cleaning rules for this site, see TextCleaner.py for the steps and make your own Cleaner to tweak them
+clean_text = DISCORD
+
+def source(path=None):
+    """This site's source for TrainingEngine, MultiTrainer.py uses it to mix sites into one model."""
+    return DiscordSource(path or INPUT_JSON, clean_text)
 
 def run_training():
-    combined_model = None
-    batch = []
-    count = 0
-
-    print(f"Reading {INPUT_JSON}...")
-    try:
-        with open(INPUT_JSON, 'rb') as f:
-            parser = ijson.items(f, 'messages.item')
-            
-            for msg in parser:
-                if msg.get('type') == "Default":
-                    content = clean_text(msg.get('content'))
-                    if content:
-                        batch.append(content)
-                        count += 1
-
-                if len(batch) >= BATCH_SIZE:
-                    new_model = markovify.Text(batch, state_size=2, retain_original=False)
-                    combined_model = markovify.combine([combined_model, new_model]) if combined_model else new_model
-                    batch = [] 
-                    gc.collect() 
-                    print(f"Progress: {count} messages merged...")
-
-    except KeyboardInterrupt:
-        print("\n[!] Ctrl+C detected! Attempting emergency save...")
-    
-    # This block runs whether the loop finished naturally OR was interrupted
-    if batch:
-        print(f"Merging final {len(batch)} messages...")
-        new_model = markovify.Text(batch, state_size=2, retain_original=False)
-        combined_model = markovify.combine([combined_model, new_model]) if combined_model else new_model
-
-    if combined_model:
-        print("Compiling and saving model. Do not close the window...")
-        combined_model.compile(inplace=True) 
-        with open(MODEL_NAME, 'w') as f:
-            f.write(combined_model.to_json())
-        print(f"Successfully saved {count} messages to {MODEL_NAME}")
-    else:
-        print("No data was processed.")
+    train([source()], MODEL_NAME, batch_size=BATCH_SIZE, workers=WORKERS, memory_limit_mb=MEMORY_LIMIT_MB,
+          binary_model=BINARY_MODEL, prune_min_count=PRUNE_MIN_COUNT, prune_max_fanout=PRUNE_MAX_FANOUT,
+          size_budget_mb=MODEL_SIZE_BUDGET_MB, delta=DELTA_TRAINING, checkpoint_batches=CHECKPOINT_BATCHES,
+          clean_workers=CLEAN_WORKERS, dedup=DEDUP, near_dedup=NEAR_DEDUP, samples=0)
 
 if __name__ == "__main__":
     run_training()
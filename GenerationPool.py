@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from BinaryModel import binary_path_for, load_binary_model
+from ModelIO import load_compact_model, load_model, newest_model_path
+from SeedIndex import IndexedText
+
+# Runs sentence generation somewhere other than the Discord event loop.
+# 'thread' mode shares the bot's brain with a thread pool, 'process' mode gives every
+# worker process its own copy (or its own mapping with the 'mmap' backend) so
+# generation never competes with the gateway for the GIL.
+
+_walks = threading.local()  # chain.walk calls made by the job running on this thread
+
+def count_walks(chain):
+    """Makes chain.walk count its calls, every walk is one of make_sentence's tries."""
+    walk = chain.walk
+
+    def counted_walk(init_state=None):
+        _walks.count = getattr(_walks, 'count', 0) + 1
+        return walk(init_state)
+    chain.walk = counted_walk
+
+def load_brain(model_path, backend='dict'):
+    """Loads a model the way BRAIN_BACKEND asks for, picking up what online learning saved if that's newer."""
+    if backend == 'mmap':
+        # Nothing gets parsed, pages are read from disk as replies touch them
+        brain = load_binary_model(binary_path_for(model_path))
+    elif backend == 'compact':
+        brain = load_compact_model(newest_model_path(model_path))
+    else:
+        # Parsed state by state, the file never sits in memory as one big string,
+        # plus a word -> states index so seeded replies don't scan the whole chain
+        brain = IndexedText.from_text(load_model(newest_model_path(model_path)))
+    count_walks(brain.chain)
+    return brain
+
+# --- Jobs, these run inside the pool and get the brain as their first argument ---
+
+def generate(brain, method, *args, **kwargs):
+    """Calls one of the brain's make_* methods."""
+    return getattr(brain, method)(*args, **kwargs)
+
+def traced(brain, job, *args, **kwargs):
+    """Runs job(brain, ...) and returns (its result, how many tries it took)."""
+    _walks.count = 0
+    result = job(brain, *args, **kwargs)
+    return result, _walks.count
+
+def reply_with_outcome(brain, words, tries=50):
+    """
+    Seeds with the last two words, then the last word, then gives up and makes anything.
+    Returns (response, outcome), outcome is which of those worked: 'seed2', 'seed1',
+    'fallback', or 'failed' when even that came back empty.
+    """
+    if len(words) >= 2:
+        seed = f"{words[-2]} {words[-1]}"
+        try:
+            response = brain.make_sentence_with_start(seed, strict=False, tries=tries)
+            if response:
+                return response, 'seed2'
+        except: pass
+    if len(words) >= 1:
+        seed = words[-1]
+        try:
+            response = brain.make_sentence_with_start(seed, strict=False, tries=tries)
+            if response:
+                return response, 'seed1'
+        except: pass
+    response = brain.make_sentence(tries=tries)
+    return response, 'fallback' if response else 'failed'
+
+def reply_sentence(brain, words, tries=50):
+    return reply_with_outcome(brain, words, tries)[0]
+
+# --- Process mode plumbing ---
+
+_worker_brains = None  # ModelRegistry.BrainCache of this worker process
+
+def _init_worker(backend, preload, budget_mb, reload):
+    global _worker_brains
+    from ModelRegistry import BrainCache
+    _worker_brains = BrainCache(backend, budget_mb, reload)
+    for path in preload:
+        _worker_brains.get(path)
+
+def _run_in_worker(model_path, job, args, kwargs):
+    return job(_worker_brains.get(model_path), *args, **kwargs)
+
+class GenerationPool:
+    """
+    await pool.run(model_path, job, *args) runs job(brain, *args) off the event loop.
+    At most max_concurrent jobs are handed to the pool at once, the rest wait their
+    turn here, and queue_depth says how many are waiting. If metrics (LiveMetrics.Metrics)
+    is given, how long every job waited for its turn goes into markovbot_generation_wait_seconds.
+    """
+    def __init__(self, get_brain, mode='thread', workers=4, max_concurrent=8, backend='dict', preload=(),
+                 metrics=None, budget_mb=None, reload=True):
+        # model_path -> brain, only used in thread mode. It's called on the pool's thread, so it
+        # can take its time loading a model without holding up the event loop.
+        self.get_brain = get_brain
+        self.mode = mode
+        if mode == 'process':
+            # Every worker keeps its own BrainCache with budget_mb, see ModelRegistry.py
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(backend, tuple(preload), budget_mb, reload))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='markov')
+        self.limit = asyncio.Semaphore(max_concurrent)
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.running = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.metrics = metrics
+        if metrics:
+            metrics.describe('markovbot_generation_wait_seconds', "Time a generation job waited for a free slot")
+
+    async def run(self, model_path, job, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        self.queue_depth += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        start = time.perf_counter()
+        try:
+            await self.limit.acquire()
+        finally:
+            self.queue_depth -= 1
+        self.running += 1
+        if self.metrics:
+            self.metrics.observe('markovbot_generation_wait_seconds', time.perf_counter() - start)
+        start = time.perf_counter()
+        try:
+            if self.mode == 'process':
+                return await loop.run_in_executor(self.executor, _run_in_worker, model_path, job, args, kwargs)
+            return await loop.run_in_executor(self.executor, lambda: job(self.get_brain(model_path), *args, **kwargs))
+        finally:
+            self.busy_seconds += time.perf_counter() - start
+            self.running -= 1
+            self.completed += 1
+            self.limit.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,143 @@
+import aiohttp
+import asyncio
+import html
+import random
+import re
+import time
+from urllib.parse import urlsplit
+
+# Async fetching for the imageboard scrapers.
+# Every request goes through one pooled aiohttp session, so connections get reused instead of
+# a fresh client per thread, and each host gets its own rate limit so hundreds of requests
+# can be in flight without hammering anyone. Threads are handed back as they finish so the
+# scraper can write them out straight away.
+
+class RateLimiter:
+    """Spaces requests to one host at least 1/per_second apart."""
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class BoardClient:
+    """
+    async with BoardClient(...) as client:
+        data = await client.get_json(url)
+        async for url, data in client.iter_json(urls): ...
+    get_json gives None for a 404 (thread got pruned or deleted).
+    """
+    def __init__(self, per_second=10, concurrency=100, retries=3, backoff=1.0, timeout=30,
+                 user_agent='MarkovChainBot scraper'):
+        self.per_second = per_second
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = {'User-Agent': user_agent}
+        self.limiters = {}  # host -> RateLimiter
+        self.session = None
+        self.requests = 0
+        self.failures = 0
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(timeout=self.timeout, headers=self.headers,
+                                             connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            limiter = self.limiters[host] = RateLimiter(self.per_second)
+        return limiter
+
+    async def fetch(self, url, headers=None):
+        """Returns (status, json or None, response headers), retrying rate limits, 5xx and dropped connections."""
+        limiter = self._limiter(url)
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+            await limiter.wait()
+            self.requests += 1
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 200:
+                        return 200, await response.json(content_type=None), response.headers
+                    if response.status != 429 and response.status < 500:
+                        return response.status, None, response.headers
+                    last_error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                last_error = str(e) or type(e).__name__
+        self.failures += 1
+        raise IOError(f"{url}: {last_error}")
+
+    async def get_json(self, url):
+        status, data, _ = await self.fetch(url)
+        if status == 404:
+            return None
+        if status != 200:
+            raise IOError(f"{url}: HTTP {status}")
+        return data
+
+    async def iter_fetch(self, jobs):
+        """
+        jobs yields (tag, url, request headers). Yields (tag, status, json or None, response headers)
+        in whatever order they finish, skipping ones that keep failing.
+        """
+        jobs = iter(jobs)
+        running = set()
+
+        async def one(tag, url, headers):
+            try:
+                return (tag,) + await self.fetch(url, headers)
+            except IOError as e:
+                print(f"\n[!] Skipping {e}")
+                return None
+
+        while True:
+            # Only keep about `concurrency` requests queued, a big archive shouldn't become 50k tasks
+            for job in jobs:
+                running.add(asyncio.ensure_future(one(*job)))
+                if len(running) >= self.concurrency:
+                    break
+            if not running:
+                return
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result is not None:
+                    yield result
+
+    async def iter_json(self, urls):
+        """Yields (url, json) in whatever order they finish, skipping ones that 404 or keep failing."""
+        async for url, status, data, _ in self.iter_fetch((url, url, None) for url in urls):
+            if status == 200:
+                yield url, data
+            elif status != 404:
+                print(f"\n[!] Skipping {url}: HTTP {status}")
+
+def thread_ids(threads_json):
+    """Thread numbers from a board's threads.json (the same shape on 4chan and vichan boards)."""
+    return [thread['no'] for page in threads_json or [] for thread in page.get('threads', [])]
+
+def comment_text(com):
+    """A post's 'com' HTML as plain text, the way basc_py4chan's text_comment did it."""
+    if not com:
+        return ""
+    text = html.unescape(com)
+    text = re.sub(r'<br\s*/?>', '\n', text)
+    return re.sub(r'<.+?>', '', text)
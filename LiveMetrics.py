@@ -0,0 +1,215 @@
+import asyncio
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections import deque
+
+from aiohttp import web
+
+# Live numbers from the running bot: how long replies take, how often seeds work, whether the
+# event loop is keeping up. Everything is recorded on the event loop, costs a dict lookup and a
+# couple of additions per observation, and is shown by !stats and served in Prometheus' text
+# format on a local port so Grafana or anything else can scrape it.
+
+# Bucket upper bounds in seconds, from a cached meme to a reply stuck behind a full queue
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRIES_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+RECENT = 1000  # Observations kept per histogram for the p50/p99 !stats shows
+
+def process_rss_bytes():
+    """Current resident memory of the bot, None if the platform can't say."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Prometheus style cumulative buckets plus the last RECENT values for percentiles."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, p):
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+class Metrics:
+    """
+    metrics.observe('markovbot_reply_seconds', 0.12, kind='reply')
+    metrics.incr('markovbot_replies_total', outcome='seeded')
+    metrics.gauge('markovbot_queue_depth', lambda: pool.queue_depth)  # read when scraped
+    metrics.render() -> Prometheus text, metrics.histogram(name, ...) for !stats.
+    """
+    def __init__(self):
+        self.help = {}
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.buckets = {}     # name -> bucket bounds
+        self.counters = {}    # name -> {labels: value}
+        self.gauges = {}      # name -> {labels: value or () -> value}
+        self.lag_task = None
+        self.runner = None
+
+    def describe(self, name, help_text, buckets=None):
+        self.help[name] = help_text
+        if buckets:
+            self.buckets[name] = buckets
+
+    def observe(self, name, value, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets.get(name, LATENCY_BUCKETS))
+        histogram.observe(value)
+
+    def incr(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, value, **labels):
+        """Sets a gauge, value can be a function that gets called every time it's read."""
+        self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def histogram(self, name, **labels):
+        return self.histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def counter(self, name, **labels):
+        """One labelled counter, or the sum over every label set if none are given."""
+        series = self.counters.get(name, {})
+        if labels:
+            return series.get(tuple(sorted(labels.items())), 0)
+        return sum(series.values())
+
+    def read_gauge(self, name, **labels):
+        value = self.gauges.get(name, {}).get(tuple(sorted(labels.items())))
+        return value() if callable(value) else value
+
+    # --- Prometheus text format ---
+
+    def render(self):
+        lines = []
+
+        def header(name, kind):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name, series in sorted(self.counters.items()):
+            header(name, 'counter')
+            for labels, value in series.items():
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for name, series in sorted(self.gauges.items()):
+            values = [(labels, value() if callable(value) else value) for labels, value in series.items()]
+            values = [(labels, value) for labels, value in values if value is not None]
+            if not values:
+                continue
+            header(name, 'gauge')
+            for labels, value in values:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for name, series in sorted(self.histograms.items()):
+            header(name, 'histogram')
+            for labels, histogram in series.items():
+                total = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    total += count
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', _number(bound)))} {total}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+    async def serve(self, host='127.0.0.1', port=9464):
+        """Serves render() at http://host:port/metrics until stop()."""
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    # --- Event loop lag ---
+
+    def watch_loop(self, interval=0.5, name='markovbot_event_loop_lag_seconds'):
+        """Sleeps interval over and over, however much later than asked it wakes up is the lag."""
+        self.describe(name, "How late the event loop woke up a sleeping task")
+
+        async def watch():
+            loop = asyncio.get_running_loop()
+            while True:
+                start = loop.time()
+                await asyncio.sleep(interval)
+                self.observe(name, max(0.0, loop.time() - start - interval))
+
+        if self.lag_task is None:
+            self.lag_task = asyncio.create_task(watch())
+
+    async def stop(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+            self.lag_task = None
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+def format_ms(histogram):
+    """'p50 12 ms | p99 340 ms' for !stats."""
+    if histogram is None or not histogram.recent:
+        return "nothing yet"
+    return f"p50 {histogram.percentile(0.5) * 1000:,.0f} ms | p99 {histogram.percentile(0.99) * 1000:,.0f} ms"
+
+if __name__ == "__main__":
+    # Serves some fake numbers to check a Prometheus setup against: python LiveMetrics.py [port]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9464
+
+    async def demo():
+        import random
+        metrics = Metrics()
+        metrics.describe('markovbot_demo_seconds', "Random latencies")
+        metrics.watch_loop()
+        await metrics.serve(port=port)
+        print(f"[*] Serving on http://127.0.0.1:{port}/metrics, Ctrl+C to stop")
+        start = time.time()
+        metrics.gauge('markovbot_uptime_seconds', lambda: time.time() - start)
+        while True:
+            metrics.observe('markovbot_demo_seconds', random.expovariate(20))
+            metrics.incr('markovbot_demo_total')
+            await asyncio.sleep(0.1)
+
+    try:
+        asyncio.run(demo())
+    except KeyboardInterrupt:
+        pass
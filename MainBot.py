@@ -1,18 +1,46 @@
-import requests
 import io
+import os
+import asyncio
 import discord
 from discord.ext import commands
-import markovify
 import sys
 import random
 import time
-import json
-import os
+from GenerationPool import GenerationPool, generate, reply_with_outcome, traced
+from LiveMetrics import TRIES_BUCKETS, Metrics, format_ms, process_rss_bytes
+from MemeClient import MemeBlocked, MemeClient, MemeError
+from ModelIO import learned_path_for
+from ModelRegistry import BrainCache, ModelChoices
+from OnlineLearning import OnlineLearner
+from SentencePool import BUCKETS, SentencePool
+from StatsStore import StatsStore
 
 # --- CONFIGURATION ---
 TOKEN = 'YOUR_TOKEN_HERE'
-MODEL_NAME = 'ExportedMarkovChainModel.json'
-STATS_FILE = 'bot_stats.json'
+MODEL_NAME = 'ExportedMarkovChainModel.json'  # The default brain, loaded at startup
+MODELS = {}  # More brains servers and channels can switch to with !model, e.g. {'4chan': '4chanGGPT.json', 'soy': 'SoyjakPartySoyGPT.json'}
+MODEL_CHOICES = 'model_choices.json'  # Which server and channel picked which model
+MODEL_MEMORY_MB = None  # Drop the least recently used brains once the loaded ones go over this, None keeps them all
+RELOAD_MODELS = True  # Swap a brain out when its file changes on disk (e.g. a trainer finished), no restart needed
+STATS_DB = 'bot_stats.db'
+STATS_FILE = 'bot_stats.json'  # Old global stats, copied into STATS_DB the first time
+STATS_FLUSH_SECONDS = 30  # How often stats get written to disk
+BRAIN_BACKEND = 'dict'  # 'compact' keeps the chain in flat arrays, a fraction of the RAM, 'mmap' maps the trainer's .bin file
+GENERATION_MODE = 'thread'  # 'process' gives each worker its own copy of the brain, best paired with 'mmap'
+GENERATION_WORKERS = 4
+MAX_CONCURRENT_GENERATIONS = 8  # Anything past this waits in line instead of piling onto the workers
+SENTENCE_POOL_SIZE = 50  # Ready-made sentences kept per length for chatter/greentext/meme, 0 turns it off
+ONLINE_LEARNING = False  # Keep learning from chat, needs BRAIN_BACKEND = 'dict' and GENERATION_MODE = 'thread'
+LEARN_BATCH_SIZE = 50  # Messages buffered before they get folded into the brain
+CHECKPOINT_MINUTES = 10  # How often the learned brain gets saved
+CHECKPOINT_NAME = learned_path_for(MODEL_NAME)  # Where it gets saved, the bot starts from it when it's newer than MODEL_NAME
+MEMEGEN_URL = 'https://api.memegen.link'  # Any memegen-compatible server works, e.g. one you host yourself
+MEME_CACHE_DIR = 'meme_cache'  # Rendered memes are kept here so repeats don't hit the API
+MEME_CACHE_MB = 100
+MEME_TEXT_ATTEMPTS = 3  # How many different texts to try when the API blocks one
+METRICS_PORT = 9464  # Prometheus metrics at http://127.0.0.1:9464/metrics, None turns it off
+METRICS_HOST = '127.0.0.1'  # Only this machine can read them, '0.0.0.0' opens them to the network
+LOOP_LAG_INTERVAL = 0.5  # How often the event loop gets checked for lag, in seconds
 # ---------------------
 
 class CondoBot(commands.Bot):
@@ -21,55 +49,136 @@ class CondoBot(commands.Bot):
         intents.message_content = True
         super().__init__(command_prefix='!', intents=intents)
         
-        self.brain = None
+        self.brains = None
+        self.choices = ModelChoices({'default': MODEL_NAME, **MODELS}, 'default', MODEL_CHOICES)
+        self.generator = None
+        self.sentences = None
+        self.learner = None
+        self.metrics = Metrics()
+        self.metrics.describe('markovbot_reply_seconds', "Time to make a reply to a ping or reply, queue included")
+        self.metrics.describe('markovbot_generation_seconds', "Time to make a sentence for chatter and the sentence pool, queue included")
+        self.metrics.describe('markovbot_generation_tries', "Sentences markovify walked before one passed, per generation", TRIES_BUCKETS)
+        self.metrics.describe('markovbot_replies_total', "Replies by what worked: seed2 and seed1 are the seeded tries, fallback is an unseeded sentence")
+        self.metrics.describe('markovbot_model_memory_bytes', "Memory held by the loaded models")
+        self.metrics.describe('markovbot_process_resident_memory_bytes', "Resident memory of the whole bot")
+        self.memes = MemeClient(MEMEGEN_URL, MEME_CACHE_DIR, MEME_CACHE_MB, metrics=self.metrics)
         self.chat_chance = 0.01
         self.start_time = time.time()
         
-        # Load persistent stats
-        stats = self.load_stats()
-        self.messages_seen = stats.get("messages_seen", 0)
-        self.responses_sent = stats.get("responses_sent", 0)
-        self.random_chats = stats.get("random_chats", 0)
-
-    def load_stats(self):
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
-        return {"messages_seen": 0, "responses_sent": 0, "random_chats": 0}
-
-    def save_stats(self):
-        data = {
-            "messages_seen": self.messages_seen,
-            "responses_sent": self.responses_sent,
-            "random_chats": self.random_chats
-        }
-        with open(STATS_FILE, 'w') as f:
-            json.dump(data, f)
+        # Load persistent stats, per server and channel
+        self.stats = StatsStore(STATS_DB, STATS_FLUSH_SECONDS, legacy_json=STATS_FILE)
 
     async def setup_hook(self):
+        self.stats.start()
+        self.metrics.watch_loop(LOOP_LAG_INTERVAL)
         print("🧠 Loading 1M message brain...")
         try:
-            with open(MODEL_NAME, 'r', encoding='utf-8') as f:
-                model_json = f.read()
-            self.brain = markovify.Text.from_json(model_json)
+            if GENERATION_MODE == 'process':
+                # The workers load their own brains, the bot itself never touches one
+                self.generator = GenerationPool(self.get_brain, 'process', GENERATION_WORKERS,
+                                                MAX_CONCURRENT_GENERATIONS, BRAIN_BACKEND, preload=[MODEL_NAME],
+                                                metrics=self.metrics, budget_mb=MODEL_MEMORY_MB, reload=RELOAD_MODELS)
+                await self.generator.run(MODEL_NAME, generate, 'make_sentence', tries=1)
+            else:
+                # Other models load the first time a server or channel that picked them needs one
+                self.brains = BrainCache(BRAIN_BACKEND, MODEL_MEMORY_MB, RELOAD_MODELS, on_reload=self.model_reloaded)
+                await asyncio.to_thread(self.brains.get, MODEL_NAME)
+                self.metrics.gauge('markovbot_model_memory_bytes', self.brains.memory_usage)
+                self.metrics.gauge('markovbot_models_loaded', lambda: len(self.brains.brains))
+                self.generator = GenerationPool(self.get_brain, 'thread', GENERATION_WORKERS,
+                                                MAX_CONCURRENT_GENERATIONS, BRAIN_BACKEND, metrics=self.metrics)
+            if ONLINE_LEARNING:
+                if GENERATION_MODE == 'thread' and BRAIN_BACKEND == 'dict':
+                    # The learner writes into this exact brain, so it never gets dropped or swapped
+                    self.brains.pin(MODEL_NAME)
+                    self.learner = OnlineLearner(self.brains.get(MODEL_NAME), CHECKPOINT_NAME, LEARN_BATCH_SIZE,
+                                                 checkpoint_seconds=CHECKPOINT_MINUTES * 60)
+                    self.learner.start()
+                    print("📚 Online learning is on")
+                else:
+                    print("⚠️ Online learning needs BRAIN_BACKEND = 'dict' and GENERATION_MODE = 'thread', leaving it off")
+            self.sentences = SentencePool(self.generate, lambda: self.generator.queue_depth == 0, SENTENCE_POOL_SIZE)
+            self.sentences.start()
             print("✅ Brain Loaded!")
         except Exception as e:
             print(f"❌ Failed to load model: {e}")
             sys.exit(1)
 
+        self.metrics.gauge('markovbot_process_resident_memory_bytes', process_rss_bytes)
+        self.metrics.gauge('markovbot_generation_queue_depth', lambda: self.generator.queue_depth)
+        self.metrics.gauge('markovbot_generation_running', lambda: self.generator.running)
+        for name in ('messages_seen', 'responses_sent', 'random_chats'):
+            self.metrics.gauge(f'markovbot_{name}', lambda name=name: self.stats.total(name))
+        if METRICS_PORT:
+            try:
+                await self.metrics.serve(METRICS_HOST, METRICS_PORT)
+                print(f"📈 Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"⚠️ Couldn't serve metrics on port {METRICS_PORT}: {e}")
+
+    def model_reloaded(self, model_path):
+        """Called from the reloading thread once a changed model file is swapped in."""
+        if model_path == MODEL_NAME:
+            # Pooled sentences came from the old brain
+            self.loop.call_soon_threadsafe(self.sentences.clear)
+
+    async def close(self):
+        if self.sentences:
+            self.sentences.stop()
+        if self.learner:
+            print("💾 Saving what the brain learned...")
+            await self.learner.stop()
+        await self.metrics.stop()
+        await asyncio.to_thread(self.stats.stop)
+        await self.memes.close()
+        if self.generator:
+            self.generator.shutdown()
+        await super().close()
+
+    def get_brain(self, model_path):
+        # Runs on a generation thread, a model that isn't loaded yet gets loaded right there
+        return self.brains.get(model_path)
+
+    async def generate(self, method, *args, model_path=MODEL_NAME, **kwargs):
+        """Runs brain.<method>(...) on the generation pool."""
+        start = time.perf_counter()
+        sentence, tries = await self.generator.run(model_path, traced, generate, method, *args, **kwargs)
+        job = f"{method}({', '.join(map(str, args))})"
+        self.metrics.observe('markovbot_generation_seconds', time.perf_counter() - start, job=job)
+        self.metrics.observe('markovbot_generation_tries', tries, job=job)
+        return sentence
+
+    async def sentence(self, bucket, model_path=MODEL_NAME):
+        """A sentence for chatter, !greentext or !meme. Only the default model has a pool, other models make one on the spot."""
+        if model_path == MODEL_NAME:
+            return await self.sentences.get(bucket)
+        method, args, kwargs = BUCKETS[bucket]
+        return await self.generate(method, *args, model_path=model_path, **kwargs)
+
+    async def reply(self, words, model_path=MODEL_NAME):
+        """Makes a reply seeded with what they said, recording how long it took and which seed worked."""
+        start = time.perf_counter()
+        (response, outcome), tries = await self.generator.run(model_path, traced, reply_with_outcome, words, tries=50)
+        self.metrics.observe('markovbot_reply_seconds', time.perf_counter() - start)
+        self.metrics.observe('markovbot_generation_tries', tries, job='reply')
+        self.metrics.incr('markovbot_replies_total', outcome=outcome)
+        return response
+
     async def on_message(self, message):
         if message.author.bot:
             return
 
-        self.messages_seen += 1
-        if self.messages_seen % 10 == 0:
-            self.save_stats()
+        guild_id = message.guild.id if message.guild else None
+        self.stats.incr('messages_seen', guild_id, message.channel.id)
 
         await self.process_commands(message)
 
         if message.content.startswith(self.command_prefix):
             return
 
+        if self.learner:
+            self.learner.add(message.content)
+
         is_pinged = self.user.mentioned_in(message)
         is_reply = False
         if message.reference:
@@ -82,25 +191,18 @@ class CondoBot(commands.Bot):
         if is_pinged or is_reply or random_chatter:
             clean_content = message.content.replace(f'<@!{self.user.id}>', '').replace(f'<@{self.user.id}>', '').strip()
             words = clean_content.split()
-            response = None
-
-            if len(words) >= 2:
-                seed = f"{words[-2]} {words[-1]}"
-                try: response = self.brain.make_sentence_with_start(seed, strict=False, tries=50)
-                except: pass
-            if not response and len(words) >= 1:
-                seed = words[-1]
-                try: response = self.brain.make_sentence_with_start(seed, strict=False, tries=50)
-                except: pass
-            if not response:
-                response = self.brain.make_sentence(tries=50)
+            model_path = self.choices.path_for(guild_id, message.channel.id)
+            if is_pinged or is_reply:
+                response = await self.reply(words, model_path)
+            else:
+                # Nobody asked, so it doesn't need to be about what they said
+                response = await self.sentence('chatter', model_path)
 
             if response:
                 if random_chatter and not (is_pinged or is_reply):
-                    self.random_chats += 1
+                    self.stats.incr('random_chats', guild_id, message.channel.id)
                 
-                self.responses_sent += 1
-                self.save_stats() 
+                self.stats.incr('responses_sent', guild_id, message.channel.id)
                 
                 async with message.channel.typing():
                     if is_pinged or is_reply:
@@ -119,9 +221,47 @@ async def stats(ctx):
     
     embed = discord.Embed(title="📊 FernsClubGPT Lifetime Stats", color=discord.Color.green())
     embed.add_field(name="Session Uptime", value=f"{hours}h {minutes}m {seconds}s", inline=False)
-    embed.add_field(name="Lifetime Messages Seen", value=f"{bot.messages_seen:,}", inline=True)
-    embed.add_field(name="Lifetime Responses", value=f"{bot.responses_sent:,}", inline=True)
-    embed.add_field(name="Lifetime Random Chimes", value=f"{bot.random_chats:,}", inline=True)
+    embed.add_field(name="Lifetime Messages Seen", value=f"{bot.stats.total('messages_seen'):,}", inline=True)
+    embed.add_field(name="Lifetime Responses", value=f"{bot.stats.total('responses_sent'):,}", inline=True)
+    embed.add_field(name="Lifetime Random Chimes", value=f"{bot.stats.total('random_chats'):,}", inline=True)
+    if ctx.guild:
+        here = {name: bot.stats.guild(ctx.guild.id, name) for name in ('messages_seen', 'responses_sent', 'random_chats')}
+        channel = bot.stats.channel(ctx.guild.id, ctx.channel.id, 'messages_seen')
+        embed.add_field(name="This Server", value=f"{here['messages_seen']:,} seen ({channel:,} in this channel) | {here['responses_sent']:,} responses | {here['random_chats']:,} random chimes", inline=False)
+    embed.add_field(name="Generation Queue", value=f"{bot.generator.queue_depth} waiting / {bot.generator.running} running (peak {bot.generator.peak_queue_depth})", inline=False)
+    pool = bot.sentences
+    levels = " / ".join(f"{name} {count}" for name, count in pool.fill_levels().items())
+    embed.add_field(name="Sentence Pool", value=f"{pool.hit_rate():.0%} hits ({pool.hits:,} hit, {pool.misses:,} missed) | refill {pool.refill_rate():.1f}/s | {levels}", inline=False)
+    metrics = bot.metrics
+    replies = {outcome: metrics.counter('markovbot_replies_total', outcome=outcome)
+               for outcome in ('seed2', 'seed1', 'fallback', 'failed')}
+    total_replies = sum(replies.values())
+    if total_replies:
+        seeded = replies['seed2'] + replies['seed1']
+        tries = metrics.histogram('markovbot_generation_tries', job='reply')
+        embed.add_field(name="Replies", value=f"{format_ms(metrics.histogram('markovbot_reply_seconds'))} | "
+                        f"{seeded / total_replies:.0%} seeded ({replies['seed2']:,} two words, {replies['seed1']:,} one word), "
+                        f"{replies['fallback']:,} fell back, {replies['failed']:,} failed | "
+                        f"{tries.sum / max(tries.count, 1):,.1f} tries each", inline=False)
+    chatter = metrics.histogram('markovbot_generation_seconds', job='make_sentence()')
+    embed.add_field(name="Latency", value=f"Making sentences {format_ms(chatter)}\n"
+                    f"Event loop lag {format_ms(metrics.histogram('markovbot_event_loop_lag_seconds'))}\n"
+                    f"Waiting for the pool {format_ms(metrics.histogram('markovbot_generation_wait_seconds'))}", inline=False)
+    embed.add_field(name="Meme API", value=f"{format_ms(metrics.histogram('markovbot_meme_request_seconds', status=200))} | "
+                    f"cache {bot.memes.hits:,} hits, {bot.memes.misses:,} misses", inline=False)
+    memory = []
+    if bot.brains:
+        loaded = ", ".join(os.path.basename(path) for path, _ in bot.brains.loaded())
+        memory.append(f"models {bot.brains.memory_usage() / 1024 / 1024:,.1f} MB ({loaded})")
+    rss = process_rss_bytes()
+    if rss:
+        memory.append(f"whole bot {rss / 1024 / 1024:,.1f} MB")
+    if memory:
+        embed.add_field(name="Memory", value=" | ".join(memory), inline=False)
+    if bot.learner:
+        learner = bot.learner
+        embed.add_field(name="Online Learning", value=f"{learner.learned:,} messages learned ({learner.new_states:,} new states) | {len(learner.buffer)} waiting", inline=False)
+    embed.add_field(name="Model", value=f"{bot.choices.name_for(ctx.guild.id if ctx.guild else None, ctx.channel.id)} (!model to switch)", inline=False)
     embed.set_footer(text=f"Current Chat Chance: {bot.chat_chance * 100}%")
     await ctx.send(embed=embed)
 
@@ -131,6 +271,26 @@ async def setchance(ctx, percentage: float):
     bot.chat_chance = percentage / 100
     await ctx.send(f"✅ Random chat chance set to **{percentage}%**")
 
+@bot.command(name='model')
+async def model_command(ctx, name: str = None, where: str = 'server'):
+    """!model lists the models, !model <name> switches this server, !model <name> channel just this channel."""
+    if name is None:
+        current = bot.choices.name_for(ctx.guild.id if ctx.guild else None, ctx.channel.id)
+        names = ", ".join(f"**{n}**" if n == current else n for n in bot.choices.models)
+        await ctx.send(f"🧠 Models: {names}")
+        return
+    if ctx.guild and not ctx.author.guild_permissions.manage_guild:
+        await ctx.send("❌ You need Manage Server to switch models.")
+        return
+    if name not in bot.choices.models:
+        await ctx.send(f"❌ No model called {name}, try !model to see them.")
+        return
+    channel_id = ctx.channel.id if where == 'channel' or not ctx.guild else None
+    # Picking the default again just clears the choice so it follows the server (or MODEL_NAME) again
+    bot.choices.choose(None if name == 'default' else name, ctx.guild.id if ctx.guild else None, channel_id)
+    now = bot.choices.name_for(ctx.guild.id if ctx.guild else None, ctx.channel.id)
+    await ctx.send(f"✅ {'This channel' if channel_id else 'This server'} now uses **{now}**. It loads the first time it's needed.")
+
 @bot.command()
 async def greentext(ctx):
     """Generates a short story in 4chan greentext style as plain text."""
@@ -138,8 +298,9 @@ async def greentext(ctx):
     lines = [r"\>be me"]
     num_lines = random.randint(2, 4)
     
-    for _ in range(num_lines):
-        line = bot.brain.make_short_sentence(100, tries=50)
+    model_path = bot.choices.path_for(ctx.guild.id if ctx.guild else None, ctx.channel.id)
+    generated = await asyncio.gather(*(bot.sentence('short100', model_path) for _ in range(num_lines)))
+    for line in generated:
         if line:
             lines.append(fr"\>{line.lower()}")
     
@@ -158,47 +319,33 @@ async def meme(ctx):
     ]
     template = random.choice(templates)
 
-    # 1. Generate text
-    top_raw = bot.brain.make_short_sentence(40) or "I THINK"
-    bottom_raw = bot.brain.make_short_sentence(40) or "THEREFORE I MARKOV"
-
-    # 2. Basic filter to avoid API blocks
-    # Swaps common filtered words with meme-friendly alternatives
+    # Swaps common filtered words with meme-friendly alternatives to avoid API blocks
     def filter_text(t):
         bad_words = {"fucking": "hecking", "shit": "stuff", "hell": "heck"}
         words = t.split()
         return " ".join([bad_words.get(w.lower(), w) for w in words])
 
-    top_raw = filter_text(top_raw).strip(".,!?;: ")
-    bottom_raw = filter_text(bottom_raw).strip(".,!?;: ")
+    for attempt in range(MEME_TEXT_ATTEMPTS):
+        if attempt:
+            await ctx.send("⚠️ The API blocked that specific text. Trying again with new text...")
 
-    # 3. Precise cleaning function for memegen.link
-    def clean(t):
-        return (t.replace("?", "~q")
-                 .replace("/", "~s")
-                 .replace("#", "~h")
-                 .replace("%", "~p")
-                 .replace(".", "~d") 
-                 .replace("'", "''")
-                 .replace(" ", "_"))
+        # 1. Generate text
+        model_path = bot.choices.path_for(ctx.guild.id if ctx.guild else None, ctx.channel.id)
+        top_raw, bottom_raw = await asyncio.gather(bot.sentence('short40', model_path), bot.sentence('short40', model_path))
+        top_raw = filter_text(top_raw or "I THINK").strip(".,!?;: ")
+        bottom_raw = filter_text(bottom_raw or "THEREFORE I MARKOV").strip(".,!?;: ")
 
-    # 4. Construct the URL
-    url = f"https://api.memegen.link/images/{template}/{clean(top_raw)}/{clean(bottom_raw)}.png"
+        # 2. Render it, the same meme twice comes straight from the cache
+        try:
+            image = await bot.memes.render(template, top_raw, bottom_raw)
+        except MemeBlocked:
+            continue
+        except MemeError as e:
+            await ctx.send(f"❌ {e}. Try again!")
+            return
+        await ctx.send(file=discord.File(fp=io.BytesIO(image), filename="meme.png"))
+        return
+
+    await ctx.send("❌ The API blocked every text I tried. Try again!")
 
-    try:
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            image_bytes = io.BytesIO(response.content)
-            await ctx.send(file=discord.File(fp=image_bytes, filename="meme.png"))
-        elif response.status_code == 403:
-            await ctx.send("⚠️ The API blocked that specific text. Trying again with new text...")
-            await ctx.invoke(bot.get_command('meme')) # Auto-retry
-        else:
-            print(f"DEBUG: Failed URL -> {url}")
-            await ctx.send(f"❌ API Error {response.status_code}. Try again!")
-            
-    except Exception as e:
-        await ctx.send(f"❌ Connection error: {e}")
-        
 bot.run(TOKEN)
@@ -0,0 +1,152 @@
+import aiohttp
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+# Renders !meme images through memegen.link without blocking the bot.
+# One pooled aiohttp session for every request, a few retries with backoff when the API
+# hiccups, and rendered images kept on disk so the same meme is only ever fetched once.
+
+class MemeBlocked(Exception):
+    """memegen refused the text (403), retrying the same text won't help."""
+
+class MemeError(Exception):
+    """memegen kept failing or couldn't be reached."""
+
+def clean(t):
+    """Escapes text for a memegen.link URL path."""
+    return (t.replace("?", "~q")
+             .replace("/", "~s")
+             .replace("#", "~h")
+             .replace("%", "~p")
+             .replace(".", "~d")
+             .replace("'", "''")
+             .replace(" ", "_"))
+
+class MemeClient:
+    """
+    await memes.render(template, top, bottom) -> PNG bytes.
+    base_url can point at any memegen-compatible server, e.g. a local one for testing.
+    With metrics (LiveMetrics.Metrics) every request to the API is timed by status.
+    """
+    def __init__(self, base_url='https://api.memegen.link', cache_dir='meme_cache', cache_size_mb=100,
+                 retries=3, backoff=0.5, timeout=10, max_connections=8, metrics=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size_mb * 1024 * 1024
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self.session = None
+        self.inflight = {}  # url -> task, so the same meme asked for twice is only fetched once
+        self.hits = 0
+        self.misses = 0
+        self.metrics = metrics
+        if metrics:
+            metrics.describe('markovbot_meme_request_seconds', "memegen API request time, by HTTP status")
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def url_for(self, template, top, bottom):
+        return f"{self.base_url}/images/{template}/{clean(top)}/{clean(bottom)}.png"
+
+    async def render(self, template, top, bottom):
+        url = self.url_for(template, top, bottom)
+        cached = await asyncio.to_thread(self._cache_get, url)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        task = self.inflight.get(url)
+        if task is None:
+            task = self.inflight[url] = asyncio.ensure_future(self._fetch(url))
+            task.add_done_callback(lambda _: self.inflight.pop(url, None))
+        # shield so one impatient caller getting cancelled doesn't cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def _fetch(self, url):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout,
+                                                 connector=aiohttp.TCPConnector(limit=self.max_connections))
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+            start = time.perf_counter()
+            try:
+                async with self.session.get(url) as response:
+                    if response.status == 200:
+                        data = await response.read()
+                        self._observe(start, response.status)
+                        await asyncio.to_thread(self._cache_put, url, data)
+                        return data
+                    self._observe(start, response.status)
+                    if response.status == 403:
+                        raise MemeBlocked(url)
+                    last_error = MemeError(f"API Error {response.status}")
+                    # Anything but rate limits and server errors won't fix itself
+                    if response.status != 429 and response.status < 500:
+                        raise last_error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._observe(start, 'error')
+                last_error = MemeError(f"Connection error: {e}")
+        print(f"DEBUG: Failed URL -> {url}")
+        raise last_error
+
+    def _observe(self, start, status):
+        if self.metrics:
+            self.metrics.observe('markovbot_meme_request_seconds', time.perf_counter() - start, status=status)
+
+    # --- Disk cache, least recently used images go first once it's over cache_size ---
+
+    def _cache_path(self, url):
+        key = hashlib.sha1(url[len(self.base_url):].encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def _cache_get(self, url):
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(url)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # Mark it as recently used
+        return data
+
+    def _cache_put(self, url, data):
+        if not self.cache_dir:
+            return
+        path = self._cache_path(url)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.cache_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
@@ -0,0 +1,107 @@
+import ijson
+import json
+import os
+import markovify
+from markovify.chain import accumulate
+from CompactChain import CompactChain, CompactText
+
+# Streaming save/load for model JSON files.
+# markovify's to_json/from_json build the whole document as one string on top of the model,
+# these go state by state so only one state is ever held as text.
+#
+# Files are written as {"state_size": 2, "chain": [[state, next], ...], "parsed_sentences": null}.
+# That's the same object markovify.Text.to_json writes except "chain" is a real list instead
+# of a JSON string, and markovify.Text.from_json loads both.
+
+def iter_chain_items(chain):
+    """Yields (state, next) pairs from a markovify.Chain (compiled or not) or a CompactChain."""
+    if isinstance(chain, CompactChain):
+        for state, words, weights in chain.items():
+            yield state, [words, weights]
+    else:
+        yield from chain.model.items()
+
+def write_chain_items(f, state_size, items):
+    """Writes (state, next) pairs to an open text file, one state at a time."""
+    f.write(f'{{"state_size": {state_size}, "chain": [')
+    sep = "\n"
+    for state, value in items:
+        f.write(sep + json.dumps([list(state), value]))
+        sep = ",\n"
+    f.write('\n], "parsed_sentences": null}')
+
+def write_model_items(path, state_size, items):
+    """Saves (state, next) pairs to path. The old file is only replaced once the new one is complete."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        write_chain_items(f, state_size, items)
+    os.replace(tmp_path, path)
+
+def learned_path_for(model_path):
+    """4chanGGPT.json -> 4chanGGPT_learned.json, where the bot saves what it learned from chat."""
+    return os.path.splitext(model_path)[0] + '_learned.json'
+
+def newest_model_path(model_path):
+    """
+    The learned copy of a model if there is one and it's newer than the trained model, model_path otherwise.
+    A model trained after the bot last saved what it learned wins, the learned copy was built on the old one.
+    """
+    learned = learned_path_for(model_path)
+    if not os.path.exists(learned):
+        return model_path
+    if os.path.exists(model_path) and os.path.getmtime(model_path) > os.path.getmtime(learned):
+        return model_path
+    return learned
+
+def write_model(path, text):
+    """Saves a markovify.Text (or CompactText) to path."""
+    write_model_items(path, text.state_size, iter_chain_items(text.chain))
+
+def iter_model_items(path):
+    """
+    Yields (state, next) pairs from a model file as they're parsed.
+    Old exports store the chain as one big JSON string, those can't be streamed
+    and get parsed in one go instead.
+    """
+    with open(path, 'rb') as f:
+        legacy = None
+        for prefix, event, value in ijson.parse(f):
+            if prefix == 'chain':
+                legacy = value if event == 'string' else None
+                break
+        if legacy is not None:
+            for state, value in json.loads(legacy):
+                yield tuple(state), value
+            return
+
+        f.seek(0)
+        for state, value in ijson.items(f, 'chain.item', use_float=True):
+            yield tuple(state), value
+
+def load_model(path):
+    """Loads a model file into a regular dict-backed markovify.Text."""
+    model = dict(iter_model_items(path))
+    state_size = len(next(iter(model)))
+    chain = markovify.Chain(None, state_size, model=model)
+    return markovify.Text(None, state_size=state_size, chain=chain, retain_original=False)
+
+def iter_compiled_items(path):
+    """Like iter_model_items but always (state, words, cumulative weights), compiled or not."""
+    for state, value in iter_model_items(path):
+        if isinstance(value, dict):
+            yield state, list(value.keys()), list(accumulate(value.values()))
+        else:
+            yield state, value[0], value[1]
+
+def load_compact_model(path):
+    """Loads a model file straight into a CompactText, without ever building the dict chain."""
+    items = iter_compiled_items(path)
+    first = next(items)
+    state_size = len(first[0])
+
+    def all_items():
+        yield first
+        yield from items
+
+    chain = CompactChain.from_items(state_size, all_items())
+    return CompactText(None, state_size=state_size, chain=chain, retain_original=False)
@@ -0,0 +1,199 @@
+import json
+import random
+import sys
+from markovify.chain import BEGIN, END, accumulate
+from markovify.text import ParamError
+from ModelIO import load_model, write_model
+
+# Shrinks a compiled model before it gets exported.
+# Rare transitions (every one-off bump post) make up most of a big model, dropping them
+# trades a bit of variety for a model that's a lot smaller to ship and load.
+
+def _counts(words, weights):
+    """[words, cumulative weights] -> [(word, count), ...]"""
+    prev = 0
+    pairs = []
+    for word, total in zip(words, weights):
+        pairs.append((word, total - prev))
+        prev = total
+    return pairs
+
+def _compile(pairs):
+    return [[w for w, _ in pairs], list(accumulate(c for _, c in pairs))]
+
+def model_size(model):
+    """(states, transitions, bytes) of a compiled model dict, bytes as ModelIO would write them."""
+    transitions = 0
+    size = 0
+    for state, value in model.items():
+        transitions += len(value[0])
+        size += len(json.dumps([list(state), value])) + 2
+    return len(model), transitions, size
+
+def _prune(model, state_size, min_count, max_fanout):
+    # 1. Drop rare transitions and cap how many each state keeps
+    for state, (words, weights) in list(model.items()):
+        pairs = [p for p in _counts(words, weights) if p[1] >= min_count]
+        if max_fanout and len(pairs) > max_fanout:
+            top = sorted(range(len(pairs)), key=lambda i: pairs[i][1], reverse=True)[:max_fanout]
+            pairs = [pairs[i] for i in sorted(top)]
+        if pairs:
+            if len(pairs) != len(words):
+                model[state] = _compile(pairs)
+        else:
+            del model[state]
+
+    # 2. Drop transitions into states that no longer exist, which can empty more states
+    changed = True
+    while changed:
+        changed = False
+        for state, (words, weights) in list(model.items()):
+            pairs = _counts(words, weights)
+            kept = [p for p in pairs if p[0] == END or state[1:] + (p[0],) in model]
+            if len(kept) != len(pairs):
+                changed = True
+                if kept:
+                    model[state] = _compile(kept)
+                else:
+                    del model[state]
+
+    # 3. Drop states that can't get to END anymore, a walk that ends up in one never finishes
+    parents = {}
+    finishing = set()
+    for state, (words, _) in model.items():
+        for word in words:
+            if word == END:
+                finishing.add(state)
+            else:
+                parents.setdefault(state[1:] + (word,), []).append(state)
+    stack = list(finishing)
+    while stack:
+        for parent in parents.get(stack.pop(), ()):
+            if parent not in finishing:
+                finishing.add(parent)
+                stack.append(parent)
+    for state, (words, weights) in list(model.items()):
+        if state not in finishing:
+            del model[state]
+            continue
+        pairs = _counts(words, weights)
+        kept = [p for p in pairs if p[0] == END or state[1:] + (p[0],) in finishing]
+        if len(kept) != len(pairs):
+            model[state] = _compile(kept)
+
+    # 4. Drop whatever can't be reached from the start anymore
+    begin = (BEGIN,) * state_size
+    if begin not in model:
+        raise ValueError("Pruning removed every sentence start, lower the threshold or raise the budget")
+    seen = {begin}
+    stack = [begin]
+    while stack:
+        state = stack.pop()
+        for word in model[state][0]:
+            if word != END:
+                nxt = state[1:] + (word,)
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+    for state in list(model):
+        if state not in seen:
+            del model[state]
+
+def _try_prune(model, state_size, min_count, max_fanout):
+    """_prune, but only if the result still has a sentence start, otherwise model is left alone. Returns whether it pruned."""
+    # Shallow copy is enough, _prune replaces a state's lists instead of changing them
+    trial = dict(model)
+    try:
+        _prune(trial, state_size, min_count, max_fanout)
+    except ValueError:
+        return False
+    model.clear()
+    model.update(trial)
+    return True
+
+def _sample_seeds(model, samples):
+    """Picks state-sized seeds the way MainBot seeds replies (the last two words of a message)."""
+    states = [s for s in random.sample(list(model), min(samples, len(model))) if BEGIN not in s]
+    return [" ".join(s) for s in states]
+
+def generation_success(text, seeds, samples=200):
+    """Fraction of make_short_sentence(100) calls and seeded starts that produce a sentence."""
+    short = sum(1 for _ in range(samples) if text.make_short_sentence(100, tries=10))
+    seeded = 0
+    for seed in seeds:
+        try:
+            if text.make_sentence_with_start(seed, tries=10):
+                seeded += 1
+        except (KeyError, ParamError):
+            pass
+    return short / samples, seeded / max(len(seeds), 1)
+
+def prune_model(text, min_count=1, max_fanout=None, size_budget_mb=None, samples=200):
+    """
+    Prunes a compiled markovify.Text in place and returns a report dict.
+    With size_budget_mb the count threshold keeps going up until the model fits.
+    """
+    model = text.chain.model
+    state_size = text.chain.state_size
+    seeds = _sample_seeds(model, samples)
+    before = model_size(model)
+    success_before = generation_success(text, seeds, samples)
+
+    if not _try_prune(model, state_size, min_count, max_fanout):
+        print(f"[!] Dropping transitions seen less than {min_count} times would leave no way to start a sentence, keeping the model unpruned")
+        min_count = 1
+    after = model_size(model)
+    budget_met = True
+    if size_budget_mb:
+        budget = size_budget_mb * 1024 * 1024
+        while after[2] > budget:
+            next_count = min_count + max(1, min_count // 2)
+            print(f"    [+] {after[2] / 1024 / 1024:,.1f} MB is over budget, dropping transitions seen less than {next_count} times...")
+            if not _try_prune(model, state_size, next_count, max_fanout):
+                # Going further would prune away every sentence, a model over budget beats no model
+                print(f"[!] Can't get under {size_budget_mb:,} MB without losing every sentence start, keeping {after[2] / 1024 / 1024:,.1f} MB")
+                budget_met = False
+                break
+            min_count = next_count
+            after = model_size(model)
+
+    text.find_init_states_from_chain.cache_clear()
+    success_after = generation_success(text, seeds, samples)
+    return {
+        "min_count": min_count,
+        "budget_met": budget_met,
+        "max_fanout": max_fanout,
+        "states_removed": before[0] - after[0],
+        "transitions_removed": before[1] - after[1],
+        "bytes_removed": before[2] - after[2],
+        "states": after[0],
+        "transitions": after[1],
+        "bytes": after[2],
+        "success_before": success_before,
+        "success_after": success_after,
+    }
+
+def print_report(report):
+    print(f"[*] Pruned with min count {report['min_count']}, max fan-out {report['max_fanout'] or 'unlimited'}:")
+    print(f"    States:      -{report['states_removed']:,} ({report['states']:,} left)")
+    print(f"    Transitions: -{report['transitions_removed']:,} ({report['transitions']:,} left)")
+    print(f"    Size:        -{report['bytes_removed'] / 1024 / 1024:,.1f} MB ({report['bytes'] / 1024 / 1024:,.1f} MB left)")
+    short_before, seeded_before = report['success_before']
+    short_after, seeded_after = report['success_after']
+    print(f"    Short sentence success: {short_before:.0%} -> {short_after:.0%}")
+    print(f"    Seeded reply success:   {seeded_before:.0%} -> {seeded_after:.0%}")
+    if not report['budget_met']:
+        print("[!] The model is still over the size budget, it was saved anyway")
+
+if __name__ == "__main__":
+    # Prunes an existing export to a size budget: python ModelPruning.py model.json 500 [out.json]
+    if len(sys.argv) < 3:
+        print("Usage: python ModelPruning.py model.json budget_mb [out.json]")
+        sys.exit(1)
+    src, budget_mb = sys.argv[1], float(sys.argv[2])
+    dst = sys.argv[3] if len(sys.argv) > 3 else src
+    print(f"[*] Loading {src}...")
+    text = load_model(src)
+    print_report(prune_model(text, size_budget_mb=budget_mb))
+    write_model(dst, text)
+    print(f"[*] Saved {dst}")
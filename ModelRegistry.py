@@ -0,0 +1,222 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from BinaryModel import binary_path_for
+from CompactChain import estimate_dict_chain_memory
+from GenerationPool import load_brain
+
+# Several brains in one bot. Servers and channels pick a model by name, a model is loaded the
+# first time someone needs it, and the least recently used ones get dropped once the loaded
+# brains go over a memory budget. A model file that changes on disk (a trainer finished, or
+# a new one got copied over it) is loaded again in the background while replies keep using
+# the old brain, then swapped in with one assignment.
+
+# Windows won't replace or delete a file something has mapped, so a trainer finishing while the
+# bot maps its .bin would fail to write the new one. There the bot maps a copy instead.
+MAP_COPIES = os.name == 'nt'
+
+def mapped_copy(model_path):
+    """
+    Copies model_path's .bin to one named after its version (4chanGGPT.<mtime>-<size>.bin) and
+    returns that name, the trainer's own .bin is never held open. Workers loading the same
+    version share one copy, copies of older versions go once nothing maps them anymore.
+    """
+    src = binary_path_for(model_path)
+    st = os.stat(src)
+    base = os.path.splitext(src)[0]
+    dst = f"{base}.{st.st_mtime_ns}-{st.st_size}.bin"
+    if not os.path.exists(dst):
+        tmp_path = f"{dst}.{os.getpid()}.tmp"
+        shutil.copyfile(src, tmp_path)
+        try:
+            os.replace(tmp_path, dst)
+        except PermissionError:
+            os.remove(tmp_path)  # Another worker made the same copy and already mapped it
+    folder, name = os.path.split(base)
+    old_copy = re.compile(re.escape(name) + r'\.\d+-\d+\.bin')
+    for entry in os.scandir(folder or '.'):
+        if entry.path != dst and old_copy.fullmatch(entry.name):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass  # A brain being replaced still maps it, the next reload cleans it up
+    return dst
+
+def model_version(path, backend='dict'):
+    """What the file the backend reads looks like right now, (mtime, size), None if it's missing."""
+    try:
+        st = os.stat(binary_path_for(path) if backend == 'mmap' else path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def brain_memory(brain):
+    """Bytes a loaded brain holds, the compact and mmap chains know, dict chains get estimated."""
+    chain = brain.chain
+    if hasattr(chain, 'memory_usage'):
+        return chain.memory_usage()
+    return estimate_dict_chain_memory(chain)
+
+class BrainCache:
+    """
+    brains.get(model_path) -> brain, safe to call from any thread.
+    Loads on first use, keeps the most recently used brains under budget_mb (the one just used
+    never gets dropped, so one model bigger than the budget still works), and notices files
+    changing on disk. Anything still running on a dropped or replaced brain keeps it until it's
+    done, nothing gets pulled out from under a reply.
+    """
+    def __init__(self, backend='dict', budget_mb=None, reload=True, check_seconds=5, on_reload=None):
+        self.backend = backend
+        self.budget = budget_mb * 1024 * 1024 if budget_mb else None
+        self.reload = reload
+        self.check_seconds = check_seconds  # How often a path gets stat'ed for changes, at most
+        self.on_reload = on_reload  # (model_path) -> None, called from the reloading thread
+        self.brains = OrderedDict()  # model_path -> entry dict, least recently used first
+        self.lock = threading.Lock()  # Guards self.brains, never held while loading
+        self.path_locks = {}  # model_path -> lock, so two callers don't load the same model twice
+        self.pinned = set()
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def _path_lock(self, model_path):
+        with self.lock:
+            return self.path_locks.setdefault(model_path, threading.Lock())
+
+    def _load(self, model_path):
+        version = model_version(model_path, self.backend)
+        start = time.perf_counter()
+        if self.backend == 'mmap' and MAP_COPIES:
+            brain = load_brain(mapped_copy(model_path), self.backend)
+        else:
+            brain = load_brain(model_path, self.backend)
+        return {"brain": brain, "version": version, "bytes": brain_memory(brain),
+                "seconds": time.perf_counter() - start, "checked": time.monotonic(), "reloading": False}
+
+    def get(self, model_path):
+        with self.lock:
+            entry = self.brains.get(model_path)
+            if entry is not None:
+                self.brains.move_to_end(model_path)
+        if entry is None:
+            with self._path_lock(model_path):
+                # Someone else may have loaded it while we waited for the lock
+                with self.lock:
+                    entry = self.brains.get(model_path)
+                if entry is None:
+                    entry = self._load(model_path)
+                    with self.lock:
+                        self.brains[model_path] = entry
+                        self.loads += 1
+                    print(f"🧠 Loaded {model_path} in {entry['seconds']:.1f}s ({entry['bytes'] / 1024 / 1024:,.0f} MB)")
+                    self._evict(keep=model_path)
+        elif self.reload:
+            self._check(model_path, entry)
+        return entry["brain"]
+
+    def pin(self, model_path):
+        """Never evict or reload this one, e.g. the brain online learning is writing into."""
+        self.pinned.add(model_path)
+
+    def _check(self, model_path, entry):
+        now = time.monotonic()
+        with self.lock:
+            if entry["reloading"] or model_path in self.pinned or now - entry["checked"] < self.check_seconds:
+                return
+            entry["checked"] = now
+            version = model_version(model_path, self.backend)
+            if version is None or version == entry["version"]:
+                return
+            entry["reloading"] = True
+        threading.Thread(target=self._reload, args=(model_path,), name='brain-reload', daemon=True).start()
+
+    def _reload(self, model_path):
+        try:
+            fresh = self._load(model_path)
+        except Exception as e:
+            print(f"⚠️ Couldn't reload {model_path}, keeping the old brain: {e}")
+            with self.lock:
+                entry = self.brains.get(model_path)
+                if entry is not None:
+                    entry["reloading"] = False
+            return
+        with self.lock:
+            if model_path not in self.brains:
+                return  # Evicted while it was loading, the next get loads it fresh anyway
+            # One assignment, replies already running finish on the old brain
+            self.brains[model_path] = fresh
+            self.reloads += 1
+        print(f"🔄 Reloaded {model_path} in {fresh['seconds']:.1f}s")
+        self._evict(keep=model_path)
+        if self.on_reload:
+            self.on_reload(model_path)
+
+    def _evict(self, keep):
+        if not self.budget:
+            return
+        with self.lock:
+            for model_path in list(self.brains):
+                if self.memory_usage() <= self.budget:
+                    break
+                if model_path == keep or model_path in self.pinned:
+                    continue
+                del self.brains[model_path]
+                self.evictions += 1
+                print(f"📤 Dropped {model_path} to stay under the model memory budget")
+
+    def memory_usage(self):
+        return sum(entry["bytes"] for entry in self.brains.values())
+
+    def loaded(self):
+        """[(model_path, bytes)], most recently used last."""
+        with self.lock:
+            return [(model_path, entry["bytes"]) for model_path, entry in self.brains.items()]
+
+class ModelChoices:
+    """
+    Which model every server and channel uses, by name from models ({name: model path}).
+    A channel's choice beats its server's, which beats default. Saved to path as JSON.
+    """
+    def __init__(self, models, default, path='model_choices.json'):
+        if default not in models:
+            raise ValueError(f"Default model {default} isn't in MODELS")
+        self.models = models
+        self.default = default
+        self.path = path
+        self.guilds = {}
+        self.channels = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            # Choices of models that were removed from MODELS fall back to the default
+            self.guilds = {int(k): v for k, v in saved.get("guilds", {}).items() if v in models}
+            self.channels = {int(k): v for k, v in saved.get("channels", {}).items() if v in models}
+
+    def name_for(self, guild_id=None, channel_id=None):
+        return self.channels.get(channel_id) or self.guilds.get(guild_id) or self.default
+
+    def path_for(self, guild_id=None, channel_id=None):
+        return self.models[self.name_for(guild_id, channel_id)]
+
+    def choose(self, name, guild_id, channel_id=None):
+        """Sets a server's model, or one channel's if channel_id is given. name=None goes back to the default."""
+        if name is not None and name not in self.models:
+            raise KeyError(name)
+        choices, key = (self.channels, channel_id) if channel_id else (self.guilds, guild_id)
+        if name is None:
+            choices.pop(key, None)
+        else:
+            choices[key] = name
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"guilds": self.guilds, "channels": self.channels}, f)
+        os.replace(tmp_path, self.path)
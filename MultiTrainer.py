@@ -0,0 +1,35 @@
+import importlib
+from TrainingEngine import train
+
+# Trains one model on several sites at once, each cleaned by its own trainer's rules.
+
+# Settings
+SOURCES = [
+    # (trainer script, its input file)
+    ('4chanTrainer', '4chanTechBoard.csv'),
+    ('RedditTrainer', 'ExampleDataName.csv'),
+    ('DiscordTrainer', 'FileNameForMessagesFromDiscordChatExporter.json'),
+]
+MODEL_NAME = 'MixedGPT.json'
+BATCH_SIZE = 50000
+WORKERS = 1 # Set above 1 to build batches on several cores at once
+MEMORY_LIMIT_MB = None # Set (e.g. 4000) to spill counts to disk when the dumps won't fit in RAM
+BINARY_MODEL = True # Also write a .bin next to the JSON for MainBot's 'mmap' backend
+PRUNE_MIN_COUNT = 1 # Drop transitions seen fewer times than this before exporting
+PRUNE_MAX_FANOUT = None # Keep at most this many next words per state
+MODEL_SIZE_BUDGET_MB = None # Keep raising PRUNE_MIN_COUNT until the exported model fits in this many MB
+DELTA_TRAINING = False # Only train on what got added to each source since the last run
+CHECKPOINT_BATCHES = 10 # In delta mode, save every this many batches so an interrupted run can pick up from there
+CLEAN_WORKERS = 1 # Set above 1 to clean rows on several cores ahead of training
+DEDUP = False # True skips posts that are exact repeats (copypasta, spam) so they don't skew the chain
+NEAR_DEDUP = False # Also skip posts that are nearly the same as an earlier one, a lot slower
+
+def run_training():
+    sources = [importlib.import_module(trainer).source(path) for trainer, path in SOURCES]
+    train(sources, MODEL_NAME, batch_size=BATCH_SIZE, workers=WORKERS, memory_limit_mb=MEMORY_LIMIT_MB,
+          binary_model=BINARY_MODEL, prune_min_count=PRUNE_MIN_COUNT, prune_max_fanout=PRUNE_MAX_FANOUT,
+          size_budget_mb=MODEL_SIZE_BUDGET_MB, delta=DELTA_TRAINING, checkpoint_batches=CHECKPOINT_BATCHES,
+          clean_workers=CLEAN_WORKERS, dedup=DEDUP, near_dedup=NEAR_DEDUP)
+
+if __name__ == "__main__":
+    run_training()
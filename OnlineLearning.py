@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from markovify.chain import compile_next
+from DiscordTrainer import clean_text
+from ModelIO import write_model
+from TrainingEngine import ChainAccumulator
+
+# Lets the bot keep learning from the channels it's in instead of only what it was trained on.
+# Messages are cleaned like DiscordTrainer does, buffered, and every so often the buffered batch
+# is counted off the event loop and folded into the live compiled chain one state at a time.
+
+class OnlineLearner:
+    """
+    learner.add(text) from on_message, learner.start() once the brain is loaded.
+    Works on the dict brain in thread mode, the one brain everything else is reading from.
+    """
+    def __init__(self, brain, checkpoint_path, batch_size=50, flush_seconds=30, checkpoint_seconds=600):
+        self.brain = brain
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.checkpoint_seconds = checkpoint_seconds
+        self.buffer = []
+        self.lock = threading.Lock()  # Held while folding or checkpointing, replies never wait on it
+        self.learned = 0
+        self.new_states = 0
+        self.dirty = False
+        self.last_checkpoint = time.time()
+        self.task = None
+
+    def add(self, text):
+        """Buffers a chat message if it survives cleaning."""
+        content = clean_text(text)
+        if content:
+            self.buffer.append(content)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._learn_loop())
+
+    async def stop(self):
+        """Folds whatever is still buffered and saves, for shutdown."""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+        if self.dirty:
+            await asyncio.to_thread(self.checkpoint)
+
+    async def flush(self):
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            await asyncio.to_thread(self.fold, batch)
+
+    async def _learn_loop(self):
+        last_flush = time.time()
+        while True:
+            await asyncio.sleep(1)
+            now = time.time()
+            if len(self.buffer) >= self.batch_size or (self.buffer and now - last_flush >= self.flush_seconds):
+                last_flush = now
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"⚠️ Online learning batch failed: {e}")
+            if self.dirty and now - self.last_checkpoint >= self.checkpoint_seconds:
+                try:
+                    await asyncio.to_thread(self.checkpoint)
+                except Exception as e:
+                    print(f"⚠️ Brain checkpoint failed: {e}")
+
+    def fold(self, batch):
+        """
+        Counts a batch and adds it to the live chain. Every touched state gets a freshly
+        compiled [words, cumdist] list swapped in, so a reply running at the same time
+        sees either the old list or the new one, never half of each.
+        """
+        counts = ChainAccumulator(self.brain.state_size)
+        counts.add_batch(batch)
+        model = self.brain.chain.model
+        with self.lock:
+            for state, options in counts.model.items():
+                current = model.get(state)
+                if current is None:
+                    model[state] = compile_next(options)
+                    self.brain.index_state(state)
+                    self.new_states += 1
+                    continue
+                merged = {}
+                prev = 0
+                for word, total in zip(*current):
+                    merged[word] = total - prev
+                    prev = total
+                for word, count in options.items():
+                    merged[word] = merged.get(word, 0) + count
+                model[state] = compile_next(merged)
+            self.learned += len(batch)
+            self.dirty = True
+
+    def checkpoint(self):
+        """Writes the brain to checkpoint_path, learning waits until it's done."""
+        start = time.time()
+        with self.lock:
+            write_model(self.checkpoint_path, self.brain)
+            self.dirty = False
+        self.last_checkpoint = time.time()
+        print(f"💾 Saved learned brain to {self.checkpoint_path} in {self.last_checkpoint - start:.1f}s")
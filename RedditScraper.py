@@ -1,30 +1,58 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import csv
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import urljoin
+from DedupFilter import DedupFilter, store_path_for
 
 # Settings
 BASE_URL = "https://redlib.perennialte.ch"
 SUBREDDIT = "animemes"
 OUTPUT_CSV = "ExampleData.csv"
 MAX_PAGES = 100  # How many pages of "Next" to click through
+THREAD_WORKERS = 8  # How many threads get fetched at once, be nice to the instance
+PARSER = 'lxml'  # Much faster than 'html.parser' if you pip install lxml, falls back to html.parser if you don't
+DEDUP = True  # Don't write comments the CSV already has, remembered across runs
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
 }
 
-def get_page_data(url):
+# Only the parts of the page we read get turned into a tree, the rest is skipped while parsing
+LISTING_PARTS = SoupStrainer('main')
+COMMENT_PARTS = SoupStrainer('div', class_='comment_body')
+
+def pick_parser():
+    if PARSER == 'lxml':
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            print("[!] lxml isn't installed, using html.parser (pip install lxml for faster parsing)")
+            return 'html.parser'
+    return PARSER
+
+def make_session():
+    """One keep-alive session shared by every worker, with a connection for each of them."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=THREAD_WORKERS + 1)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_page_data(session, parser, url):
     """Fetches a page, returns thread links and the specific pagination link."""
     try:
-        res = requests.get(url, headers=HEADERS, timeout=20)
+        res = session.get(url, timeout=20)
         res.raise_for_status()
-        soup = BeautifulSoup(res.text, 'html.parser')
-        
+        soup = BeautifulSoup(res.text, parser, parse_only=LISTING_PARTS)
+
         links = []
         main_content = soup.find('main')
-        
+
         # 1. Get Thread Links
         if main_content:
             titles = main_content.find_all(['h1', 'h2'], class_='post_title')
@@ -33,7 +61,7 @@ def get_page_data(url):
                 if a:
                     # urljoin fixes the "No scheme supplied" error
                     links.append(urljoin(BASE_URL, a['href']))
-        
+
         # 2. Find the "Next" link (main > div > footer > a)
         next_link = None
         if main_content:
@@ -50,18 +78,18 @@ def get_page_data(url):
         print(f"[!] Error fetching {url}: {e}")
         return [], None
 
-def scrape_comments(url):
+def scrape_comments(session, parser, url):
     """Extracts all text from comment bodies in a thread."""
     try:
-        res = requests.get(url, headers=HEADERS, timeout=15)
+        res = session.get(url, timeout=15)
         res.encoding = 'utf-8' # Fix character encoding artifacts
-        soup = BeautifulSoup(res.text, 'html.parser')
-        
+        soup = BeautifulSoup(res.text, parser, parse_only=COMMENT_PARTS)
+
         comments = []
         for body in soup.find_all('div', class_='comment_body'):
             md = body.find('div', class_='md')
             text = md.get_text(strip=True) if md else body.get_text(strip=True)
-            
+
             # Filter out bot noise and removed posts
             if text and "I am a bot" not in text and "[removed]" not in text:
                 comments.append(text)
@@ -73,49 +101,86 @@ def scrape_comments(url):
 def run_scrape():
     current_url = f"{BASE_URL}/r/{SUBREDDIT}?sort=hot"
     pages_scraped = 0
+    threads_done = 0
     total_comments = 0
+    start = time.time()
+    parser = pick_parser()
+    session = make_session()
+
+    print(f"[*] Starting crawl on r/{SUBREDDIT} (Max Pages: {MAX_PAGES}, {THREAD_WORKERS} workers)")
+
+    # The next listing page is always being fetched on its own while the workers go through
+    # the current page's threads, so they never sit waiting on pagination.
+    pages = ThreadPoolExecutor(max_workers=1)
+    workers = ThreadPoolExecutor(max_workers=THREAD_WORKERS)
+    listing = pages.submit(get_page_data, session, parser, current_url)
+    pending = set()
+    seen = set()  # Hot pages shift around while we crawl, don't scrape a thread twice
 
-    print(f"[*] Starting crawl on r/{SUBREDDIT} (Max Pages: {MAX_PAGES})")
-    
     # buffering=1 and 'a' mode ensure data is saved even on Ctrl+C
     with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8', buffering=1) as f:
         writer = csv.writer(f)
-        if f.tell() == 0:
+        new_file = f.tell() == 0
+        if new_file:
             writer.writerow(['content'])
+        dedup = DedupFilter(store_path_for(OUTPUT_CSV), fresh=new_file) if DEDUP else None
 
         try:
-            while current_url and pages_scraped < MAX_PAGES:
-                print(f"\n[*] --- SCRAPING PAGE {pages_scraped + 1} ---")
-                thread_links, next_page = get_page_data(current_url)
-                
-                if not thread_links:
-                    print("[!] No threads found. Instance might be down or blocking.")
-                    break
-
-                for i, link in enumerate(thread_links):
-                    # Display thread ID from the URL for progress tracking
-                    t_name = link.split('/')[-2] if '/' in link else "thread"
-                    print(f"    [{i+1}/{len(thread_links)}] {t_name[:40]}...")
-                    
-                    comments = scrape_comments(link)
-                    for c in comments:
-                        writer.writerow([c])
-                        total_comments += 1
-                    
-                    f.flush() # Force write to disk
-                
-                pages_scraped += 1
-                current_url = next_page
-                
-                if current_url:
-                    print(f"[*] Found next page. Moving to next set of posts...")
-                else:
-                    print("[*] No more pages found.")
+            while listing or pending:
+                # Queue up the next page once the workers are running low
+                if listing and len(pending) <= THREAD_WORKERS and (listing.done() or not pending):
+                    thread_links, next_page = listing.result()
+                    listing = None
+
+                    if not thread_links:
+                        print("[!] No threads found. Instance might be down or blocking.")
+                        continue
+
+                    pages_scraped += 1
+                    new_links = [link for link in thread_links if link not in seen]
+                    seen.update(new_links)
+                    print(f"\n[*] --- PAGE {pages_scraped}: {len(new_links)} threads ---")
+                    if next_page and pages_scraped < MAX_PAGES:
+                        listing = pages.submit(get_page_data, session, parser, next_page)
+                    elif not next_page:
+                        print("[*] No more pages found.")
+
+                    for link in new_links:
+                        pending.add(workers.submit(scrape_comments, session, parser, link))
+                    continue
+
+                # A listing that's already done would make wait() return straight away every time,
+                # it only counts while it's still loading and sits there until the workers run low
+                watching = {listing} if listing and not listing.done() else set()
+                done, pending = wait(pending | watching, return_when=FIRST_COMPLETED)
+                if listing in pending:
+                    pending.discard(listing)
+                done.discard(listing)
+
+                # Only this thread writes, so rows land whole no matter when Ctrl+C hits
+                for future in done:
+                    comments = future.result()
+                    if dedup is not None:
+                        comments = [c for c in comments if dedup.add(c)]
+                    writer.writerows([c] for c in comments)
+                    total_comments += len(comments)
+                    threads_done += 1
+                    print(f"    [{threads_done} threads] {total_comments} comments", end='\r')
+                f.flush() # Force write to disk
 
         except KeyboardInterrupt:
             print("\n[!] Ctrl+C detected! Saving and exiting safely...")
+        finally:
+            # Drop anything still queued, only requests already on the wire get to finish
+            pages.shutdown(wait=False, cancel_futures=True)
+            workers.shutdown(wait=False, cancel_futures=True)
+            if dedup is not None:
+                dedup.close()
 
-    print(f"\n[*] Finished! Total Pages: {pages_scraped} | Total Comments: {total_comments}")
+    elapsed = time.time() - start
+    print(f"\n[*] Finished! Total Pages: {pages_scraped} | Total Comments: {total_comments} | {elapsed:.0f}s")
+    if dedup is not None:
+        dedup.report()
 
 if __name__ == "__main__":
     run_scrape()
@@ -1,107 +1,34 @@
-import csv
-import markovify
-import re
-import gc
-import sys
+from TextCleaner import REDDIT
+from TrainingEngine import text_source, train
 
 # Settings
-INPUT_CSV = 'ExampleDataName.csv'
+INPUT_CSV = 'ExampleDataName.csv'  # A .corpus from Corpus.py works too
 MODEL_NAME = 'name_hereGPT.json'
 BATCH_SIZE = 50000  # Number of rows to process before merging models
-
-def clean_text(text):
-    """Refined cleaner for Reddit/Redlib data."""
-    if not text: 
-        return None
-    
-    # 1. Skip Bot messages and removed content
-    junk_patterns = [
-        "I am a bot", 
-        "automatically removed", 
-        "[removed]", 
-        "[deleted]",
-        "Hi! Thank-you for your comment"
-    ]
-    if any(pattern in text for pattern in junk_patterns):
-        return None
-
-    # 2. Fix encoding artifacts (e.g., â€™ -> ')
-    # PyPy/CPython handle this well via 'ignore' to keep the text clean
-    text = text.encode('ascii', 'ignore').decode('ascii')
-    
-    # 3. Strip Markdown/Links/User tags
-    text = re.sub(r'http\S+|/u/\S+|/r/\S+', '', text)
-    text = re.sub(r'[*_~>`#]', '', text)
-    
-    # 4. Normalize whitespace
-    text = " ".join(text.split()).strip()
-    
-    # Only keep substantial sentences (filter out "Lol", "This", etc.)
-    return text if len(text) > 20 else None
+WORKERS = 1  # Set above 1 to build batches on several cores at once
+MEMORY_LIMIT_MB = None  # Set (e.g. 4000) to spill counts to disk when the dump won't fit in RAM
+BINARY_MODEL = True  # Also write a .bin next to the JSON for MainBot's 'mmap' backend
+PRUNE_MIN_COUNT = 1  # Drop transitions seen fewer times than this before exporting
+PRUNE_MAX_FANOUT = None  # Keep at most this many next words per state
+MODEL_SIZE_BUDGET_MB = None  # Keep raising PRUNE_MIN_COUNT until the exported model fits in this many MB
+DELTA_TRAINING = False  # Only train on rows added to INPUT_CSV since the last run, on top of the existing model
+CHECKPOINT_BATCHES = 10  # In delta mode, save every this many batches so an interrupted run can pick up from there
+CLEAN_WORKERS = 1  # Set above 1 to clean rows on several cores ahead of training
+DEDUP = False  # True skips posts that are exact repeats (copypasta, spam) so they don't skew the chain
+NEAR_DEDUP = False  # Also skip posts that are nearly the same as an earlier one, a lot slower
+
+# Cleaning rules for this site, see TextCleaner.py for the steps and make your own Cleaner to tweak them
+clean_text = REDDIT
+
+def source(path=None):
+    """This site's source for TrainingEngine, MultiTrainer.py uses it to mix sites into one model."""
+    return text_source(path or INPUT_CSV, 'content', clean_text)
 
 def run_training():
-    combined_model = None
-    batch = []
-    total_count = 0
-
-    print(f"[*] Reading {INPUT_CSV}...")
-    
-    try:
-        with open(INPUT_CSV, 'r', encoding='utf-8') as f:
-            # Using DictReader to handle the "content" column
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                cleaned = clean_text(row.get('content', ''))
-                if cleaned:
-                    batch.append(cleaned)
-                    total_count += 1
-
-                # When batch is full, create a mini-model and merge it
-                if len(batch) >= BATCH_SIZE:
-                    print(f"    [+] Merging batch at {total_count} lines...")
-                    
-                    # state_size=2 for chaos/funny, state_size=3 for better logic
-                    new_model = markovify.Text(batch, state_size=2, retain_original=False)
-                    
-                    if combined_model:
-                        combined_model = markovify.combine([combined_model, new_model])
-                    else:
-                        combined_model = new_model
-                    
-                    batch = [] 
-                    gc.collect() # Clear memory
-
-    except KeyboardInterrupt:
-        print("\n[!] Training interrupted! Processing what we have...")
-    except FileNotFoundError:
-        print(f"[!] Error: {INPUT_CSV} not found. Run the scraper first!")
-        sys.exit(1)
-
-    # Merge the final remaining batch
-    if batch:
-        print(f"    [+] Merging final {len(batch)} lines...")
-        new_model = markovify.Text(batch, state_size=2, retain_original=False)
-        combined_model = markovify.combine([combined_model, new_model]) if combined_model else new_model
-
-    if combined_model:
-        print("[*] Compiling and saving AtheismGPT model. This may take a minute...")
-        combined_model.compile(inplace=True) 
-        
-        with open(MODEL_NAME, 'w') as f:
-            f.write(combined_model.to_json())
-        
-        print(f"[*] Success! Saved model to {MODEL_NAME}")
-        print(f"[*] Total lines processed: {total_count}")
-        
-        # Test generation
-        print("\n" + "="*30)
-        print("SAMPLE OUTPUT:")
-        for _ in range(5):
-            print("GPT:", combined_model.make_sentence() or "Model too small for sentence generation.")
-        print("="*30)
-    else:
-        print("[!] No data was successfully processed. Check your CSV.")
+    train([source()], MODEL_NAME, batch_size=BATCH_SIZE, workers=WORKERS, memory_limit_mb=MEMORY_LIMIT_MB,
+          binary_model=BINARY_MODEL, prune_min_count=PRUNE_MIN_COUNT, prune_max_fanout=PRUNE_MAX_FANOUT,
+          size_budget_mb=MODEL_SIZE_BUDGET_MB, delta=DELTA_TRAINING, checkpoint_batches=CHECKPOINT_BATCHES,
+          clean_workers=CLEAN_WORKERS, dedup=DEDUP, near_dedup=NEAR_DEDUP)
 
 if __name__ == "__main__":
     run_training()
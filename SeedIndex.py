@@ -0,0 +1,112 @@
+import random
+import statistics
+import sys
+import time
+import markovify
+from markovify.chain import BEGIN
+from markovify.text import ParamError
+
+# Fast strict=False seeds for make_sentence_with_start.
+# markovify scans every state in the chain looking for ones that start with the seed word,
+# on every single ping. These find them with one lookup and try them in order of how
+# common they are instead of a uniform shuffle.
+
+def _weighted_order(candidates):
+    """Weighted random order without replacement, common states come first more often."""
+    keyed = [(random.random() ** (1.0 / weight), state) for state, weight in candidates if weight > 0]
+    keyed.sort(reverse=True)
+    return [state for _, state in keyed]
+
+class SeededTextMixin:
+    """
+    make_sentence_with_start that asks self.seed_states(split) for [(state, weight), ...]
+    instead of scanning the chain. Everything else behaves like markovify's version.
+    """
+    def make_sentence_with_start(self, beginning, strict=True, **kwargs):
+        split = tuple(self.word_split(beginning))
+        word_count = len(split)
+        if strict or not 0 < word_count < self.state_size:
+            return super().make_sentence_with_start(beginning, strict=strict, **kwargs)
+
+        for init_state in _weighted_order(self.seed_states(split)):
+            output = self.make_sentence(init_state, **kwargs)
+            if output is not None:
+                return output
+        raise ParamError(f"`make_sentence_with_start` can't find sentence beginning with {beginning}")
+
+    def find_init_states_from_chain(self, split):
+        return [state for state, _ in self.seed_states(split)]
+
+class IndexedText(SeededTextMixin, markovify.Text):
+    """Dict-backed markovify.Text with a word -> states index built once at load."""
+
+    @classmethod
+    def from_text(cls, text):
+        indexed = cls(None, state_size=text.state_size, chain=text.chain, retain_original=False)
+        indexed.build_seed_index()
+        return indexed
+
+    def build_seed_index(self):
+        """Files every state under its first real word, the same word markovify's scan matches on."""
+        self.seed_index = {}
+        for state in self.chain.model:
+            self.index_state(state)
+
+    def index_state(self, state):
+        """Adds one new state to the index, e.g. when online learning grows the chain."""
+        for word in state:
+            if word != BEGIN:
+                bucket = self.seed_index.get(word)
+                if bucket is None:
+                    self.seed_index[word] = [state]
+                else:
+                    bucket.append(state)
+                return
+
+    def _state_weight(self, state):
+        value = self.chain.model[state]
+        return value[1][-1] if self.chain.compiled else sum(value.values())
+
+    def seed_states(self, split):
+        found = []
+        for state in self.seed_index.get(split[0], ()):
+            if tuple(w for w in state if w != BEGIN)[:len(split)] == split:
+                found.append((state, self._state_weight(state)))
+        return found
+
+if __name__ == "__main__":
+    # Times seeded replies with markovify's scan vs the index: python SeedIndex.py model.json [replies]
+    from ModelIO import load_compact_model, load_model
+    path = sys.argv[1] if len(sys.argv) > 1 else 'ExportedMarkovChainModel.json'
+    replies = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f"[*] Loading {path}...")
+    plain = load_model(path)
+    start = time.perf_counter()
+    indexed = IndexedText.from_text(plain)
+    print(f"[*] Built seed index for {len(indexed.seed_index):,} words in {time.perf_counter() - start:.2f}s")
+    compact = load_compact_model(path)
+
+    # Seed with words people actually say to it: real words picked by how often they start a state
+    words = list(indexed.seed_index)
+    seeds = random.choices(words, weights=[len(indexed.seed_index[w]) for w in words], k=replies)
+
+    def bench(name, brain):
+        times = []
+        for seed in seeds:
+            # markovify caches the last seed's scan, clear it so every reply pays like a real ping would
+            if hasattr(brain.find_init_states_from_chain, 'cache_clear'):
+                brain.find_init_states_from_chain.cache_clear()
+            start = time.perf_counter()
+            try:
+                brain.make_sentence_with_start(seed, strict=False, tries=50)
+            except (KeyError, ParamError):
+                pass
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+        print(f"    {name:<16} p50 {statistics.median(times):9.2f} ms | p99 {p99:9.2f} ms")
+
+    print(f"[*] {replies} seeded replies:")
+    bench("markovify scan", plain)
+    bench("seed index", indexed)
+    bench("compact ranges", compact)
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import deque
+
+# Ready-made sentences for the paths that don't care what the user said:
+# random chatter, !greentext and !meme. A background task keeps each bucket topped up
+# while the generation pool is idle, so those paths are a deque pop instead of a wait.
+
+# bucket name -> how to make one sentence for it
+BUCKETS = {
+    'chatter': ('make_sentence', (), {'tries': 50}),
+    'short100': ('make_short_sentence', (100,), {'tries': 50}),
+    'short40': ('make_short_sentence', (40,), {'tries': 50}),
+}
+
+class SentencePool:
+    def __init__(self, generate, is_idle, size=50, buckets=BUCKETS, idle_sleep=0.5):
+        self.generate = generate  # async (method, *args, **kwargs) -> sentence, see CondoBot.generate
+        self.is_idle = is_idle    # () -> True when nobody is waiting on the generation pool
+        self.size = size
+        self.buckets = buckets
+        self.idle_sleep = idle_sleep
+        self.pools = {name: deque(maxlen=size) for name in buckets}
+        self.hits = 0
+        self.misses = 0
+        self.refilled = 0
+        self.started = time.time()
+        self.task = None
+
+    def start(self):
+        if self.size > 0 and self.task is None:
+            self.task = asyncio.create_task(self._refill_loop())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def clear(self):
+        """Throws away everything pooled, e.g. after the brain changes."""
+        for pool in self.pools.values():
+            pool.clear()
+
+    async def get(self, bucket):
+        """A pooled sentence if there is one, otherwise one made on the spot."""
+        pool = self.pools[bucket]
+        if pool:
+            self.hits += 1
+            return pool.popleft()
+        self.misses += 1
+        method, args, kwargs = self.buckets[bucket]
+        return await self.generate(method, *args, **kwargs)
+
+    async def _refill_loop(self):
+        while True:
+            # Fill the emptiest bucket first, and only when real requests aren't waiting
+            bucket = min(self.pools, key=lambda name: len(self.pools[name]))
+            if len(self.pools[bucket]) >= self.size or not self.is_idle():
+                await asyncio.sleep(self.idle_sleep)
+                continue
+            method, args, kwargs = self.buckets[bucket]
+            try:
+                sentence = await self.generate(method, *args, **kwargs)
+            except Exception as e:
+                print(f"⚠️ Sentence pool refill failed: {e}")
+                await asyncio.sleep(self.idle_sleep)
+                continue
+            if sentence:
+                self.pools[bucket].append(sentence)
+                self.refilled += 1
+            else:
+                # The model couldn't make one, don't hammer it
+                await asyncio.sleep(self.idle_sleep)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def refill_rate(self):
+        """Sentences made per second since the pool started."""
+        return self.refilled / max(time.time() - self.started, 1e-9)
+
+    def fill_levels(self):
+        return {name: len(pool) for name, pool in self.pools.items()}
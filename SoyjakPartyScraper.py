@@ -4,14 +4,15 @@ import re
 import asyncio
 import json
 import random
-import hashlib
 import os
+from DedupFilter import DedupFilter, store_path_for
 
 # ================= Settings =================
 BASE_URL = "https://soyjak.st"
 BOARD = "soy"
 OUTPUT_CSV = "SoyjakStSoyScrape.csv"
 MIN_TEXT_LENGTH = 15
+TABS = 4  # Threads fetched at once, each in its own tab. 1 is the old one-at-a-time behaviour
 # ============================================
 
 def find_browser():
@@ -39,9 +40,69 @@ def clean_text(text):
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
+class OrderedWriter:
+    """Tabs finish threads in any order, this writes them out in catalog order anyway."""
+    def __init__(self, writer, seen, total):
+        self.writer = writer
+        self.seen = seen
+        self.total = total
+        self.waiting = {}  # index -> (thread id, posts or None) that finished early
+        self.next_index = 0
+        self.total_saved = 0
+        self.duplicates_skipped = 0
+
+    def add(self, index, t_id, posts):
+        self.waiting[index] = (t_id, posts)
+        while self.next_index in self.waiting:
+            t_id, posts = self.waiting.pop(self.next_index)
+            self.next_index += 1
+            if posts is None:
+                continue
+            thread_count = 0
+            for cleaned in posts:
+                if self.seen.add(cleaned):
+                    self.writer.writerow([cleaned])
+                    self.total_saved += 1
+                    thread_count += 1
+                else:
+                    self.duplicates_skipped += 1
+            # Posts and their hashes land together, so a crash can't mark a post seen that never got written
+            self.seen.commit()
+            print(f"    [{self.next_index}/{self.total}] Thread {t_id}: Saved {thread_count} new posts.")
+
+def thread_posts(raw_page):
+    """Cleaned posts long enough to keep from a thread page's JSON."""
+    json_match = re.search(r'\{.*\}', raw_page, re.DOTALL)
+    if not json_match:
+        return None
+    data = json.loads(json_match.group())
+    posts = []
+    for post in data.get('posts', []):
+        # Use the clean 'nomarkup' field you found
+        raw_msg = post.get('___body_nomarkup') or post.get('com', '')
+        cleaned = clean_text(raw_msg)
+        if len(cleaned) >= MIN_TEXT_LENGTH:
+            posts.append(cleaned)
+    return posts
+
+async def tab_worker(tab, queue, out):
+    """One tab working through the queue of threads until it's empty."""
+    while True:
+        try:
+            i, t_id = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        target_url = f"{BASE_URL}/{BOARD}/thread/{t_id}.json"
+        posts = None
+        try:
+            await tab.get(target_url)
+            await asyncio.sleep(0.05)
+            posts = thread_posts(await tab.get_content())
+        except Exception as e:
+            print(f"    [!] Error on thread {t_id}: {e}")
+        out.add(i, t_id, posts)
+
 async def run_harvest():
-    seen_posts = set()
-    
     # FIX: Provide the path to nodriver
     browser_path = find_browser()
     if browser_path:
@@ -78,52 +139,38 @@ async def run_harvest():
     thread_ids = list(dict.fromkeys(thread_ids))
     print(f"[*] Found {len(thread_ids)} unique threads. Starting extraction...")
 
-    total_saved = 0
-    duplicates_skipped = 0
-
-    with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8', buffering=1) as f:
-        writer = csv.writer(f)
-        writer.writerow(['text'])
-
-        for i, t_id in enumerate(thread_ids):
-            target_url = f"{BASE_URL}/{BOARD}/thread/{t_id}.json"
-            try:
-                await tab.get(target_url)
-                await asyncio.sleep(0.05)
-                
-                raw_page = await tab.get_content()
-                json_match = re.search(r'\{.*\}', raw_page, re.DOTALL)
-                
-                if json_match:
-                    data = json.loads(json_match.group())
-                    posts = data.get('posts', [])
-                    
-                    thread_count = 0
-                    for post in posts:
-                        # Use the clean 'nomarkup' field you found
-                        raw_msg = post.get('___body_nomarkup') or post.get('com', '')
-                        cleaned = clean_text(raw_msg)
-                        
-                        if len(cleaned) >= MIN_TEXT_LENGTH:
-                            post_hash = hashlib.md5(cleaned.encode('utf-8')).hexdigest()
-                            
-                            if post_hash not in seen_posts:
-                                writer.writerow([cleaned])
-                                seen_posts.add(post_hash)
-                                total_saved += 1
-                                thread_count += 1
-                            else:
-                                duplicates_skipped += 1
-                    
-                    print(f"    [{i+1}/{len(thread_ids)}] Thread {t_id}: Saved {thread_count} new posts.")
-            
-            except Exception as e:
-                print(f"    [!] Error on thread {t_id}: {e}")
-                continue
+    # More tabs in the same session, they share the cookies that got us past the bot check
+    tabs = [tab]
+    for _ in range(max(TABS, 1) - 1):
+        tabs.append(await browser.get('about:blank', new_tab=True))
+    print(f"[*] Fetching with {len(tabs)} tabs...")
+
+    queue = asyncio.Queue()
+    for item in enumerate(thread_ids):
+        queue.put_nowait(item)
+
+    # Reruns append and skip anything already harvested, no CSV means start over
+    append = os.path.exists(OUTPUT_CSV)
+    # Every post written is remembered next to the CSV (SoyjakStSoyScrape.dedup), so each CSV keeps its own
+    seen = DedupFilter(store_path_for(OUTPUT_CSV), fresh=not append, autocommit=None)
+    if append:
+        print(f"[*] {len(seen)} posts already harvested into {OUTPUT_CSV}, only adding new ones")
+
+    try:
+        with open(OUTPUT_CSV, 'a' if append else 'w', newline='', encoding='utf-8', buffering=1) as f:
+            writer = csv.writer(f)
+            if not append:
+                writer.writerow(['text'])
+
+            out = OrderedWriter(writer, seen, len(thread_ids))
+            await asyncio.gather(*(tab_worker(t, queue, out) for t in tabs))
+    finally:
+        seen.close()
 
     print("-" * 30)
-    print(f"[+] Harvest Complete! Unique Posts: {total_saved} (Skipped {duplicates_skipped} dupes)")
+    print(f"[+] Harvest Complete! Unique Posts: {out.total_saved} (Skipped {out.duplicates_skipped} dupes)")
+    seen.report()
     browser.stop()
 
 if __name__ == "__main__":
-    uc.loop().run_until_complete(run_harvest())
\ No newline at end of file
+    uc.loop().run_until_complete(run_harvest())
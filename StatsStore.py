@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Per-server and per-channel bot stats.
+# Counters live in memory and get bumped from the event loop, a background thread writes
+# whatever changed to SQLite every flush_seconds in one transaction, so a busy bot does one
+# disk write per interval instead of one per message.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, channel_id, name)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = """
+INSERT INTO stats (guild_id, channel_id, name, value) VALUES (?, ?, ?, ?)
+ON CONFLICT (guild_id, channel_id, name) DO UPDATE SET value = value + excluded.value
+"""
+
+def _connect(path):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+class StatsStore:
+    """
+    stats.incr('messages_seen', guild_id, channel_id) from anywhere on the event loop,
+    stats.total(...) / stats.guild(...) / stats.channel(...) to read, all from memory.
+    DMs count under guild 0.
+    """
+    def __init__(self, path, flush_seconds=30, legacy_json=None):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.counts = {}   # (guild_id, channel_id, name) -> value
+        self.totals = {}   # name -> value over every guild
+        self.guilds = {}   # guild_id -> {name: value}
+        self.pending = {}  # (guild_id, channel_id, name) -> amount not written yet
+        self.lock = threading.Lock()
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.stopping = threading.Event()
+        self.thread = None
+
+        db = _connect(path)
+        try:
+            if legacy_json:
+                self._migrate(db, legacy_json)
+            for guild_id, channel_id, name, value in db.execute("SELECT guild_id, channel_id, name, value FROM stats"):
+                self._add((guild_id, channel_id, name), value)
+        finally:
+            db.close()
+
+    def _migrate(self, db, legacy_json):
+        """Carries the old global bot_stats.json counters over once, filed under guild 0."""
+        if db.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone() or not os.path.exists(legacy_json):
+            return
+        with open(legacy_json, 'r') as f:
+            old = json.load(f)
+        with db:
+            db.executemany(UPSERT, [(0, 0, name, int(value)) for name, value in old.items()])
+            db.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (legacy_json,))
+        print(f"📦 Moved {legacy_json} into {self.path}")
+
+    def _add(self, key, amount):
+        guild_id, _, name = key
+        self.counts[key] = self.counts.get(key, 0) + amount
+        self.totals[name] = self.totals.get(name, 0) + amount
+        guild = self.guilds.setdefault(guild_id, {})
+        guild[name] = guild.get(name, 0) + amount
+
+    def incr(self, name, guild_id=None, channel_id=None, amount=1):
+        key = (guild_id or 0, channel_id or 0, name)
+        self._add(key, amount)
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + amount
+
+    def total(self, name):
+        return self.totals.get(name, 0)
+
+    def guild(self, guild_id, name):
+        return self.guilds.get(guild_id or 0, {}).get(name, 0)
+
+    def channel(self, guild_id, channel_id, name):
+        return self.counts.get((guild_id or 0, channel_id or 0, name), 0)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._flush_loop, name='stats-flush', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stops the flush thread after one last flush."""
+        if self.thread:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def _flush_loop(self):
+        db = _connect(self.path)
+        try:
+            while not self.stopping.wait(self.flush_seconds):
+                self._flush(db)
+            self._flush(db)
+        finally:
+            db.close()
+
+    def _flush(self, db):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        start = time.perf_counter()
+        try:
+            # One transaction, either every change in the batch lands or none of them do
+            with db:
+                db.executemany(UPSERT, [(g, c, n, amount) for (g, c, n), amount in pending.items()])
+        except sqlite3.Error as e:
+            print(f"⚠️ Stats flush failed, will retry: {e}")
+            with self.lock:
+                for key, amount in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + amount
+            return
+        self.flushes += 1
+        self.last_flush_seconds = time.perf_counter() - start
@@ -0,0 +1,214 @@
+import html
+import re
+import sys
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+# Batched text cleaning for the trainers.
+# A site's rules are a list of steps, compiled once. Rows are cleaned a chunk at a time: the
+# chunk is joined into one string, every step runs over the whole thing in one C-level pass,
+# and it gets split back into rows at the end, instead of a handful of Python calls per row.
+
+SEP = '\x00'  # Goes between rows in a chunk, nothing in real text uses it
+
+class Cleaner:
+    """
+    steps, applied in order:
+        ('drop_if_contains', [str, ...])  throw the whole row away if it contains any of these
+        ('unescape',)                      html.unescape, &gt; -> >
+        ('remove', regex)                  delete every match
+        ('delete', chars)                  delete every one of these characters, faster than a regex
+        ('ascii',)                         drop anything that isn't ASCII
+        ('whitespace',)                    collapse whitespace runs into one space and strip
+        ('strip',)                         just strip, has to be the last step
+    Rows shorter than min_length after cleaning come back as None.
+    """
+    def __init__(self, steps, min_length=1):
+        self.steps = steps
+        self.min_length = min_length
+        self.drop = None
+        self.strip = False
+        self.passes = []
+        for i, step in enumerate(steps):
+            kind = step[0]
+            if kind == 'drop_if_contains':
+                self.drop = re.compile('|'.join(re.escape(s) for s in step[1]))
+            elif kind == 'remove':
+                # \S would happily run on into the next row of the chunk
+                self.passes.append(('remove', re.compile(step[1].replace(r'\S', r'[^\s\x00]'))))
+            elif kind == 'delete' and self.passes and self.passes[-1][0] == 'delete':
+                self.passes[-1] = ('delete', self.passes[-1][1] + step[1])
+            elif kind == 'delete':
+                self.passes.append(('delete', step[1]))
+            elif kind == 'strip':
+                if i != len(steps) - 1:
+                    raise ValueError("'strip' has to be the last cleaning step")
+                self.strip = True
+            elif kind in ('unescape', 'ascii', 'whitespace'):
+                self.passes.append((kind, None))
+            else:
+                raise ValueError(f"Unknown cleaning step {kind!r}")
+
+    def __call__(self, text):
+        """Cleans one row, so a Cleaner can stand in for a clean_text function."""
+        if not text:
+            return None
+        return self.clean_chunk([text.replace(SEP, '')])[0]
+
+    def clean_chunk(self, texts):
+        """Cleans a list of rows, returns a list of the same length with None for dropped rows."""
+        texts = [t or '' for t in texts]
+        chunk = SEP.join(texts)
+        if chunk.count(SEP) != len(texts) - 1:
+            # A row has the separator in it already, do this chunk row by row
+            return [self(t) for t in texts]
+
+        dropped = set()
+        if self.drop:
+            starts = list(accumulate(len(t) + 1 for t in texts))
+            for match in self.drop.finditer(chunk):
+                dropped.add(bisect_right(starts, match.start()))
+
+        for kind, arg in self.passes:
+            if kind == 'remove':
+                chunk = arg.sub('', chunk)
+            elif kind == 'delete':
+                for char in arg:
+                    chunk = chunk.replace(char, '')
+            elif kind == 'unescape':
+                chunk = html.unescape(chunk)
+            elif kind == 'ascii':
+                chunk = chunk.encode('ascii', 'ignore').decode('ascii')
+            elif kind == 'whitespace':
+                # The separator isn't whitespace, so it comes out with at most one space either side
+                chunk = " ".join(chunk.split()).replace(' ' + SEP, SEP).replace(SEP + ' ', SEP)
+
+        parts = chunk.split(SEP)
+        if len(parts) != len(texts):
+            # A custom rule ate a separator, do this chunk row by row
+            return [self(t) for t in texts]
+        if self.strip:
+            parts = [p.strip() for p in parts]
+        min_length = self.min_length
+        return [None if i in dropped or len(p) < min_length else p for i, p in enumerate(parts)]
+
+# --- The trainers' rule sets ---
+
+IMAGEBOARD = Cleaner([
+    ('unescape',),           # &gt; -> >, &quot; -> "
+    ('remove', r'>>\d+'),    # Post links
+    ('delete', '>'),         # Greentext arrows, so it reads like a normal sentence
+    ('remove', r'http\S+'),  # URLs, they make unique tokens that go nowhere
+    ('delete', '*_~`#'),     # Technical junk characters
+    ('whitespace',),
+    ('ascii',),
+], min_length=21)  # 4chan has a lot of short 'bump' posts
+
+REDDIT = Cleaner([
+    ('drop_if_contains', ["I am a bot", "automatically removed", "[removed]", "[deleted]",
+                          "Hi! Thank-you for your comment"]),
+    ('ascii',),              # Also drops encoding artifacts like â€™
+    ('remove', r'http\S+|/u/\S+|/r/\S+'),  # Links, user and sub tags, one pattern so /u/httpx goes whole
+    ('delete', '*_~>`#'),    # Markdown
+    ('whitespace',),
+], min_length=21)  # Filter out "Lol", "This", etc.
+
+DISCORD = Cleaner([
+    ('remove', r'<@!?\d+>|<@&\d+>|http\S+'),  # Pings, role pings and links
+    ('strip',),
+], min_length=2)
+
+# --- Running it ahead of the trainer ---
+
+class RowCleaner:
+    """Wraps a plain clean_text(text) function so it can go through clean_chunks too."""
+    def __init__(self, clean):
+        self.clean = clean
+
+    def clean_chunk(self, texts):
+        return [self.clean(t) for t in texts]
+
+def _clean_job(cleaner, texts):
+    return cleaner.clean_chunk(texts)
+
+def clean_chunks(jobs, workers=1):
+    """
+    jobs yields (cleaner, texts, tag). Yields (cleaned texts, tag) in the same order.
+    With workers > 1 the cleaning happens in a process pool a few chunks ahead of whoever
+    is reading the results.
+    """
+    if workers <= 1:
+        for cleaner, texts, tag in jobs:
+            yield cleaner.clean_chunk(texts), tag
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for cleaner, texts, tag in jobs:
+            pending.append((pool.submit(_clean_job, cleaner, texts), tag))
+            while len(pending) > workers * 2:
+                future, tag = pending.popleft()
+                yield future.result(), tag
+        while pending:
+            future, tag = pending.popleft()
+            yield future.result(), tag
+
+if __name__ == "__main__":
+    # Rows/sec of the chunked rules vs the trainers' old clean_text: python TextCleaner.py file.csv [column] [rules]
+    import csv
+
+    def old_imageboard(text):
+        if not text:
+            return None
+        text = html.unescape(text)
+        text = re.sub(r'>>\d+', '', text)
+        text = text.replace('>', '')
+        text = re.sub(r'http\S+', '', text)
+        text = re.sub(r'[*_~`#]', '', text)
+        text = " ".join(text.split()).strip()
+        text = text.encode('ascii', 'ignore').decode('ascii')
+        return text if len(text) > 20 else None
+
+    def old_reddit(text):
+        if not text:
+            return None
+        junk_patterns = ["I am a bot", "automatically removed", "[removed]", "[deleted]", "Hi! Thank-you for your comment"]
+        if any(pattern in text for pattern in junk_patterns):
+            return None
+        text = text.encode('ascii', 'ignore').decode('ascii')
+        text = re.sub(r'http\S+|/u/\S+|/r/\S+', '', text)
+        text = re.sub(r'[*_~>`#]', '', text)
+        text = " ".join(text.split()).strip()
+        return text if len(text) > 20 else None
+
+    def old_discord(text):
+        if not text: return None
+        text = re.sub(r'<@!?\d+>|<@&\d+>|http\S+', '', text).strip()
+        return text if len(text) > 1 else None
+
+    rule_sets = {'imageboard': (IMAGEBOARD, old_imageboard), 'reddit': (REDDIT, old_reddit), 'discord': (DISCORD, old_discord)}
+    path = sys.argv[1] if len(sys.argv) > 1 else '4chanTechBoard.csv'
+    column = sys.argv[2] if len(sys.argv) > 2 else 'text'
+    cleaner, old = rule_sets[sys.argv[3] if len(sys.argv) > 3 else 'imageboard']
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = [row.get(column, '') for row in csv.DictReader(f)]
+    print(f"[*] {len(rows):,} rows from {path}")
+
+    def bench(name, run):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        print(f"    {name:<22} {len(rows) / elapsed:>12,.0f} rows/sec")
+        return result
+
+    expected = bench("old clean_text", lambda: [old(t) for t in rows])
+    for size in (1, 100, 1000):
+        got = bench(f"chunks of {size}", lambda: [c for i in range(0, len(rows), size) for c in cleaner.clean_chunk(rows[i:i + size])])
+    jobs = ((cleaner, rows[i:i + 1000], None) for i in range(0, len(rows), 1000))
+    bench("4 workers", lambda: [c for chunk, _ in clean_chunks(jobs, 4) for c in chunk])
+    same = sum(1 for a, b in zip(expected, got) if a == b)
+    print(f"[*] Same output as the old function on {same / max(len(rows), 1):.2%} of rows")
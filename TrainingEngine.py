@@ -0,0 +1,667 @@
+import markovify
+from markovify.chain import BEGIN, END, compile_next
+import csv
+import hashlib
+import heapq
+import ijson
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from BinaryModel import binary_path_for, write_binary_items, write_binary_model
+from CompactChain import CompactChain
+from Corpus import Corpus
+from DedupFilter import DedupFilter, store_path_for
+from ModelIO import iter_compiled_items, write_model, write_model_items
+from ModelPruning import print_report, prune_model
+from TextCleaner import RowCleaner, clean_chunks
+
+# The training pipeline behind every trainer script.
+# A trainer is just its settings plus a source: where the text is (a CSV column or a Discord
+# export) and how to clean it. train() does the rest, for one source or several at once.
+
+# Rough CPython cost of one state (tuple + inner dict) and one transition (dict slot + int),
+# used to guess how big the in-memory counts are without walking them
+STATE_BYTES = 250
+TRANSITION_BYTES = 80
+MERGE_FAN_IN = 64  # Max spill files open at once during the final merge
+CLEAN_CHUNK = 1000  # Rows cleaned at a time, see TextCleaner.py
+HEAD_BYTES = 65536  # How much of an input file the watermark fingerprints to notice it was replaced
+
+def batched(lines, batch_size):
+    """Groups an iterable of cleaned lines into lists of batch_size."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class _SentenceParser(markovify.Text):
+    """Just the sentence splitting and filtering half of markovify.Text."""
+    def __init__(self):
+        self.well_formed = True
+
+class ChainAccumulator:
+    """
+    One mutable table of transition counts that every batch gets added into.
+    Replaces building a model per batch and markovify.combine-ing it onto the
+    running model, which copied the whole chain on every batch.
+    """
+    def __init__(self, state_size=2):
+        self.state_size = state_size
+        self.model = {}
+        self.transitions = 0
+        self.parser = _SentenceParser()
+
+    def add_batch(self, batch):
+        """Counts every transition in a list of cleaned lines, same rules as markovify.Chain.build."""
+        model = self.model
+        state_size = self.state_size
+        new_transitions = 0
+        for run in self.parser.generate_corpus(batch):
+            items = ([BEGIN] * state_size) + run + [END]
+            for i in range(len(run) + 1):
+                state = tuple(items[i : i + state_size])
+                follow = items[i + state_size]
+                options = model.get(state)
+                if options is None:
+                    options = model[state] = {}
+                count = options.get(follow)
+                if count is None:
+                    options[follow] = 1
+                    new_transitions += 1
+                else:
+                    options[follow] = count + 1
+        self.transitions += new_transitions
+
+    def add_state(self, state, counts):
+        """Adds (word, count) pairs for one state."""
+        options = self.model.get(state)
+        if options is None:
+            options = self.model[state] = {}
+        for word, count in counts:
+            current = options.get(word)
+            if current is None:
+                options[word] = count
+                self.transitions += 1
+            else:
+                options[word] = current + count
+
+    def add_model(self, path):
+        """Adds every count in an exported model file, so a delta run picks up where it left off."""
+        for state, words, weights in iter_compiled_items(path):
+            self.add_state(state, zip(words, (b - a for a, b in zip([0] + weights, weights))))
+
+    def checkpoint(self, path):
+        """Writes the counts so far to path as a normal model file, keeping them in memory."""
+        write_model_items(path, self.state_size, ((state, compile_next(options)) for state, options in self.model.items()))
+
+    def to_text(self):
+        """
+        Compiles the counts state by state and wraps them in a markovify.Text.
+        Each count dict is swapped for its compiled list as we go, so peak memory
+        stays around one model instead of two.
+        """
+        model = self.model
+        for state, options in model.items():
+            model[state] = compile_next(options)
+        self.model = {}
+        chain = markovify.Chain(None, self.state_size, model=model)
+        return markovify.Text(None, state_size=self.state_size, chain=chain, retain_original=False)
+
+class ExternalChainBuilder(ChainAccumulator):
+    """
+    ChainAccumulator for dumps that don't fit in RAM. Once the counts pass
+    memory_limit_mb they get written out as a sorted run file and cleared, and
+    save() k-way merges every run straight into the exported JSON one state at
+    a time, so the full model never has to be in memory.
+    """
+    def __init__(self, state_size=2, memory_limit_mb=4000, spill_dir=None):
+        super().__init__(state_size)
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self.spill_root = spill_dir
+        self.spill_dir = None  # Made on the first spill
+        self.runs = []
+        self.run_count = 0
+
+    def estimated_bytes(self):
+        return len(self.model) * STATE_BYTES + self.transitions * TRANSITION_BYTES
+
+    def has_data(self):
+        return bool(self.model or self.runs)
+
+    def add_batch(self, batch):
+        super().add_batch(batch)
+        if self.estimated_bytes() >= self.memory_limit:
+            self.spill()
+
+    def add_state(self, state, counts):
+        super().add_state(state, counts)
+        if self.estimated_bytes() >= self.memory_limit:
+            self.spill()
+
+    def checkpoint(self, path):
+        self.spill()
+        self._reduce_runs()
+        write_model_items(path, self.state_size, self._iter_compiled())
+
+    def spill(self):
+        """Writes the in-memory counts to a new sorted run file and clears them."""
+        if not self.model:
+            return
+        entries = ((" ".join(state), options) for state, options in self.model.items())
+        path = self._run_path()
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            for state, options in sorted(entries, key=lambda e: e[0]):
+                for word, count in sorted(options.items()):
+                    f.write(f"{state}\t{word}\t{count}\n")
+        print(f"    [+] Spilled {len(self.model)} states to {os.path.basename(path)}")
+        self.runs.append(path)
+        self.model = {}
+        self.transitions = 0
+
+    def save(self, path, binary_path=None):
+        """
+        Merges every run into a model file markovify.Text.from_json can load, then deletes the runs.
+        With binary_path the runs get merged a second time straight into a BinaryModel file,
+        the first merge notes the vocab and sizes it needs so the chain is never in memory.
+        """
+        stats = {"words": set(), "states": 0, "transitions": 0, "max_weight": 0}
+
+        def noted():
+            for state, (words, weights) in self._iter_compiled():
+                stats["words"].update(state)
+                stats["words"].update(words)
+                stats["states"] += 1
+                stats["transitions"] += len(words)
+                stats["max_weight"] = max(stats["max_weight"], weights[-1])
+                yield state, [words, weights]
+
+        try:
+            self.spill()
+            self._reduce_runs()
+            write_model_items(path, self.state_size, noted() if binary_path else self._iter_compiled())
+            if binary_path:
+                items = ((state, words, weights) for state, (words, weights) in self._iter_compiled())
+                try:
+                    write_binary_items(binary_path, self.state_size, items, **stats)
+                except ValueError as e:
+                    print(f"[!] Skipped {os.path.basename(binary_path)} ({e}), run BinaryModel.py on the export to make it")
+        finally:
+            if self.spill_dir:
+                shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _reduce_runs(self):
+        """Merges runs in passes until there are few enough to have open at once."""
+        while len(self.runs) > MERGE_FAN_IN:
+            groups = [self.runs[i:i + MERGE_FAN_IN] for i in range(0, len(self.runs), MERGE_FAN_IN)]
+            self.runs = []
+            for group in groups:
+                merged = self._run_path()
+                with open(merged, 'w', encoding='utf-8', newline='\n') as f:
+                    for state, word, count in _merge_runs(group):
+                        f.write(f"{state}\t{word}\t{count}\n")
+                for run in group:
+                    os.remove(run)
+                self.runs.append(merged)
+
+    def _run_path(self):
+        if not self.spill_dir:
+            self.spill_dir = tempfile.mkdtemp(prefix='markov_runs_', dir=self.spill_root)
+        self.run_count += 1
+        return os.path.join(self.spill_dir, f"run_{self.run_count:05d}.tsv")
+
+    def _iter_compiled(self):
+        """Yields (state, [words, cumulative weights]) for every state, grouped from the merged runs."""
+        state, options = None, {}
+        for line_state, word, count in _merge_runs(self.runs):
+            if line_state != state:
+                if options:
+                    yield tuple(state.split(" ")), compile_next(options)
+                state, options = line_state, {}
+            options[word] = count
+        if options:
+            yield tuple(state.split(" ")), compile_next(options)
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        for line in f:
+            state, word, count = line[:-1].split('\t')
+            yield state, word, int(count)
+
+def _merge_runs(paths):
+    """K-way merges sorted run files, adding up counts for the same (state, word)."""
+    last_key, total = None, 0
+    for state, word, count in heapq.merge(*(_read_run(p) for p in paths)):
+        key = (state, word)
+        if key != last_key:
+            if last_key is not None:
+                yield last_key[0], last_key[1], total
+            last_key, total = key, 0
+        total += count
+    if last_key is not None:
+        yield last_key[0], last_key[1], total
+
+def _complete_lines(f):
+    """Lines of a binary file ending in \\n, \\r\\n or a lone \\r, stopping at a last line that's still being written."""
+    for raw in f:
+        for line in raw.splitlines(keepends=True):
+            if not line.endswith((b'\n', b'\r')):
+                return
+            yield line
+
+def iter_csv_rows(path, mark=None):
+    """
+    Yields every row of a CSV as a dict, like csv.DictReader.
+    With a watermark mark it starts at mark['offset'] and moves the mark past each row
+    as it's yielded. A half-written last line is left for the next run.
+    """
+    if mark is None:
+        # Nothing to resume from, so the last row counts even without a newline after it
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+        return
+
+    with open(path, 'rb') as f:
+        header = next(_complete_lines(f), None)
+        if header is None:
+            return
+        fieldnames = next(csv.reader([header.decode('utf-8-sig')]))
+        pos = max(mark['offset'], len(header))
+        f.seek(pos)
+
+        def lines():
+            nonlocal pos
+            for line in _complete_lines(f):
+                pos += len(line)
+                yield line.decode('utf-8')
+
+        for row in csv.DictReader(lines(), fieldnames=fieldnames):
+            mark['offset'] = pos
+            mark['rows'] += 1
+            yield row
+
+def _file_head(path, length):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(min(length, HEAD_BYTES))).hexdigest()
+
+class CsvSource:
+    """One text column of a scraper CSV. Delta runs track it by byte offset."""
+    def __init__(self, path, column, clean):
+        self.path = path
+        self.column = column
+        self.clean = clean
+
+    def new_mark(self):
+        return {"rows": 0, "offset": 0}
+
+    def read(self, mark=None):
+        for row in iter_csv_rows(self.path, mark):
+            yield row.get(self.column, '')
+
+class CorpusSource:
+    """A .corpus file (Corpus.py). Delta runs track it by row, the offset is only there to notice a replaced file."""
+    def __init__(self, path, clean):
+        self.path = path
+        self.clean = clean
+
+    def new_mark(self):
+        return {"rows": 0, "offset": 0}
+
+    def read(self, mark=None):
+        corpus = Corpus(self.path)
+        try:
+            start = mark['rows'] if mark else 0
+            if start >= len(corpus):
+                return
+            first = corpus.block_of(start)
+            skip = start - corpus.starts[first]
+            for i, rows in enumerate(corpus.iter_blocks(first), first):
+                if mark is not None:
+                    # Start of the block being read, appends only ever rewrite from the last block on
+                    mark['offset'] = corpus.block_offset(i)
+                for text in rows[skip:]:
+                    if mark is not None:
+                        mark['rows'] += 1
+                    yield text
+                skip = 0
+        finally:
+            corpus.close()
+
+def text_source(path, column, clean):
+    """CsvSource for a CSV, CorpusSource for a .corpus file, so a trainer takes either."""
+    if path.endswith('.corpus'):
+        return CorpusSource(path, clean)
+    return CsvSource(path, column, clean)
+
+class DiscordSource:
+    """Messages in a Discord-Chat-Exporter JSON. Delta runs track it by the last message id."""
+    def __init__(self, path, clean, prefix='messages.item'):
+        self.path = path
+        self.clean = clean
+        self.prefix = prefix
+
+    def new_mark(self):
+        return {"rows": 0, "last_id": 0}
+
+    def read(self, mark=None):
+        last_id = mark['last_id'] if mark else 0
+        with open(self.path, 'rb') as f:
+            for msg in ijson.items(f, self.prefix):
+                if mark is not None:
+                    # Message ids only go up, so a fresh export of the same channel just skips ahead
+                    msg_id = int(msg.get('id', 0))
+                    if msg_id <= last_id:
+                        continue
+                    mark['last_id'] = msg_id
+                    mark['rows'] += 1
+                if msg.get('type') == "Default":
+                    yield msg.get('content')
+
+def _snapshot(marks):
+    return {path: dict(mark) for path, mark in marks.items()} if marks else None
+
+def iter_chunks(sources, marks=None, workers=1, chunk_size=CLEAN_CHUNK, dedup=None):
+    """
+    Read, clean and filter: yields (cleaned lines, marks) a chunk of rows at a time, source after source.
+    With a DedupFilter, lines it has seen before are dropped too.
+    marks is a copy of every watermark as of the end of that chunk, so saving it only ever covers
+    rows that were actually handed out, even while workers are cleaning a few chunks ahead.
+    """
+    def jobs():
+        for source in sources:
+            mark = marks[source.path] if marks else None
+            cleaner = source.clean if hasattr(source.clean, 'clean_chunk') else RowCleaner(source.clean)
+            texts = []
+            for text in source.read(mark):
+                texts.append(text)
+                if len(texts) >= chunk_size:
+                    yield cleaner, texts, _snapshot(marks)
+                    texts = []
+            if texts:
+                yield cleaner, texts, _snapshot(marks)
+
+    for cleaned, snapshot in clean_chunks(jobs(), workers):
+        if dedup is not None:
+            yield [line for line in cleaned if line and dedup.add(line)], snapshot
+        else:
+            yield [line for line in cleaned if line], snapshot
+
+def iter_lines(sources, marks=None, workers=1, dedup=None):
+    """Every cleaned line of every source, one after another."""
+    for lines, _ in iter_chunks(sources, marks, workers, dedup=dedup):
+        yield from lines
+
+class TrainingWatermark:
+    """
+    Remembers how far into each input a model has been trained, in <model>.watermark.json,
+    so a delta run only has to read what got appended since.
+    """
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.path = os.path.splitext(model_path)[0] + '.watermark.json'
+        self.data = {"model_size": None, "inputs": {}}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    def resume(self, sources):
+        """
+        The marks to continue every source from, or None when there's nothing to pick up from:
+        no model yet, the model changed since the marks were saved, or an input was replaced.
+        Sources the model hasn't seen before start from their beginning.
+        """
+        inputs = self.data["inputs"]
+        if not inputs or not os.path.exists(self.model_path):
+            return None
+        if os.path.getsize(self.model_path) != self.data["model_size"]:
+            return None
+        marks = {}
+        for source in sources:
+            mark = inputs.get(source.path)
+            if mark is None:
+                mark = inputs[source.path] = source.new_mark()
+            elif not self._still_valid(source.path, mark):
+                return None
+            marks[source.path] = mark
+        return marks
+
+    def _still_valid(self, input_path, mark):
+        if not os.path.exists(input_path):
+            return False
+        if "offset" in mark:
+            return os.path.getsize(input_path) >= mark["offset"] and _file_head(input_path, mark["offset"]) == mark["head"]
+        return True
+
+    def start(self, sources):
+        """Fresh marks for every source, for a run that starts from nothing."""
+        self.data["inputs"] = {source.path: source.new_mark() for source in sources}
+        return dict(self.data["inputs"])
+
+    def save(self, marks=None):
+        """Call right after writing the model, the marks only count for that exact file."""
+        if marks:
+            self.data["inputs"].update(marks)
+        self.data["model_size"] = os.path.getsize(self.model_path)
+        for input_path, mark in self.data["inputs"].items():
+            if "offset" in mark and os.path.exists(input_path):
+                mark["head"] = _file_head(input_path, mark["offset"])
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def start_delta(chain, model_path, sources):
+    """
+    Loads the previous model into chain if it can be continued from.
+    Returns (watermark, marks), marks is what each source's reader should start from.
+    """
+    watermark = TrainingWatermark(model_path)
+    marks = watermark.resume(sources)
+    if marks:
+        for path, mark in marks.items():
+            if mark['rows']:
+                print(f"[*] Delta run: {model_path} already has {mark['rows']:,} rows of {path}")
+        print(f"[*] Loading {model_path}...")
+        chain.add_model(model_path)
+        return watermark, marks
+    if watermark.data["inputs"]:
+        print(f"[!] {model_path} doesn't match its watermark anymore, training from scratch.")
+    return watermark, watermark.start(sources)
+
+def build_shard(batch, state_size=2):
+    """Worker function: builds the raw transition counts for one batch."""
+    shard = ChainAccumulator(state_size)
+    shard.add_batch(batch)
+    return shard.model
+
+def merge_counts(left, right):
+    """Adds the counts of right into left, keeping markovify.combine's key order."""
+    for state, options in right.items():
+        current = left.get(state)
+        if current is None:
+            left[state] = options
+            continue
+        for word, count in options.items():
+            current[word] = current.get(word, 0) + count
+    return left
+
+def _ignore_sigint():
+    # Ctrl+C is handled by the parent so finished shards can still be merged
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def train_parallel(lines, workers, batch_size=50000, state_size=2):
+    """
+    Builds one chain per batch in a process pool and merges them in a tree.
+    Returns (model, line_count). The model has the same counts as merging the
+    batches one after another with markovify.combine, just built on every core.
+    """
+    stack = []  # (level, counts) pairs, merged like a binary counter so merges stay balanced
+    pending = deque()
+    total_count = 0
+
+    def collect():
+        nonlocal total_count
+        future, size = pending.popleft()
+        counts = future.result()
+        total_count += size
+        level = 0
+        while stack and stack[-1][0] == level:
+            _, left = stack.pop()
+            counts = merge_counts(left, counts)
+            level += 1
+        stack.append((level, counts))
+        print(f"    [+] Merged shard at {total_count} lines...")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_ignore_sigint) as pool:
+        try:
+            for batch in batched(lines, batch_size):
+                pending.append((pool.submit(build_shard, batch, state_size), len(batch)))
+                # Only keep a couple of batches per worker in flight so big dumps don't fill RAM
+                while len(pending) > workers * 2:
+                    collect()
+        except KeyboardInterrupt:
+            print("\n[!] Training interrupted! Finishing the shards already started...")
+
+        while pending:
+            collect()
+
+    combined = None
+    while stack:
+        _, counts = stack.pop()
+        combined = merge_counts(counts, combined) if combined else counts
+
+    if not combined:
+        return None, total_count
+    return markovify.Text.from_chain(combined), total_count
+
+def train(sources, model_name, state_size=2, batch_size=50000, workers=1, memory_limit_mb=None,
+          binary_model=True, prune_min_count=1, prune_max_fanout=None, size_budget_mb=None,
+          delta=False, checkpoint_batches=10, clean_workers=1, dedup=False, near_dedup=False, samples=5):
+    """
+    Trains one model from any number of sources and saves it to model_name.
+    read -> clean -> filter and dedup (iter_lines) -> batch -> count (ChainAccumulator, ExternalChainBuilder
+    or train_parallel) -> compile -> prune -> save. Every trainer script is just settings and
+    a source for this.
+    """
+    for source in sources:
+        if not os.path.exists(source.path):
+            print(f"[!] Error: {source.path} not found. Run the scraper first!")
+            sys.exit(1)
+
+    # state_size=2 for more randomness, 3 for better grammar
+    if memory_limit_mb:
+        chain = ExternalChainBuilder(state_size=state_size, memory_limit_mb=memory_limit_mb)
+    else:
+        chain = ChainAccumulator(state_size=state_size)
+    combined_model = None
+    batch = []
+    total_count = 0
+    batches = 0
+    watermark, marks = None, None
+    pruning = prune_min_count > 1 or prune_max_fanout or size_budget_mb
+
+    if delta:
+        watermark, marks = start_delta(chain, model_name, sources)
+    committed = _snapshot(marks)  # Watermarks as of the last line that made it into a batch
+
+    seen = None
+    if dedup:
+        # A delta run keeps the posts the model already has, anything else starts clean. In delta
+        # mode new hashes are only saved along with a checkpoint, so they always match the model.
+        resumed = bool(marks) and any(mark['rows'] for mark in marks.values())
+        seen = DedupFilter(store_path_for(model_name), near=near_dedup, fresh=not resumed,
+                           autocommit=None if watermark else 100000)
+
+    print(f"[*] Reading {', '.join(source.path for source in sources)}...")
+
+    try:
+        if workers > 1 and not memory_limit_mb and not delta:
+            print(f"[*] Building batches on {workers} workers...")
+            combined_model, total_count = train_parallel(iter_lines(sources, workers=clean_workers, dedup=seen),
+                                                         workers, batch_size, state_size)
+        else:
+            for lines, snapshot in iter_chunks(sources, marks, clean_workers, dedup=seen):
+                batch.extend(lines)
+                total_count += len(lines)
+                committed = snapshot
+
+                if len(batch) >= batch_size:
+                    print(f"    [+] Merging batch at {total_count} lines...")
+                    chain.add_batch(batch)
+                    batch = []
+                    batches += 1
+                    if watermark and batches % checkpoint_batches == 0:
+                        print(f"    [+] Checkpointing {model_name}...")
+                        chain.checkpoint(model_name)
+                        watermark.save(committed)
+                        if seen is not None:
+                            seen.commit()
+
+    except KeyboardInterrupt:
+        print("\n[!] Training interrupted! Processing what we have...")
+
+    # This runs whether the loop finished or was interrupted
+    if batch:
+        print(f"    [+] Merging final {len(batch)} lines...")
+        chain.add_batch(batch)
+    if seen is not None:
+        seen.report()
+
+    if watermark and total_count == 0:
+        print(f"[*] Nothing new to train on, {model_name} is up to date.")
+        if seen is not None and os.path.exists(model_name):
+            # Everything new was a repeat, no need to read it again next time
+            watermark.save(committed)
+            seen.close()
+        return None
+
+    if memory_limit_mb:
+        if not chain.has_data():
+            print("[!] No data was successfully processed. Check your input.")
+            return None
+        if pruning:
+            print("[!] Pruning needs the whole model in memory, run ModelPruning.py on the export instead.")
+        print(f"[*] Merging spill files into {model_name}. This may take a while...")
+        chain.save(model_name, binary_path_for(model_name) if binary_model else None)
+        if watermark:
+            watermark.save(committed)
+        if seen is not None:
+            seen.close()
+        print(f"[*] Success! Total lines processed: {total_count}")
+        return None
+
+    if chain.model:
+        combined_model = chain.to_text()
+
+    if not combined_model:
+        print("[!] No data was successfully processed. Check your input.")
+        return None
+
+    print(f"[*] Compiling and saving {model_name}. Do not close the window...")
+    combined_model.compile(inplace=True)
+    if pruning:
+        print_report(prune_model(combined_model, prune_min_count, prune_max_fanout, size_budget_mb))
+    write_model(model_name, combined_model)
+    if binary_model:
+        write_binary_model(binary_path_for(model_name), CompactChain.from_chain(combined_model.chain))
+    if watermark:
+        watermark.save(committed)
+    if seen is not None:
+        seen.close()
+    print(f"[*] Success! Total lines processed: {total_count}")
+
+    if samples:
+        print("\n" + "="*30 + "\nSAMPLE OUTPUT:")
+        for _ in range(samples):
+            # tries=100 helps if the model is picky about start words
+            print("GPT:", combined_model.make_sentence(tries=100) or "...")
+        print("="*30)
+    return combined_model
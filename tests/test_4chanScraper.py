@@ -0,0 +1,150 @@
+import asyncio
+import csv
+import importlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+
+import pytest
+from aiohttp import web
+
+scraper = importlib.import_module('4chanScraper')
+
+class FakeBoard:
+    """A stand-in for a.4cdn.org/g/ with threads.json, archive.json and thread JSON."""
+    def __init__(self):
+        self.threads = {}  # no -> {"posts": count, "modified": timestamp, "archived": bool}
+        self.catalog_bumps = {}  # no -> last_modified threads.json shows instead of the real one
+        self.requests = []  # (thread no, If-Modified-Since or None)
+        self.deleted = set()  # Still listed in threads.json but already 404
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/g/threads.json', self.threads_json)
+        app.router.add_get('/g/archive.json', self.archive_json)
+        app.router.add_get('/g/thread/{no}.json', self.thread_json)
+        return app
+
+    def add(self, no, posts, modified=1000, archived=False):
+        self.threads[no] = {"posts": posts, "modified": modified, "archived": archived}
+
+    def posts(self, no):
+        return [f"thread {no} post number {i} says something" for i in range(self.threads[no]["posts"])]
+
+    async def threads_json(self, request):
+        live = [{"no": no, "last_modified": self.catalog_bumps.get(no, t["modified"])}
+                for no, t in self.threads.items() if not t["archived"]]
+        return web.json_response([{"page": 1, "threads": live}])
+
+    async def archive_json(self, request):
+        return web.json_response([no for no, t in self.threads.items() if t["archived"]])
+
+    async def thread_json(self, request):
+        no = int(request.match_info['no'])
+        since = request.headers.get('If-Modified-Since')
+        self.requests.append((no, since))
+        thread = self.threads.get(no)
+        if thread is None or no in self.deleted:
+            return web.Response(status=404)
+        if since and parsedate_to_datetime(since).timestamp() >= thread["modified"]:
+            return web.Response(status=304)
+        posts = [{"no": no * 1000 + i, "com": text} for i, text in enumerate(self.posts(no))]
+        if thread["archived"]:
+            posts[0]["archived"] = 1
+        return web.json_response({"posts": posts}, headers={'Last-Modified': formatdate(thread["modified"], usegmt=True)})
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, 'BOARD_NAME', 'g')
+    monkeypatch.setattr(scraper, 'OUTPUT_CSV', str(tmp_path / 'out.csv'))
+    monkeypatch.setattr(scraper, 'STATE_FILE', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(scraper, 'ARCHIVE_LIMIT', None)
+    monkeypatch.setattr(scraper, 'REQUESTS_PER_SECOND', 0)  # No rate limit against ourselves
+    monkeypatch.setattr(scraper, 'INCREMENTAL', True)
+    monkeypatch.setattr(scraper, 'DEDUP', False)
+    monkeypatch.setattr(scraper, 'API_URL', None)
+    return FakeBoard()
+
+def scrape(board):
+    """Runs one scrape against the board, returns the thread requests it made."""
+    async def main():
+        runner = web.AppRunner(board.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        scraper.API_URL = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        try:
+            await scraper.scrape()
+        finally:
+            await runner.cleanup()
+
+    board.requests = []
+    asyncio.run(main())
+    return board.requests
+
+def rows():
+    with open(scraper.OUTPUT_CSV, 'r', newline='', encoding='utf-8') as f:
+        return [row[0] for row in csv.reader(f)]
+
+def state():
+    with open(scraper.STATE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)["boards"]["g"]
+
+def test_first_run_writes_everything_and_remembers_it(board):
+    board.add(1, 3)
+    board.add(2, 2, archived=True)
+    scrape(board)
+    assert sorted(rows()[1:]) == sorted(board.posts(1) + board.posts(2))
+    saved = state()
+    assert saved["1"]["last_post"] == 1002
+    assert saved["1"]["last_modified"] == formatdate(1000, usegmt=True)
+    assert saved["1"]["bumped"] == 1000 and not saved["1"]["archived"]
+    assert saved["2"]["archived"]
+
+def test_rerun_skips_threads_that_have_not_changed(board):
+    board.add(1, 3)
+    board.add(2, 2, archived=True)
+    scrape(board)
+    assert scrape(board) == []
+    assert len(rows()) == 1 + 5
+
+def test_new_posts_get_appended_with_if_modified_since(board):
+    board.add(1, 3)
+    board.add(2, 2)
+    scrape(board)
+    board.add(1, 5, modified=2000)
+    requests = scrape(board)
+    # Only the bumped thread gets asked for, and only if it changed since what we have
+    assert requests == [(1, formatdate(1000, usegmt=True))]
+    lines = rows()
+    assert lines.count('text') == 1
+    assert lines[-2:] == board.posts(1)[3:]
+    assert len(lines) == 1 + 7
+    assert state()["1"]["last_post"] == 1004
+
+def test_not_modified_thread_writes_nothing(board):
+    board.add(1, 3)
+    scrape(board)
+    # The catalog says it was bumped but the thread itself hasn't changed
+    board.catalog_bumps[1] = 1500
+    assert scrape(board) == [(1, formatdate(1000, usegmt=True))]
+    assert len(rows()) == 1 + 3
+    assert state()["1"]["bumped"] == 1500
+
+def test_pruned_threads_are_forgotten(board):
+    board.add(1, 3)
+    board.add(2, 2)
+    scrape(board)
+    # Thread 2 is still in the catalog but 404s, thread 1 vanished from both lists
+    board.deleted.add(2)
+    board.catalog_bumps[2] = 2000
+    del board.threads[1]
+    scrape(board)
+    assert state() == {}
+    assert len(rows()) == 1 + 5
+
+def test_without_incremental_the_csv_starts_over(board, monkeypatch):
+    board.add(1, 3)
+    scrape(board)
+    monkeypatch.setattr(scraper, 'INCREMENTAL', False)
+    assert scrape(board) == [(1, None)]
+    assert rows() == ['text'] + board.posts(1)
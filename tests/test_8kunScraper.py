@@ -0,0 +1,89 @@
+import asyncio
+import csv
+import importlib
+
+import pytest
+from aiohttp import web
+
+scraper = importlib.import_module('8kunScraper')
+
+class FakeVichan:
+    """A stand-in for 8kun.top/b/, threads.json plus res/<id>.json."""
+    def __init__(self):
+        self.threads = {}  # no -> [comment HTML, ...]
+        self.statuses = {}  # no -> statuses res/<no>.json answers before the real thing
+        self.requests = []
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/b/threads.json', self.threads_json)
+        app.router.add_get('/b/res/{no}.json', self.thread_json)
+        return app
+
+    async def threads_json(self, request):
+        return web.json_response([{"page": 0, "threads": [{"no": no} for no in self.threads]}])
+
+    async def thread_json(self, request):
+        no = int(request.match_info['no'])
+        self.requests.append(no)
+        statuses = self.statuses.get(no)
+        if statuses:
+            return web.Response(status=statuses.pop(0))
+        if no not in self.threads:
+            return web.Response(status=404)
+        return web.json_response({"posts": [{"no": no * 100 + i, "com": com} for i, com in enumerate(self.threads[no])]})
+
+class BoardClientFast(scraper.BoardClient):
+    """The scraper's client with the retry backoff cut down so tests don't wait on it."""
+    def __init__(self, **kw):
+        super().__init__(backoff=0.01, **kw)
+
+@pytest.fixture
+def board(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, 'BOARD_NAME', 'b')
+    monkeypatch.setattr(scraper, 'OUTPUT_CSV', str(tmp_path / 'out.csv'))
+    monkeypatch.setattr(scraper, 'REQUESTS_PER_SECOND', 0)
+    monkeypatch.setattr(scraper, 'DEDUP', True)
+    monkeypatch.setattr(scraper, 'BASE_URL', None)
+    return FakeVichan()
+
+def scrape(board):
+    async def main():
+        runner = web.AppRunner(board.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        scraper.BASE_URL = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        try:
+            await scraper.scrape()
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(main())
+    with open(scraper.OUTPUT_CSV, 'r', newline='', encoding='utf-8') as f:
+        return [row[0] for row in csv.reader(f)]
+
+def test_scrapes_every_thread_in_the_catalog(board):
+    board.threads[1] = ['<span class="quote">&gt;&gt;5</span> first thread opening post', 'short']
+    board.threads[2] = ['second thread<br/>over two lines', 'visit http://example.com for more posts']
+    rows = scrape(board)
+    assert rows[0] == 'text'
+    assert sorted(rows[1:]) == ['first thread opening post', 'second thread over two lines', 'visit  for more posts']
+    assert sorted(board.requests) == [1, 2]
+
+def test_pruned_threads_are_skipped_and_errors_retried(board, monkeypatch):
+    board.threads[1] = ['this thread answers the second time']
+    board.threads[2] = ['this thread is fine all along']
+    board.threads[3] = ['this one gets pruned before we get to it']
+    board.statuses[1] = [503]
+    board.statuses[3] = [404]
+    monkeypatch.setattr(scraper, 'BoardClient', BoardClientFast)
+    rows = scrape(board)
+    assert sorted(rows[1:]) == ['this thread answers the second time', 'this thread is fine all along']
+    assert sorted(board.requests) == [1, 1, 2, 3]
+
+def test_copypasta_is_written_once(board):
+    board.threads[1] = ['the same copypasta everywhere', 'something else entirely']
+    board.threads[2] = ['the same  COPYPASTA everywhere']
+    rows = scrape(board)
+    assert len(rows) == 1 + 2
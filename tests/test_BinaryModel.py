@@ -0,0 +1,34 @@
+import markovify
+import pytest
+
+from BinaryModel import load_binary_model, write_binary_items, write_binary_model
+from CompactChain import CompactChain
+
+CORPUS = "the cat sat on the mat\nthe dog sat on the log\na cat and a dog\nthe cat ran"
+
+def _items(chain):
+    return sorted(chain.model.items())
+
+def _stats(items):
+    words = {w for state, (nxt, _) in items for w in state + tuple(nxt)}
+    return {"words": words, "states": len(items), "transitions": sum(len(nxt) for _, (nxt, _) in items),
+            "max_weight": max(weights[-1] for _, (_, weights) in items)}
+
+def test_streamed_binary_matches_compact_chain(tmp_path):
+    text = markovify.NewlineText(CORPUS, state_size=2, retain_original=False).compile()
+    items = _items(text.chain)
+    streamed, built = str(tmp_path / 'streamed.bin'), str(tmp_path / 'built.bin')
+    write_binary_items(streamed, 2, ((s, w, c) for s, (w, c) in items), **_stats(items))
+    write_binary_model(built, CompactChain.from_chain(text.chain))
+
+    a, b = load_binary_model(streamed), load_binary_model(built)
+    assert sorted(a.chain.items()) == sorted(b.chain.items())
+    assert a.make_sentence_with_start("the cat", strict=False, tries=50)
+
+def test_unsorted_states_are_refused(tmp_path):
+    text = markovify.NewlineText(CORPUS, state_size=2, retain_original=False).compile()
+    items = _items(text.chain)[::-1]
+    path = tmp_path / 'model.bin'
+    with pytest.raises(ValueError):
+        write_binary_items(str(path), 2, ((s, w, c) for s, (w, c) in items), **_stats(items))
+    assert not path.exists() and not (tmp_path / 'model.bin.tmp').exists()
@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from ImageboardFetcher import BoardClient, RateLimiter, comment_text, thread_ids
+
+class FakeHost:
+    """A stand-in board host, statuses[no] is what thread no answers before finally sending its JSON."""
+    def __init__(self, delays=None):
+        self.delays = delays or {}  # no -> seconds before answering
+        self.statuses = {}
+        self.arrivals = []  # (time.monotonic(), no) of every request
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/b/res/{no}.json', self.thread)
+        return app
+
+    async def thread(self, request):
+        no = int(request.match_info['no'])
+        self.arrivals.append((time.monotonic(), no))
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(no, 0))
+        finally:
+            self.in_flight -= 1
+        statuses = self.statuses.get(no)
+        if statuses:
+            return web.Response(status=statuses.pop(0))
+        return web.json_response({"posts": [{"no": no, "com": f"post in thread {no}"}]})
+
+def run(host, test, **kw):
+    """Runs test(client, base_url) with a BoardClient against the stand-in host."""
+    async def main():
+        runner = web.AppRunner(host.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        try:
+            async with BoardClient(**kw) as client:
+                return await test(client, f"http://127.0.0.1:{runner.addresses[0][1]}/b")
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+def gaps(arrivals):
+    return [b[0] - a[0] for a, b in zip(arrivals, arrivals[1:])]
+
+def test_rate_limiter_spaces_calls_apart():
+    async def main():
+        limiter = RateLimiter(20)
+        times = []
+        for _ in range(5):
+            await limiter.wait()
+            times.append(time.monotonic())
+        return times
+
+    times = asyncio.run(main())
+    assert all(gap >= 0.05 * 0.9 for gap in gaps([(t, None) for t in times]))
+
+def test_rate_limit_holds_with_many_requests_in_flight():
+    host = FakeHost()
+
+    async def test(client, base):
+        return [data async for _, data in client.iter_json(f"{base}/res/{no}.json" for no in range(10))]
+
+    results = run(host, test, per_second=20, concurrency=100)
+    assert len(results) == 10
+    arrivals = sorted(host.arrivals)
+    # Loose per gap since arrivals pick up some network jitter, the total can't cheat though
+    assert all(gap >= 0.05 * 0.5 for gap in gaps(arrivals))
+    assert arrivals[-1][0] - arrivals[0][0] >= 9 * 0.05 * 0.9
+
+def test_hundreds_of_requests_run_at_once():
+    host = FakeHost(delays={no: 0.3 for no in range(200)})
+
+    async def test(client, base):
+        start = time.monotonic()
+        results = [data async for _, data in client.iter_json(f"{base}/res/{no}.json" for no in range(200))]
+        return results, time.monotonic() - start
+
+    results, elapsed = run(host, test, per_second=0, concurrency=200)
+    assert len(results) == 200
+    assert host.most_in_flight >= 100
+    assert elapsed < 200 * 0.3 / 10
+
+def test_threads_are_handed_back_as_they_finish():
+    host = FakeHost(delays={1: 0.5, 2: 0})
+
+    async def test(client, base):
+        return [data["posts"][0]["no"] async for _, data in client.iter_json([f"{base}/res/1.json", f"{base}/res/2.json"])]
+
+    assert run(host, test, per_second=0) == [2, 1]
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_fetch_retries_with_backoff(status):
+    host = FakeHost()
+    host.statuses[1] = [status, status]
+
+    async def test(client, base):
+        return await client.fetch(f"{base}/res/1.json")
+
+    code, data, _ = run(host, test, per_second=0, retries=3, backoff=0.05)
+    assert code == 200 and data["posts"][0]["no"] == 1
+    first, second = gaps(host.arrivals)
+    # backoff * 2 ** (attempt - 1), times a random 1-2x so retries from many clients spread out
+    assert 0.05 <= first < 0.05 * 2 + 0.1
+    assert 0.1 <= second < 0.1 * 2 + 0.1
+
+def test_fetch_gives_up_after_the_last_retry():
+    host = FakeHost()
+    host.statuses[1] = [502] * 10
+
+    async def test(client, base):
+        with pytest.raises(IOError):
+            await client.fetch(f"{base}/res/1.json")
+        return client.failures
+
+    assert run(host, test, per_second=0, retries=2, backoff=0.01) == 1
+    assert len(host.arrivals) == 3
+
+def test_client_errors_are_not_retried():
+    host = FakeHost()
+    host.statuses[1] = [404]
+    host.statuses[2] = [403]
+
+    async def test(client, base):
+        missing = await client.get_json(f"{base}/res/1.json")
+        with pytest.raises(IOError):
+            await client.get_json(f"{base}/res/2.json")
+        return missing
+
+    assert run(host, test, per_second=0, backoff=0.01) is None
+    assert len(host.arrivals) == 2
+
+def test_iter_json_skips_pruned_and_failing_threads():
+    host = FakeHost()
+    host.statuses[1] = [404]
+    host.statuses[2] = [500] * 10
+
+    async def test(client, base):
+        return sorted([data["posts"][0]["no"] async for _, data in client.iter_json(f"{base}/res/{no}.json" for no in (1, 2, 3))])
+
+    assert run(host, test, per_second=0, retries=1, backoff=0.01) == [3]
+
+def test_thread_ids_and_comment_text():
+    catalog = [{"page": 1, "threads": [{"no": 5}, {"no": 7}]}, {"page": 2, "threads": [{"no": 9}]}]
+    assert thread_ids(catalog) == [5, 7, 9]
+    assert thread_ids(None) == []
+    assert comment_text('<a href="#p1">&gt;&gt;1</a><br>fair &amp; square') == ">>1\nfair & square"
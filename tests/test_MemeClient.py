@@ -0,0 +1,113 @@
+import asyncio
+import os
+from collections import Counter
+
+import pytest
+from aiohttp import web
+
+from MemeClient import MemeBlocked, MemeClient, MemeError
+
+IMAGE_SIZE = 400
+
+class FakeMemegen:
+    """A stand-in for api.memegen.link, statuses[path] is what it answers before finally sending a 200."""
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.statuses = {}
+        self.requests = Counter()  # path -> times asked
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/images/{template}/{top}/{bottom}', self.image)
+        return app
+
+    async def image(self, request):
+        path = request.path
+        self.requests[path] += 1
+        await asyncio.sleep(self.delay)
+        statuses = self.statuses.get(path)
+        if statuses:
+            return web.Response(status=statuses.pop(0))
+        return web.Response(body=path.encode('utf-8').ljust(IMAGE_SIZE, b'.'), content_type='image/png')
+
+def run(api, test, **kw):
+    """Runs test(client) with a MemeClient pointed at the fake API."""
+    async def main():
+        runner = web.AppRunner(api.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        memes = MemeClient(f"http://127.0.0.1:{runner.addresses[0][1]}", **kw)
+        try:
+            return await test(memes)
+        finally:
+            await memes.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'meme_cache')
+
+def test_retries_server_errors_with_backoff(cache_dir):
+    api = FakeMemegen()
+    api.statuses['/images/drake/top/bottom.png'] = [503, 429]
+    data = run(api, lambda memes: memes.render('drake', 'top', 'bottom'), cache_dir=cache_dir, backoff=0.01)
+    assert data.startswith(b'/images/drake/top/bottom.png')
+    assert api.requests['/images/drake/top/bottom.png'] == 3
+
+def test_gives_up_after_the_last_retry(cache_dir):
+    api = FakeMemegen()
+    api.statuses['/images/drake/top/bottom.png'] = [500] * 10
+    with pytest.raises(MemeError):
+        run(api, lambda memes: memes.render('drake', 'top', 'bottom'), cache_dir=cache_dir, retries=2, backoff=0.01)
+    assert api.requests['/images/drake/top/bottom.png'] == 3
+
+def test_forbidden_text_is_blocked_without_retrying(cache_dir):
+    api = FakeMemegen()
+    api.statuses['/images/drake/bad/words.png'] = [403]
+    with pytest.raises(MemeBlocked):
+        run(api, lambda memes: memes.render('drake', 'bad', 'words'), cache_dir=cache_dir, backoff=0.01)
+    assert api.requests['/images/drake/bad/words.png'] == 1
+
+def test_the_same_meme_in_flight_is_fetched_once(cache_dir):
+    api = FakeMemegen(delay=0.2)
+
+    async def test(memes):
+        return await asyncio.gather(*[memes.render('drake', 'top', 'bottom') for _ in range(5)])
+
+    results = run(api, test, cache_dir=cache_dir)
+    assert len(set(results)) == 1
+    assert api.requests['/images/drake/top/bottom.png'] == 1
+
+def test_rendered_memes_come_from_disk(cache_dir):
+    api = FakeMemegen()
+
+    async def test(memes):
+        first = await memes.render('drake', 'top', 'bottom')
+        second = await memes.render('drake', 'top', 'bottom')
+        return first, second, memes.hits, memes.misses
+
+    first, second, hits, misses = run(api, test, cache_dir=cache_dir)
+    assert first == second
+    assert (hits, misses) == (1, 1)
+    assert api.requests['/images/drake/top/bottom.png'] == 1
+
+def test_least_recently_used_images_get_evicted(cache_dir):
+    api = FakeMemegen()
+
+    async def test(memes):
+        await memes.render('drake', 'a', 'a')
+        await memes.render('drake', 'b', 'b')
+        # Make the order obvious no matter how coarse the filesystem's timestamps are
+        os.utime(memes._cache_path(memes.url_for('drake', 'a', 'a')), (100, 100))
+        os.utime(memes._cache_path(memes.url_for('drake', 'b', 'b')), (200, 200))
+        await memes.render('drake', 'a', 'a')  # Hit, a is now the most recently used
+        await memes.render('drake', 'c', 'c')  # Goes over the budget, b has to go
+        return {name: os.path.exists(memes._cache_path(memes.url_for('drake', name, name))) for name in 'abc'}
+
+    # Room for two images but not three
+    cached = run(api, test, cache_dir=cache_dir, cache_size_mb=IMAGE_SIZE * 2.5 / 1024 / 1024)
+    assert cached == {'a': True, 'b': False, 'c': True}
+    assert api.requests['/images/drake/a/a.png'] == 1
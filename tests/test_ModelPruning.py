@@ -0,0 +1,48 @@
+from itertools import islice
+
+import markovify
+import pytest
+from markovify.chain import BEGIN, END
+
+from ModelPruning import _prune, prune_model
+
+# A kek after a kek is the only transition seen twice, every way out of the loop is seen once
+LOOP = ["a kek kek kek kek bone", "a kek kek kek btwo"]
+
+def _text(corpus):
+    return markovify.NewlineText("\n".join(corpus), state_size=2, retain_original=False).compile()
+
+def _finishes(chain, steps=100):
+    return len(list(islice(chain.walk(), steps))) < steps
+
+def test_prune_refuses_a_model_where_nothing_reaches_end():
+    text = _text(LOOP)
+    with pytest.raises(ValueError):
+        _prune(text.chain.model, 2, min_count=2, max_fanout=None)
+
+def test_prune_drops_states_that_cant_reach_end():
+    text = _text(LOOP + ["a b c", "a b c"])
+    report = prune_model(text, min_count=2, samples=20)
+    model = text.chain.model
+    assert ("kek", "kek") not in model
+    assert ("a", "kek") not in model
+    assert "kek" not in model[(BEGIN, "a")][0]
+    assert END in model[("b", "c")][0]
+    assert report["success_after"][0] == 1.0
+    for _ in range(50):
+        assert _finishes(text.chain)
+
+def test_budget_that_cant_be_met_keeps_a_working_model():
+    text = _text(LOOP + ["a b c", "a b c", "a b d"])
+    report = prune_model(text, size_budget_mb=0.000001, samples=20)
+    assert not report["budget_met"]
+    assert report["min_count"] == 2
+    assert (BEGIN, BEGIN) in text.chain.model
+    assert text.make_sentence(test_output=False) == "a b c"
+
+def test_min_count_that_prunes_everything_leaves_the_model_alone():
+    text = _text(LOOP)
+    states = len(text.chain.model)
+    report = prune_model(text, min_count=2, samples=20)
+    assert report["min_count"] == 1
+    assert len(text.chain.model) == states
@@ -0,0 +1,32 @@
+import csv
+
+from TrainingEngine import CsvSource
+
+def _source(tmp_path, data):
+    path = tmp_path / 'dump.csv'
+    path.write_bytes(data.encode('utf-8'))
+    return CsvSource(str(path), 'text', None)
+
+def test_last_row_without_a_newline_is_read(tmp_path):
+    source = _source(tmp_path, 'text\r\nfirst row\r\n"second, quoted\nover two lines"\r\nlast row')
+    with open(source.path, 'r', encoding='utf-8') as f:
+        expected = [row['text'] for row in csv.DictReader(f)]
+    assert list(source.read()) == expected == ['first row', 'second, quoted\nover two lines', 'last row']
+
+def test_delta_holds_back_a_half_written_row(tmp_path):
+    source = _source(tmp_path, 'text\nfirst row\nstill being writ')
+    mark = source.new_mark()
+    assert list(source.read(mark)) == ['first row']
+    with open(source.path, 'a', encoding='utf-8', newline='') as f:
+        f.write('ten\nnext row\n')
+    assert list(source.read(mark)) == ['still being written', 'next row']
+    assert mark['rows'] == 3
+
+def test_lone_carriage_returns(tmp_path):
+    source = _source(tmp_path, 'text\rfirst row\rsecond row\r')
+    assert list(source.read()) == ['first row', 'second row']
+    mark = source.new_mark()
+    assert list(source.read(mark)) == ['first row', 'second row']
+    with open(source.path, 'a', encoding='utf-8', newline='') as f:
+        f.write('third row\r')
+    assert list(source.read(mark)) == ['third row']